@@ -6,4 +6,27 @@ verbose = True
 # Sets the welcome caption that displays when you start the game.
 welcome_caption = ''
 
+# Maximum size (in megabytes) of the generated maze cache, both in memory and
+# on disk (in the cache/ folder). Set the disk size to 0 to disable the disk cache.
+maze_cache_memory_size = 64
+maze_cache_disk_size = 256
+
+# Mazes with at least this many tiles are generated in the background, with a progress
+# bar and a cancel button. Smaller mazes are generated instantly.
+background_generation_threshold = 250000
+
+# Mazes with at least this many tiles are split into regions that are generated in
+# parallel, using all CPU cores. Set this to 0 to disable parallel generation.
+parallel_generation_threshold = 4000000
+
+# When tiles are drawn smaller than this (in pixels), mazes are drawn as one scaled
+# picture with a pixel per tile and wall, instead of line by line. Set this to 0 to
+# always draw walls as lines.
+lod_tile_size = 6
+
+# Chunked levels can't be zoomed out further than this tile size (in pixels), since
+# every chunk of the maze in view has to be generated when it first comes into view.
+# This is never smaller than lod_tile_size.
+chunked_min_tile_size = 16
+
 ### END CONFIGURATION
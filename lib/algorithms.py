@@ -0,0 +1,503 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Maze generation algorithms for TrulyAmazed.
+
+Every algorithm is a function taking (grid, rng, start_point, progress): it
+carves a perfect maze (exactly one path between any two points) into the empty
+MazeGrid given, using the random.Random instance given as its only source of
+randomness. If progress is given, it is called every so often with the amount
+of points carved so far and the total; it may raise an exception to abort.
+In the complexity notes below, n is the amount of points in the maze and w is
+the maze width.
+"""
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional: the vectorized algorithms fall back to plain loops.
+    numpy = None
+
+from .mazegrid import NORTH, WEST, SOUTH, EAST, bit_offsets, opposite_bits
+
+# How many random numbers to draw from the PRNG at once while generating.
+RANDOM_BATCH_SIZE = 4096
+
+# Roughly how many points to carve between progress reports.
+PROGRESS_INTERVAL = 4096
+
+# Roughly how many points the NumPy versions of algorithms carve in one go. They
+# report progress in between.
+NUMPY_BLOCK_SIZE = 1 << 20
+
+# Maps algorithm names (as used in level data) to their functions.
+algorithms = {}
+
+def algorithm(name, title):
+    """Decorator registering a maze generation algorithm under the given name."""
+    def wrapper(func):
+        func.title = title
+        algorithms[name] = func
+        return func
+    return wrapper
+
+def _neighbours(index, width, height):
+    """Returns (bit, neighbour index) pairs for all in-bounds neighbours of the index given."""
+    x, y = index % width, index // width
+    result = []
+    if y > 0:
+        result.append((NORTH, index - width))
+    if x > 0:
+        result.append((WEST, index - 1))
+    if y < height - 1:
+        result.append((SOUTH, index + width))
+    if x < width - 1:
+        result.append((EAST, index + 1))
+    return result
+
+@algorithm('depth_first', 'Depth-first search')
+def depth_first(grid, rng, start_point=(0, 0), progress=None):
+    """
+    Iterative depth-first search (recursive backtracker). Produces long, twisty
+    corridors with few dead ends.
+
+    Time: O(n). Memory: O(n) for the visited bitmap, plus a stack that can hold
+    nearly every point in the worst case.
+    """
+    width, height = grid.width, grid.height
+    cells = grid.cells
+
+    # The visited bitmap is padded with a border of already visited points, so
+    # that neighbours can be found by adding precomputed offsets without any
+    # bounds checking.
+    padded_width = width + 2
+    visited = bytearray(b'\x01') * (padded_width * (height + 2))
+    for y in range(1, height + 1):
+        rowstart = y * padded_width + 1
+        visited[rowstart:rowstart+width] = bytes(width)
+
+    # For each direction: (path bit, opposite path bit, offset in the padded
+    # visited bitmap, offset in the grid's cells)
+    neighbours = tuple((bit, opposite_bits[bit], yoffset*padded_width + xoffset, yoffset*width + xoffset)
+                       for bit, (xoffset, yoffset) in bit_offsets.items())
+
+    # Draw random numbers in batches, which is a lot cheaper than calling
+    # random.choice() on every step.
+    rand = rng.random
+    batch = []
+    batch_pos = RANDOM_BATCH_SIZE
+    carved = 0
+    total = width * height
+
+    x, y = start_point
+    current = (y + 1) * padded_width + x + 1
+    current_cell = y * width + x
+    visited[current] = 1
+
+    # Keep track of which points we've visited, both as padded and grid
+    # indices. When we reach a point that no longer has any valid directions
+    # to go in, we return to the point last visited before that.
+    stack = [current]
+    cell_stack = [current_cell]
+    options = []
+
+    while stack:
+        current = stack[-1]
+        current_cell = cell_stack[-1]
+
+        options.clear()
+        for neighbour in neighbours:
+            if not visited[current + neighbour[2]]:
+                options.append(neighbour)
+
+        if not options:
+            # If there are no valid directions to go in (i.e. a dead end)
+            # we should move back to the last point in the stack.
+            stack.pop()
+            cell_stack.pop()
+            continue
+
+        if batch_pos == RANDOM_BATCH_SIZE:
+            # Every random number drawn carves one point, so this is also a good
+            # time to report progress.
+            if progress is not None:
+                progress(carved, total)
+            batch = [rand() for _ in range(RANDOM_BATCH_SIZE)]
+            batch_pos = 0
+            carved += RANDOM_BATCH_SIZE
+        bit, opposite_bit, offset, cell_offset = options[int(batch[batch_pos] * len(options))]
+        batch_pos += 1
+
+        # Open up the walls between the current point and the next one, on
+        # both sides.
+        new = current + offset
+        new_cell = current_cell + cell_offset
+        cells[current_cell] |= bit
+        cells[new_cell] = opposite_bit
+        visited[new] = 1
+
+        stack.append(new)
+        cell_stack.append(new_cell)
+
+@algorithm('kruskal', "Kruskal's algorithm")
+def kruskal(grid, rng, start_point=None, progress=None):
+    """
+    Randomized Kruskal's algorithm, using a union-find (disjoint set) structure.
+    Produces lots of short dead ends.
+
+    Time: O(n log n) for shuffling the edge list, plus O(n α(n)) for the
+    union-find operations. Memory: O(n) for the edge list and parent table.
+    """
+    width, height = grid.width, grid.height
+    cells = grid.cells
+    size = width * height
+
+    # Edges are encoded as index*2 (the wall east of the point) and
+    # index*2+1 (the wall south of the point).
+    edges = [index*2 for index in range(size) if index % width != width - 1]
+    edges += [index*2+1 for index in range(size - width)]
+    rng.shuffle(edges)
+
+    parent = list(range(size))
+    remaining = size - 1
+
+    for edge in edges:
+        if not remaining:
+            break
+        index = edge >> 1
+        if edge & 1:
+            other, bit, other_bit = index + width, SOUTH, NORTH
+        else:
+            other, bit, other_bit = index + 1, EAST, WEST
+
+        # Find the root of both points' sets, using path halving.
+        root = index
+        while parent[root] != root:
+            parent[root] = parent[parent[root]]
+            root = parent[root]
+        other_root = other
+        while parent[other_root] != other_root:
+            parent[other_root] = parent[parent[other_root]]
+            other_root = parent[other_root]
+
+        if root != other_root:
+            # The two points aren't connected yet: remove the wall and merge the sets.
+            parent[other_root] = root
+            cells[index] |= bit
+            cells[other] |= other_bit
+            remaining -= 1
+
+            if progress is not None and not remaining % PROGRESS_INTERVAL:
+                progress(size - remaining, size)
+
+@algorithm('prim', "Prim's algorithm")
+def prim(grid, rng, start_point=(0, 0), progress=None):
+    """
+    Randomized Prim's algorithm (frontier variant). Grows the maze outwards from
+    the start point, producing many short, branching corridors.
+
+    Time: O(n). Memory: O(n) for the maze and frontier bitmaps and the frontier list.
+    """
+    width, height = grid.width, grid.height
+    cells = grid.cells
+    rand = rng.random
+
+    in_maze = bytearray(width * height)
+    in_frontier = bytearray(width * height)
+    frontier = []
+
+    def add_frontier(index):
+        for _, neighbour in _neighbours(index, width, height):
+            if not (in_maze[neighbour] or in_frontier[neighbour]):
+                in_frontier[neighbour] = 1
+                frontier.append(neighbour)
+
+    start = grid.index(*start_point)
+    in_maze[start] = 1
+    add_frontier(start)
+    carved = 1
+
+    while frontier:
+        # Pick a random frontier point and remove it from the list by swapping
+        # it with the last element, which is O(1).
+        pos = int(rand() * len(frontier))
+        index = frontier[pos]
+        frontier[pos] = frontier[-1]
+        frontier.pop()
+
+        # Connect it to a random neighbour that is already part of the maze.
+        options = [option for option in _neighbours(index, width, height) if in_maze[option[1]]]
+        bit, neighbour = options[int(rand() * len(options))]
+        cells[index] |= bit
+        cells[neighbour] |= opposite_bits[bit]
+
+        in_maze[index] = 1
+        add_frontier(index)
+
+        carved += 1
+        if progress is not None and not carved % PROGRESS_INTERVAL:
+            progress(carved, width * height)
+
+@algorithm('wilson', "Wilson's algorithm")
+def wilson(grid, rng, start_point=(0, 0), progress=None):
+    """
+    Wilson's algorithm (loop-erased random walks). Picks uniformly among all
+    possible mazes, so it has no directional bias.
+
+    Time: O(n) expected per walk step, but the first walks can be very long:
+    the total is bounded by the mean hitting time of the grid, which makes
+    this the slowest algorithm on large mazes. Memory: O(n) for the maze bitmap
+    and the walk direction table.
+    """
+    width, height = grid.width, grid.height
+    cells = grid.cells
+    rand = rng.random
+
+    in_maze = bytearray(width * height)
+    in_maze[grid.index(*start_point)] = 1
+
+    # Stores the direction last taken out of each point during a walk. Since only
+    # the last exit is remembered, loops are erased automatically.
+    walk_direction = bytearray(width * height)
+
+    for start in range(width * height):
+        if progress is not None and not start % PROGRESS_INTERVAL:
+            # Every point before this one has been added to the maze by now.
+            progress(start, width * height)
+
+        if in_maze[start]:
+            continue
+
+        # Randomly walk until we hit a point that is already part of the maze.
+        index = start
+        while not in_maze[index]:
+            options = _neighbours(index, width, height)
+            bit, neighbour = options[int(rand() * len(options))]
+            walk_direction[index] = bit
+            index = neighbour
+
+        # Then, retrace the (loop-erased) walk and add it to the maze.
+        index = start
+        while not in_maze[index]:
+            bit = walk_direction[index]
+            xoffset, yoffset = bit_offsets[bit]
+            neighbour = index + yoffset*width + xoffset
+            cells[index] |= bit
+            cells[neighbour] |= opposite_bits[bit]
+            in_maze[index] = 1
+            index = neighbour
+
+def eller_rows(width, height, rng):
+    """
+    Generates a maze using Eller's algorithm, yielding each finished row as a
+    bytearray of path bits. Only the current row is kept in memory.
+
+    If height is None, rows are generated forever. Since such a maze never gets
+    a last row to join everything together, any prefix of it is free of loops
+    but may have sections that only connect further down.
+    """
+    rand = rng.random
+
+    # Set IDs for each column of the current row. Points in the same set are
+    # already connected to each other.
+    sets = list(range(width))
+    next_set = width
+    north_paths = ()
+
+    for y in (itertools.count() if height is None else range(height)):
+        row = bytearray(width)
+        for x in north_paths:
+            row[x] = NORTH
+
+        last_row = (height is not None and y == height - 1)
+
+        # Keep track of the members of each set, so that sets can be merged by
+        # relabeling only the smaller one.
+        members = {}
+        for x, setid in enumerate(sets):
+            members.setdefault(setid, []).append(x)
+
+        # Randomly join adjacent points that aren't in the same set yet. On the
+        # last row, everything must be joined so that the maze is connected.
+        for x in range(width - 1):
+            setid, other_setid = sets[x], sets[x+1]
+            if setid != other_setid and (last_row or rand() < 0.5):
+                row[x] |= EAST
+                row[x+1] |= WEST
+
+                if len(members[setid]) < len(members[other_setid]):
+                    setid, other_setid = other_setid, setid
+                for member in members.pop(other_setid):
+                    sets[member] = setid
+                    members[setid].append(member)
+
+        if not last_row:
+            # Every set needs at least one path downwards, so that it stays
+            # connected to the rest of the maze.
+            new_sets = [None] * width
+            north_paths = []
+            for setid, columns in members.items():
+                chosen = [x for x in columns if rand() < 0.5] or [columns[int(rand() * len(columns))]]
+                for x in chosen:
+                    row[x] |= SOUTH
+                    new_sets[x] = setid
+                    north_paths.append(x)
+
+            # Points without a path from above start off in their own sets.
+            for x in range(width):
+                if new_sets[x] is None:
+                    new_sets[x] = next_set
+                    next_set += 1
+            sets = new_sets
+
+        yield row
+
+@algorithm('eller', "Eller's algorithm")
+def eller(grid, rng, start_point=None, progress=None):
+    """
+    Eller's algorithm, which builds the maze one row at a time.
+
+    Time: O(n) (O(w log w) per row for merging sets). Memory: O(w) on top of the
+    grid itself.
+    """
+    width, height = grid.width, grid.height
+    for y, row in enumerate(eller_rows(width, height, rng)):
+        grid.cells[y*width:(y+1)*width] = row
+
+        if progress is not None and not y % 64:
+            progress(y * width, width * height)
+
+@algorithm('binary_tree', 'Binary tree')
+def binary_tree(grid, rng, start_point=None, progress=None):
+    """
+    Binary tree algorithm: every point opens a path either north or east. Very
+    fast, but has a strong diagonal bias and two long open corridors along the
+    top and right edges. Vectorized using NumPy when it is available.
+
+    Time: O(n). Memory: O(1) on top of the grid (O(n) for the random numbers
+    when using NumPy).
+    """
+    width, height = grid.width, grid.height
+
+    if numpy is not None:
+        cells = numpy.frombuffer(grid.cells, dtype=numpy.uint8).reshape(height, width)
+        nprng = numpy.random.default_rng(rng.getrandbits(64))
+
+        # Carve a block of rows at a time, so that progress can be reported.
+        rows = max(1, NUMPY_BLOCK_SIZE // width)
+        for top in range(0, height, rows):
+            if progress is not None:
+                progress(top * width, width * height)
+            bottom = min(height, top + rows)
+            block = cells[top:bottom]
+
+            north = nprng.random((bottom - top, width)) < 0.5
+            # The top row can only go east, and the right column can only go north.
+            if top == 0:
+                north[0, :] = False
+            north[1 if top == 0 else 0:, -1] = True
+            east = ~north
+            east[:, -1] = False
+
+            block[north] |= NORTH
+            # The paths north end in the row above, which may be in the last block.
+            cells[max(0, top - 1):bottom - 1][north[1 if top == 0 else 0:]] |= SOUTH
+            block[east] |= EAST
+            block[:, 1:][east[:, :-1]] |= WEST
+        return
+
+    rand = rng.random
+    for y in range(height):
+        if progress is not None and not y % 64:
+            progress(y * width, width * height)
+
+        for x in range(width):
+            if y == 0 and x == width - 1:
+                # The top right corner has nowhere to go.
+                continue
+            elif y > 0 and (x == width - 1 or rand() < 0.5):
+                grid.carve(x, y, NORTH)
+            else:
+                grid.carve(x, y, EAST)
+
+@algorithm('sidewinder', 'Sidewinder')
+def sidewinder(grid, rng, start_point=None, progress=None):
+    """
+    Sidewinder algorithm: each row is split into random horizontal runs, and
+    every run opens one path north. Has a long corridor along the top row and
+    a slight vertical bias. Vectorized using NumPy when it is available.
+
+    Time: O(n). Memory: O(w) on top of the grid (O(n) when using NumPy).
+    """
+    width, height = grid.width, grid.height
+
+    if numpy is not None:
+        cells = numpy.frombuffer(grid.cells, dtype=numpy.uint8).reshape(height, width)
+        nprng = numpy.random.default_rng(rng.getrandbits(64))
+
+        # The top row is one long corridor.
+        cells[0, :-1] |= EAST
+        cells[0, 1:] |= WEST
+        if height == 1:
+            return
+
+        # The other rows are carved a block of rows at a time, so that progress can
+        # be reported. Runs never cross rows, so blocks don't affect each other.
+        flat = cells.reshape(-1)
+        rows = max(1, NUMPY_BLOCK_SIZE // width)
+        for top in range(1, height, rows):
+            if progress is not None:
+                progress(top * width, width * height)
+            bottom = min(height, top + rows)
+            block = cells[top:bottom]
+
+            # Randomly decide whether to continue each run east. Runs are always
+            # closed at the end of a row.
+            east = nprng.random((bottom - top, width)) < 0.5
+            east[:, -1] = False
+            block[:, :-1][east[:, :-1]] |= EAST
+            block[:, 1:][east[:, :-1]] |= WEST
+
+            # Find the start and end of every run (in flat indices within the
+            # block), then pick one random point from each run to open north.
+            ends = numpy.flatnonzero(~east)
+            starts = numpy.concatenate(([0], ends[:-1] + 1))
+            chosen = starts + (nprng.random(len(ends)) * (ends - starts + 1)).astype(numpy.intp)
+
+            chosen += top * width
+            flat[chosen] |= NORTH
+            flat[chosen - width] |= SOUTH
+        return
+
+    rand = rng.random
+    for x in range(width - 1):
+        grid.carve(x, 0, EAST)
+
+    for y in range(1, height):
+        if progress is not None and not y % 64:
+            progress(y * width, width * height)
+
+        run_start = 0
+        for x in range(width):
+            if x < width - 1 and rand() < 0.5:
+                grid.carve(x, y, EAST)
+            else:
+                # Close off the run, and open a path north from a random point in it.
+                north_x = run_start + int(rand() * (x - run_start + 1))
+                grid.carve(north_x, y, NORTH)
+                run_start = x + 1
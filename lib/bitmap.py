@@ -0,0 +1,112 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Maze bitmaps for TrulyAmazed, used to draw mazes that are zoomed far out.
+
+A maze bitmap has one pixel per point, plus one pixel for each wall (or gap)
+between points: point (x, y) is pixel (2x+1, 2y+1), the side between it and
+its east neighbour is pixel (2x+2, 2y+1), and so on. A w*h maze becomes a
+(2w+1)*(2h+1) picture, which can be drawn scaled in one go.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .mazegrid import SOUTH, EAST, _bit_tables
+from .util import *
+
+# Pixel values, meant to be used as indices into a colour table.
+WALL = 0
+PATH = 1
+START = 2
+FINISH = 3
+
+class MazeBitmap():
+    """
+    Bitmap of (part of) a maze. pixels holds height rows of stride bytes each, of
+    which the first width are used; rows are padded to a multiple of 4 bytes, as
+    QImage expects.
+    """
+
+    def __init__(self, pixels, width, height, stride, area, step):
+        self.pixels = pixels
+        self.width = width
+        self.height = height
+        self.stride = stride
+        # Area of the maze (left, top, right, bottom) in the bitmap, and the
+        # amount of points each pixel stands for in each direction.
+        self.area = area
+        self.step = step
+
+    def __repr__(self):
+        return 'MazeBitmap(%sx%s of area %s)' % (self.width, self.height, self.area)
+
+    def __getitem__(self, position):
+        x, y = position
+        return self.pixels[y * self.stride + x]
+
+def maze_bitmap(grid, area=None, step=1):
+    """
+    Returns a MazeBitmap of the given maze grid, or of an area (left, top, right,
+    bottom) of it.
+
+    With a step larger than 1, only every step-th point in each direction is
+    drawn, with its own walls. This gives a rough but cheap overview (e.g. for a
+    minimap) of mazes that have far more points than pixels available.
+    """
+    left, top, right, bottom = area or (0, 0, grid.width, grid.height)
+    left, top = max(0, left), max(0, top)
+    right, bottom = min(grid.width, right), min(grid.height, bottom)
+    columns = len(range(left, right, step))
+    rows = len(range(top, bottom, step))
+
+    width, height = 2 * columns + 1, 2 * rows + 1
+    # Pad each row to a multiple of 4 bytes.
+    stride = (width + 3) // 4 * 4
+
+    # Only the rows in the area are needed; row y - top is the first row in them.
+    source = grid.row_cells(top, bottom)
+    if numpy is not None:
+        cells = numpy.frombuffer(source, dtype=numpy.uint8).reshape(bottom - top, grid.width)
+        cells = cells[::step, left:right:step]
+        pixels = numpy.zeros((height, stride), dtype=numpy.uint8)
+        pixels[1:height:2, 1:width:2] = PATH
+        pixels[1:height:2, 2:width:2] = (cells & EAST) != 0
+        pixels[2:height:2, 1:width:2] = (cells & SOUTH) != 0
+        # This is a view of the same memory, not a copy.
+        pixels = pixels.reshape(-1)
+    else:
+        pixels = bytearray(height * stride)
+        points = bytes([PATH]) * columns
+        for row, y in enumerate(range(0, bottom - top, step)):
+            cells = source[y*grid.width+left:y*grid.width+right:step]
+            offset = (2 * row + 1) * stride
+            pixels[offset+1:offset+width:2] = points
+            pixels[offset+2:offset+width:2] = cells.translate(_bit_tables[EAST])
+            offset += stride
+            pixels[offset+1:offset+width:2] = cells.translate(_bit_tables[SOUTH])
+
+    # Colour in the start and finish, if they're in the bitmap.
+    for point, value in ((grid.start, START), (grid.finish, FINISH)):
+        if point:
+            x, y = point
+            if left <= x < right and top <= y < bottom and not (x - left) % step and not (y - top) % step:
+                pixels[(2 * ((y - top) // step) + 1) * stride + 2 * ((x - left) // step) + 1] = value
+
+    return MazeBitmap(pixels, width, height, stride, (left, top, right, bottom), step)
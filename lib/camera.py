@@ -0,0 +1,146 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Camera (zoom and scrolling) for the maze display of TrulyAmazed.
+
+Positions on the maze picture are measured in "maze pixels": the centre of point
+(x, y) is at ((x+1) * tile size, (y+1) * tile size), leaving half a tile of
+border around the maze. The camera shows the part of the maze picture starting
+at maze pixel (camera.x, camera.y), as big as the display.
+"""
+
+from .util import *
+
+# Tiles are never drawn smaller than this. Mazes that don't fit the display at
+# this size are scrolled instead.
+MIN_TILE_SIZE = 2
+# Tiles are never zoomed in further than this.
+MAX_TILE_SIZE = 128
+
+class Camera():
+    """
+    Zoom level and scroll position of the maze display.
+    """
+
+    def __init__(self):
+        # Tile size chosen by zooming, or None to fit the whole maze in the display.
+        self.zoom = None
+        # Maze pixel shown in the top left corner of the display.
+        self.x = 0
+        self.y = 0
+        # Whether to keep the player in the middle of the display.
+        self.follow = True
+        # Smallest tile size to draw with. Mazes that need more than the minimum can
+        # raise this (e.g. chunked ones, whose chunks in view are generated on demand).
+        self.min_tile_size = MIN_TILE_SIZE
+
+        # Tile size in use, and the display and maze sizes it was worked out for
+        # (see update()).
+        self.tile_size = 0
+        self.view_width = 0
+        self.view_height = 0
+        self.maze_width = 0
+        self.maze_height = 0
+
+    def __repr__(self):
+        return 'Camera(tile size %s at (%s, %s))' % (self.tile_size, self.x, self.y)
+
+    def fit_tile_size(self):
+        """Returns the (even) tile size that fits the whole maze in the display."""
+        return int(round_down_to_even(min(self.view_width / (self.maze_width + 1),
+                                          self.view_height / (self.maze_height + 1))))
+
+    def update(self, view_width, view_height, maze_width, maze_height):
+        """
+        Updates the camera for the given display and maze sizes, and returns the
+        tile size to draw with.
+        """
+        self.view_width, self.view_height = view_width, view_height
+        self.maze_width, self.maze_height = maze_width, maze_height
+
+        fit = self.fit_tile_size()
+        if self.zoom is not None and self.zoom <= fit:
+            # Zoomed out far enough to see everything: go back to fitting the maze.
+            self.zoom = None
+        # If the maze doesn't fit even at the smallest tile size, show part of it
+        # and scroll instead.
+        self.tile_size = max(self.min_tile_size, self.zoom or fit)
+        self._clamp()
+        return self.tile_size
+
+    @property
+    def scrolling(self):
+        """Returns whether only part of the maze is in view."""
+        return (self.maze_width + 1) * self.tile_size > self.view_width or \
+               (self.maze_height + 1) * self.tile_size > self.view_height
+
+    def _clamp(self):
+        """Keeps the view within the maze picture, at whole pixels."""
+        self.x = max(0, min(round(self.x), (self.maze_width + 1) * self.tile_size - self.view_width))
+        self.y = max(0, min(round(self.y), (self.maze_height + 1) * self.tile_size - self.view_height))
+
+    def zoom_by(self, factor, anchor_x, anchor_y):
+        """
+        Zooms in (factor > 1) or out (factor < 1), keeping the maze pixel under the
+        given display position (e.g. the mouse) in place.
+        """
+        old = self.tile_size
+        if not old:
+            return
+        new = int(round_down_to_even(old * factor))
+        # Always change the tile size by at least one step.
+        if factor > 1:
+            new = max(new, old + 2)
+        else:
+            new = min(new, old - 2)
+        new = max(self.min_tile_size, min(MAX_TILE_SIZE, new))
+
+        # The maze point under the anchor stays under the anchor.
+        self.x = (self.x + anchor_x) * new / old - anchor_x
+        self.y = (self.y + anchor_y) * new / old - anchor_y
+        self.zoom = new
+        self.update(self.view_width, self.view_height, self.maze_width, self.maze_height)
+
+    def scroll_by(self, dx, dy):
+        """Scrolls the view by the given amount of display pixels."""
+        self.x += dx
+        self.y += dy
+        self._clamp()
+
+    def center_on(self, x, y):
+        """Centres the view on the given maze point (as far as possible)."""
+        self.x = (x + 1) * self.tile_size - self.view_width / 2
+        self.y = (y + 1) * self.tile_size - self.view_height / 2
+        self._clamp()
+
+    def visible_area(self):
+        """
+        Returns the (left, top, right, bottom) area of maze points in view, with
+        right and bottom being exclusive.
+        """
+        size = self.tile_size
+        # Point x covers maze pixels (x + 1/2) * size to (x + 3/2) * size.
+        left = max(0, int((self.x - size / 2) // size))
+        top = max(0, int((self.y - size / 2) // size))
+        right = min(self.maze_width, int((self.x + self.view_width - size / 2) // size) + 1)
+        bottom = min(self.maze_height, int((self.y + self.view_height - size / 2) // size) + 1)
+        return (left, top, right, bottom)
+
+    def to_grid(self, x, y):
+        """Returns the maze point under the given display position."""
+        size = self.tile_size
+        return (int((self.x + x - size / 2) // size), int((self.y + y - size / 2) // size))
@@ -16,12 +16,11 @@
 
 """Sprites module for TrulyAmazed."""
 
-import random
-
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
+from . import entities
 from .util import *
 
 # All of these Qt.Key_XYZ values are pre-defined; see
@@ -44,8 +43,25 @@ class Sprite():
         # Defines a list of types that the object CAN'T collide with.
         self.collision_blacklist = []
 
+        # Task running this sprite on the game loop, if any (see schedule()).
+        self.task = None
+
         self.reset_coords(x, y)
 
+    def schedule(self, callback, interval):
+        """
+        Runs the given callback on the game loop every interval milliseconds
+        (rounded to whole ticks), until the sprite is stopped.
+        """
+        loop = self.game.loop
+        self.task = loop.add(callback, loop.ticks_for(interval))
+
+    def stop(self):
+        """Stops running this sprite on the game loop."""
+        if self.task is not None:
+            self.game.loop.remove(self.task)
+            self.task = None
+
     def reset_coords(self, x=None, y=None):
         """
         Resets the sprite's coords to match the maze's
@@ -54,30 +70,35 @@ class Sprite():
         # Stores the character's initial x and y positions, relative
         # to the grid, along with the grid boundaries. If not defined,
         # this will be equal to the maze's starting point.
+        if x is None:
+            x = self.game.mg.start.x
+        if y is None:
+            y = self.game.mg.start.y
+
         self.x = x
         self.y = y
 
-        if self.x is None:
-            self.x = self.game.mg.start.x
-        if self.y is None:
-            self.y = self.game.mg.start.y
-
         # Save the boundaries of the moving area too.
         self.max_x = self.game.mazewidth
         self.max_y = self.game.mazeheight
 
+        # Keep the game's sprite index up to date, if we're in it.
+        self.game.sprites.move(self)
+
     def check_collision(self):
         """
         Checks collisions with other objects in game, and returns the amount of items
         collided with.
         """
         hit = 0
-        for obj in self.game.sprites:
+        # Only the sprites on the same point are looked at, using the game's
+        # sprite index.
+        for obj in self.game.sprites.at(self.x, self.y):
             if obj == self or obj.__class__ in self.collision_blacklist:
                 # Don't allow objects to collide with themselves, or anything on
                 # their collision blacklist.
                 continue
-            if obj.x == self.x and obj.y == self.y and hasattr(obj, 'hit'):
+            if hasattr(obj, 'hit'):
                 debug_print("check_collision: Calling hit() on %s (%s, %s)" % (obj, self.x, self.y))
                 # Call the hit() function defined in the other object,
                 # but only if it is defined.
@@ -170,7 +191,8 @@ class Sprite():
             elif direc == 'east':
                 self.x += 1
             debug_print("Moved to (%s, %s)" % (self.x, self.y))
-            self.game.display.update()
+            self.game.sprites.move(self)
+            self.game.request_repaint()
             return True
         return False
 
@@ -178,8 +200,42 @@ class Sprite():
         """
         Removes the current object from the sprites object.
         """
+        self.stop()
         self.game.sprites.remove(self)
-        self.game.display.update()
+        self.game.request_repaint()
+
+class EntitySprite(Sprite):
+    """
+    Sprite whose position is kept in the game's entity store (see lib.entities),
+    instead of on the sprite itself. These sprites are thin views over their slot
+    in the store, so that large amounts of them can be moved in one go.
+    """
+    # Entity type of this sprite in the store.
+    kind = None
+
+    def __init__(self, game, x=None, y=None, color='#654678'):
+        self.slot = game.entities.add(self.kind, 0, 0, owner=self)
+        super().__init__(game, x, y, color)
+
+    @property
+    def x(self):
+        return int(self.game.entities.xs[self.slot])
+
+    @x.setter
+    def x(self, value):
+        self.game.entities.xs[self.slot] = value
+
+    @property
+    def y(self):
+        return int(self.game.entities.ys[self.slot])
+
+    @y.setter
+    def y(self, value):
+        self.game.entities.ys[self.slot] = value
+
+    def remove(self):
+        super().remove()
+        self.game.entities.remove(self.slot)
 
 class PlayerCharacter(Sprite):
     """
@@ -208,7 +264,7 @@ class PlayerCharacter(Sprite):
         if self.game.fuel > gunshot_fuel:
             # Only allow shooting if we have enough fuel.
             self.game.update_fuel(-gunshot_fuel)
-            self.game.sprites.append(Laser(self.game, self.facing, self.x, self.y))
+            self.game.sprites.add(Laser(self.game, self.facing, self.x, self.y))
 
     def bind(self):
         def keyPressEvent(event):
@@ -216,6 +272,10 @@ class PlayerCharacter(Sprite):
             # Try to move in the direction given if an arrow key is pressed.
             direc = key_directions.get(event.key())
 
+            if self.game.generating:
+                # The next maze isn't ready yet.
+                return
+
             if event.key() == Qt.Key_Space and not self.game.is_game_over:
                 # Arrow keys to shoot.
                 self.shoot()
@@ -226,7 +286,8 @@ class PlayerCharacter(Sprite):
                     self.facing = direc
                 return
             elif direc:
-                self.try_move(direc)
+                if self.try_move(direc):
+                    self.game.player_moved()
                 # Check for collisions with any objects.
                 self.check_collision()
 
@@ -267,7 +328,9 @@ class PlayerCharacter(Sprite):
     def hit(self, source):
         pass
 
-class FuelPack(Sprite):
+class FuelPack(EntitySprite):
+    kind = entities.FUEL_PACK
+
     # Redefine the fuel pack as a different colour.
     def __init__(self, game, x=None, y=None, color='#FAE793'):
         super().__init__(game, x, y, color)
@@ -289,10 +352,8 @@ class FuelPack(Sprite):
 class Laser(Sprite):
     def __init__(self, game, direc, x=None, y=None, color='#22FF22'):
         super().__init__(game, x, y, color)
-        # Start a timer to track the laser's movement.
-        self.move_timer = QTimer()
-        self.move_timer.timeout.connect(self.laser_loop)
-        self.move_timer.start(100)
+        # Move the laser every 100 ms.
+        self.schedule(self.laser_loop, 100)
         self.facing = direc
 
         self.collision_blacklist = [self.__class__, PlayerCharacter]
@@ -342,20 +403,14 @@ class Laser(Sprite):
 
         painter.drawRect(rect)
 
-class Enemy(Sprite):
+class Enemy(EntitySprite):
+    # Enemies don't move on their own: MazeGame moves all of them at once (see
+    # MazeGame.move_enemies()).
+    kind = entities.ENEMY
+
     def __init__(self, game, x=None, y=None, color='#FE1111'):
         super().__init__(game, x, y, color)
 
-        self.move_timer = QTimer()
-        self.move_timer.timeout.connect(self.enemy_move_loop)
-        move_delay = self.game.leveldata.get('enemy_move_delay', self.game.ui.move_delay_spinbox.value())
-
-        if move_delay > 0:
-            # If move delay is 0, disable movement for enemies entirely.
-            self.game.ui.move_delay_spinbox.setValue(move_delay)
-            self.move_timer.start(move_delay)
-        self.direc = None
-
     def hit(self, source):
         """
         Method called when you hit an enemy.
@@ -365,23 +420,9 @@ class Enemy(Sprite):
         else:
             self.remove()
 
-    def enemy_move_loop(self):
-        """Tracks the laser's movement in a loop."""
-        if self.game.has_quit.is_set() or self.game.is_game_over:
-            return
-
-        current_point = self.game.maze.get(self.x, self.y)
-        # Enemies try to move in a straight line, turning around only if that fails
-        # due to a wall in the way.
-        if self.direc not in current_point.paths:
-            # Direction to move in hasn't been initialized yet. Randomly choose
-            # one.
-            self.direc = random.choice(list(current_point.paths))
-
-        if not self.try_move(self.direc):
-            self.direc = random.choice(list(current_point.paths))
+class Checkpoint(EntitySprite):
+    kind = entities.CHECKPOINT
 
-class Checkpoint(Sprite):
     def __init__(self, game, x=None, y=None, color='#FE55AA'):
         super().__init__(game, x, y, color)
 
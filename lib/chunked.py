@@ -0,0 +1,314 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Chunked, lazily generated mazes for TrulyAmazed.
+
+A ChunkedMaze is split into square chunks, each of which is generated only when
+something looks at it. Every chunk is a perfect maze on its own (generated by
+depth-first search, from a random seed derived from the maze seed and the chunk's
+position), and the chunks are joined together by exactly one passage per pair of
+chunks that are linked in a spanning tree of chunks. A spanning tree of perfect
+mazes joined by single passages is itself a perfect maze, no matter how big.
+
+The chunk tree is a binary tree: every chunk links to the chunk either north or
+west of it (chosen by hashing the chunk position), and the position of the
+passage along the shared border is hashed too. This means that any chunk can be
+generated without generating (or even knowing about) any other chunk.
+
+Only a limited amount of chunks are kept in memory; the least recently used ones
+are dropped and simply regenerated if they are needed again.
+
+The game uses chunked mazes for chunked levels (see ChunkedMazeGenerator), where
+only the chunks around the player and in view are ever generated. Anything that
+needs the whole maze at once (solving it, dead ends for checkpoints, steps to
+the finish, flow fields for hunting enemies, darkness) can't work on a maze
+this big, so ChunkedMaze deliberately has no cells buffer or whole-maze
+searches, and chunked levels go without those features.
+"""
+
+import random
+from collections import OrderedDict
+
+from .mazegrid import MazeGrid, MazeGridPoint, NORTH, WEST, SOUTH, EAST, to_bit
+from .algorithms import depth_first
+from .util import *
+
+_MASK = (1 << 64) - 1
+
+def _mix(*values):
+    """
+    Hashes the given non-negative integers into a single 64-bit integer. Unlike
+    hash(), this is the same across runs and Python versions.
+    """
+    # This is the SplitMix64 finalizer, applied once per value.
+    result = 0x9E3779B97F4A7C15
+    for value in values:
+        result = ((result ^ (value & _MASK)) + 0x9E3779B97F4A7C15) & _MASK
+        result = ((result ^ (result >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+        result = ((result ^ (result >> 27)) * 0x94D049BB133111EB) & _MASK
+        result ^= result >> 31
+    return result
+
+class ChunkedMaze():
+    """
+    Maze of (practically) unbounded size, generated one chunk at a time. This has
+    MazeGrid's read-only point interface (cell, has_path, get, by_rows, ...) and
+    wall_segments() for drawing, but nothing that needs the whole maze (cells,
+    distances, dead_ends, ...).
+    """
+
+    def __init__(self, width, height, seed=None, chunk_size=64, max_chunks=256):
+        if width < 1 or height < 1:
+            raise ValueError("Maze size must be positive.")
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        # Chunk seeds are derived from an integer version of the seed.
+        if isinstance(seed, int):
+            self._seed_value = seed & _MASK
+        else:
+            self._seed_value = random.Random(seed).getrandbits(64)
+
+        # Resident chunks: maps (chunk x, chunk y) to MazeGrid, oldest first.
+        self._chunks = OrderedDict()
+        self.chunks_generated = 0
+
+        # Start and finish default to opposite corners of the maze.
+        self.start = (0, 0)
+        self.finish = (width - 1, height - 1)
+        self.selected = None
+
+    def __repr__(self):
+        return 'ChunkedMaze(%s, %s, %s chunks resident)' % (self.width, self.height, len(self._chunks))
+
+    def in_bounds(self, x, y):
+        """Returns whether the given coordinates are inside the maze."""
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def index(self, x, y):
+        """Returns the flat index of the given coordinates (as in MazeGrid)."""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError("Point (%s, %s) is outside the grid." % (x, y))
+        return y * self.width + x
+
+    def coords(self, index):
+        """Returns the (x, y) coordinates for the given flat index."""
+        return (index % self.width, index // self.width)
+
+    def _chunk_width(self, chunkx):
+        return min(self.chunk_size, self.width - chunkx * self.chunk_size)
+
+    def _chunk_height(self, chunky):
+        return min(self.chunk_size, self.height - chunky * self.chunk_size)
+
+    def _link(self, chunkx, chunky):
+        """
+        Returns the direction bit (NORTH or WEST, or 0 for the root chunk) of the
+        passage linking the given chunk to its parent, and the position of that
+        passage along the chunk's border.
+        """
+        if chunkx == 0 and chunky == 0:
+            return 0, 0
+
+        value = _mix(self._seed_value, chunkx, chunky, 1)
+        if chunky == 0:
+            direction = WEST
+        elif chunkx == 0:
+            direction = NORTH
+        else:
+            direction = NORTH if value & 1 else WEST
+
+        value >>= 1
+        if direction == NORTH:
+            return direction, value % self._chunk_width(chunkx)
+        return direction, value % self._chunk_height(chunky)
+
+    def _generate_chunk(self, chunkx, chunky):
+        """Generates a single chunk, including its passages to neighbouring chunks."""
+        width = self._chunk_width(chunkx)
+        height = self._chunk_height(chunky)
+        grid = MazeGrid(width, height)
+
+        rng = random.Random(_mix(self._seed_value, chunkx, chunky, 0))
+        depth_first(grid, rng, (rng.randrange(width), rng.randrange(height)))
+        cells = grid.cells
+
+        # The passage to this chunk's parent...
+        direction, position = self._link(chunkx, chunky)
+        if direction == NORTH:
+            cells[position] |= NORTH
+        elif direction == WEST:
+            cells[position * width] |= WEST
+
+        # ... and the passages from the chunks south and east of this one, if they
+        # link to this chunk.
+        if (chunky + 1) * self.chunk_size < self.height:
+            direction, position = self._link(chunkx, chunky + 1)
+            if direction == NORTH:
+                cells[(height - 1) * width + position] |= SOUTH
+        if (chunkx + 1) * self.chunk_size < self.width:
+            direction, position = self._link(chunkx + 1, chunky)
+            if direction == WEST:
+                cells[position * width + width - 1] |= EAST
+
+        self.chunks_generated += 1
+        return grid
+
+    def chunk(self, chunkx, chunky):
+        """
+        Returns the MazeGrid of the given chunk, generating it if it isn't resident.
+        """
+        key = (chunkx, chunky)
+        grid = self._chunks.get(key)
+        if grid is not None:
+            self._chunks.move_to_end(key)
+            return grid
+
+        grid = self._chunks[key] = self._generate_chunk(chunkx, chunky)
+        while len(self._chunks) > self.max_chunks:
+            self._chunks.popitem(last=False)
+        return grid
+
+    @property
+    def resident_chunks(self):
+        """Returns the amount of chunks currently in memory."""
+        return len(self._chunks)
+
+    def load_around(self, x, y, radius):
+        """
+        Makes sure that all chunks within radius points of the given point are
+        resident, e.g. the ones near the player or in view.
+        """
+        size = self.chunk_size
+        left, top = max(0, x - radius) // size, max(0, y - radius) // size
+        right = min(self.width - 1, x + radius) // size
+        bottom = min(self.height - 1, y + radius) // size
+        for chunky in range(top, bottom + 1):
+            for chunkx in range(left, right + 1):
+                self.chunk(chunkx, chunky)
+
+    def cell(self, x, y):
+        """Returns the raw path bits of the given point."""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError("Point (%s, %s) is outside the grid." % (x, y))
+        size = self.chunk_size
+        grid = self.chunk(x // size, y // size)
+        return grid.cells[(y % size) * grid.width + x % size]
+
+    def has_path(self, x, y, direction):
+        """Returns whether the given point has an open path in the given direction."""
+        return bool(self.cell(x, y) & to_bit(direction))
+
+    def get(self, x, y):
+        """Returns a MazeGridPoint view for the given coordinates."""
+        self.index(x, y)
+        return MazeGridPoint(self, x, y)
+
+    def by_rows(self, left=0, top=0, right=None, bottom=None):
+        """
+        Iterates over one rectangular area of the maze (the whole maze by default),
+        one row of MazeGridPoint views at a time. right and bottom are exclusive.
+        """
+        right = self.width if right is None else min(right, self.width)
+        bottom = self.height if bottom is None else min(bottom, self.height)
+        for y in range(max(0, top), bottom):
+            yield [MazeGridPoint(self, x, y) for x in range(max(0, left), right)]
+
+    def area_grid(self, left, top, right, bottom):
+        """
+        Returns a copy of one rectangular area of the maze (right and bottom are
+        exclusive) as a MazeGrid of its own, whose point (0, 0) is the area's top
+        left point. Chunks are copied one at a time, so each chunk in the area is
+        generated at most once, even if they don't all fit in memory.
+        """
+        left, top = max(0, left), max(0, top)
+        right, bottom = max(left, min(right, self.width)), max(top, min(bottom, self.height))
+        width = right - left
+        cells = bytearray(width * (bottom - top))
+
+        size = self.chunk_size
+        for chunky in range(top // size, -(-bottom // size)):
+            for chunkx in range(left // size, -(-right // size)):
+                grid = self.chunk(chunkx, chunky)
+                # The part of the chunk in the area, in maze coordinates.
+                x1, x2 = max(left, chunkx * size), min(right, chunkx * size + grid.width)
+                for y in range(max(top, chunky * size), min(bottom, chunky * size + grid.height)):
+                    source = (y - chunky * size) * grid.width - chunkx * size
+                    target = (y - top) * width - left
+                    cells[target+x1:target+x2] = grid.cells[source+x1:source+x2]
+
+        return MazeGrid(width, bottom - top, cells)
+
+    def wall_segments(self, left=0, top=0, right=None, bottom=None):
+        """
+        Returns the walls around the points in the given area as line segments, as
+        MazeGrid.wall_segments() does. Every chunk in the area is generated, so this
+        is meant for the part of the maze in view, not the whole maze (the default).
+        """
+        left, top = max(0, left), max(0, top)
+        right = self.width if right is None else right
+        bottom = self.height if bottom is None else bottom
+        area = self.area_grid(left, top, right, bottom)
+        return [(x1 + left, y1 + top, x2 + left, y2 + top) for x1, y1, x2, y2 in area.wall_segments()]
+
+class ChunkedMazeGenerator():
+    """
+    Stand-in for MazeGenerator (see lib.mazemaker) for chunked levels. There is
+    nothing to generate up front, and nothing that needs the whole maze: no
+    cache, no dead ends, no solution and no distances to the finish.
+    """
+    # Every chunk is carved using depth-first search.
+    algorithm = 'depth_first'
+
+    def __init__(self, width, height, seed=None, chunk_size=64, max_chunks=256):
+        self.width = width
+        self.height = height
+        self.grid = ChunkedMaze(width, height, seed, chunk_size, max_chunks)
+        self.seed = self.grid.seed
+
+        self.start = self.finish = None
+        # Chunked mazes can't be saved to maze files, so they have no saved sprites.
+        self.sprite_spawns = []
+
+    def generate(self, start_point=None, end_point=None):
+        """
+        Sets the start and finish points, which default to the top left and bottom
+        right corners of the maze (also if the given ones are outside it). Chunks are
+        generated once something looks at them, so this returns right away.
+        """
+        grid = self.grid
+        if start_point and grid.in_bounds(*start_point):
+            grid.start = tuple(start_point)
+        if end_point and grid.in_bounds(*end_point):
+            grid.finish = tuple(end_point)
+        debug_print("Using %s and %s as the start and finish of %s" % (grid.start, grid.finish, grid))
+
+        self.start = grid.get(*grid.start)
+        self.finish = grid.get(*grid.finish)
+        return grid
+
+    def steps_to_finish(self, x, y):
+        """
+        Returns None: the length of the path to the finish can't be known without
+        generating the maze all the way to it.
+        """
+        return None
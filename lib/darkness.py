@@ -0,0 +1,247 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Darkness (flashlight) calculations for TrulyAmazed.
+
+Darkness is computed for the part of the maze in view at once, as one alpha
+(opacity) value per point, so that the GUI can draw it as a single image. Only
+the points near the player can be lit, so only those are searched; everything
+else is simply dark.
+
+There are two darkness modes: in 'path' mode, light spreads along the maze's
+paths, getting dimmer with the path length from the player. In 'sight' mode,
+only points that the player can see in a straight line (without looking through
+walls) are lit.
+"""
+
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .mazegrid import NORTH, WEST, SOUTH, EAST
+from .util import *
+
+# Opacity of points that are completely dark. This is slightly less than fully
+# opaque, so that the maze can still be made out.
+MAX_DARKNESS = 250
+
+def default_radius(width, height):
+    """Returns the default flashlight radius: half the maze's smaller side, plus one."""
+    return min(width, height)//2+1
+
+def light_step(radius):
+    """
+    Returns how much darker (in opacity) each point away from the player gets,
+    given the flashlight radius. This is 0 if the flashlight is so big that
+    everything is lit.
+    """
+    # The darkness changes with each point away from the player by 255 (the max.
+    # opacity value) divided by the flashlight radius.
+    return 255 // max(1, radius)
+
+def lit_points(grid, x, y, radius):
+    """
+    Returns the points that light from the given point reaches along the maze's
+    paths, as a list of (flat index, path length) tuples. The search stops at
+    the path length where points become completely dark, so it only looks at
+    the points around the player, no matter how big the maze is.
+    """
+    step = light_step(radius)
+    # Points this far away or further are all equally dark.
+    limit = MAX_DARKNESS // step + 1 if step else len(grid)
+    width = grid.width
+    cells = grid.cells
+    offsets = ((NORTH, -width), (WEST, -1), (SOUTH, width), (EAST, 1))
+
+    start = grid.index(x, y)
+    distances = {start: 0}
+    queue = [start]
+    for index in queue:
+        distance = distances[index] + 1
+        if distance >= limit:
+            # The queue is in order of path length, so everything after this is
+            # too far away as well.
+            break
+        value = cells[index]
+        for bit, offset in offsets:
+            if value & bit:
+                neighbour = index + offset
+                if neighbour not in distances:
+                    distances[neighbour] = distance
+                    queue.append(neighbour)
+    return list(distances.items())
+
+def alpha_to_rgba(alpha):
+    """
+    Converts a buffer of opacity values to black RGBA pixels (4 bytes each, in
+    R, G, B, A order), e.g. for a QImage in Format_RGBA8888.
+    """
+    pixels = bytearray(4 * len(alpha))
+    pixels[3::4] = alpha
+    return pixels
+
+def line_of_sight(grid, x1, y1, x2, y2):
+    """
+    Returns whether the centres of the two points can see each other: the line
+    between them may only cross sides of points that have a path (no wall).
+
+    Lines going exactly through a corner are let through if either way around
+    the corner is open.
+    """
+    width = grid.width
+    cells = grid.cells
+    xcount, ycount = abs(x2 - x1), abs(y2 - y1)
+    xbit, xstep = (EAST, 1) if x2 > x1 else (WEST, -1)
+    ybit, ystep = (SOUTH, width) if y2 > y1 else (NORTH, -width)
+
+    index = grid.index(x1, y1)
+    xdone = ydone = 0
+    # Walk along the points the line crosses, one side at a time. Which side is
+    # crossed next depends on whether the line reaches the next vertical
+    # ((xdone + 1/2) / xcount of the way) or horizontal side first; the
+    # comparison is done in integers.
+    while xdone < xcount or ydone < ycount:
+        decision = (1 + 2*xdone) * ycount - (1 + 2*ydone) * xcount
+        value = cells[index]
+        if decision == 0:
+            # Right through a corner.
+            if not ((value & xbit and cells[index+xstep] & ybit) or
+                    (value & ybit and cells[index+ystep] & xbit)):
+                return False
+            index += xstep + ystep
+            xdone += 1
+            ydone += 1
+        elif decision < 0:
+            if not value & xbit:
+                return False
+            index += xstep
+            xdone += 1
+        else:
+            if not value & ybit:
+                return False
+            index += ystep
+            ydone += 1
+    return True
+
+def visible_points(grid, x, y, radius=None):
+    """
+    Returns the points visible from the given point (see line_of_sight()) that are
+    within radius points of it (as the crow flies; no limit if radius is None).
+    This is a list of (flat index, path length) tuples.
+    """
+    width = grid.width
+    cells = grid.cells
+    offsets = ((NORTH, -width), (WEST, -1), (SOUTH, width), (EAST, 1))
+
+    # A line of sight is also a path through the maze that only ever moves
+    # towards its end, so it is exactly as long as its horizontal plus vertical
+    # length. So only points that can be reached by such paths need to be traced,
+    # and the search for them never has to go past any other points.
+    start = grid.index(x, y)
+    distances = {start: 0}
+    queue = [start]
+    for index in queue:
+        distance = distances[index] + 1
+        value = cells[index]
+        for bit, offset in offsets:
+            if value & bit:
+                neighbour = index + offset
+                if neighbour in distances:
+                    continue
+                pointx, pointy = neighbour % width, neighbour // width
+                xdistance, ydistance = abs(pointx - x), abs(pointy - y)
+                if distance != xdistance + ydistance:
+                    continue
+                if radius is not None and xdistance*xdistance + ydistance*ydistance > radius*radius:
+                    continue
+                distances[neighbour] = distance
+                queue.append(neighbour)
+
+    return [(index, distance) for index, distance in distances.items()
+            if line_of_sight(grid, x, y, index % width, index // width)]
+
+class VisibilityCache():
+    """
+    Remembers the points visible from recently used points (see visible_points()),
+    so that moving back and forth doesn't need new line of sight checks. At most
+    max_entries results are kept; the least recently used are evicted first.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        # Maps (grid, x, y, radius) to visible_points() results, oldest first.
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return 'VisibilityCache(%s entries, %s hits, %s misses)' % (len(self._entries), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, grid, x, y, radius=None):
+        """Returns the points visible from the given point, computing them if needed."""
+        key = (grid, x, y, radius)
+        visible = self._entries.get(key)
+        if visible is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return visible
+
+        self.misses += 1
+        visible = self._entries[key] = visible_points(grid, x, y, radius)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return visible
+
+    def clear(self):
+        """Removes all entries."""
+        self._entries.clear()
+
+def area_alpha(grid, lit, radius, area):
+    """
+    Returns the darkness opacity (0-MAX_DARKNESS) of every point in an area
+    (left, top, right, bottom; right and bottom are exclusive) of the maze, as
+    one byte per point, row by row. lit is a list of (flat index, path length)
+    tuples of the points that are lit (see lit_points() and visible_points());
+    they get dimmer with their path length from the player. All other points
+    are completely dark.
+    """
+    left, top, right, bottom = area
+    columns = right - left
+    step = light_step(radius)
+    width = grid.width
+
+    if numpy is not None and lit:
+        indices, distances = numpy.array(lit, dtype=numpy.int64).T
+        ys, xs = numpy.divmod(indices, width)
+        inside = (xs >= left) & (xs < right) & (ys >= top) & (ys < bottom)
+        alpha = numpy.full((bottom - top, columns), MAX_DARKNESS, dtype=numpy.uint8)
+        alpha[ys[inside] - top, xs[inside] - left] = numpy.minimum(MAX_DARKNESS, distances[inside] * step)
+        return alpha.tobytes()
+
+    alpha = bytearray([MAX_DARKNESS]) * (columns * (bottom - top))
+    for index, distance in lit:
+        y, x = divmod(index, width)
+        if left <= x < right and top <= y < bottom:
+            alpha[(y - top) * columns + x - left] = min(MAX_DARKNESS, distance*step)
+    return alpha
@@ -0,0 +1,213 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Struct-of-arrays storage for large amounts of sprites (entities).
+
+Instead of every entity being a full Python object, their positions, directions,
+and types are kept in flat arrays (numpy arrays if numpy is installed), one slot
+per entity. This lets all enemies move in a single vectorized step.
+"""
+
+import random
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .mazegrid import NORTH, WEST, SOUTH, EAST, bit_offsets
+from .mazefile import SPRITE_FUEL_PACK, SPRITE_ENEMY, SPRITE_CHECKPOINT
+from .util import *
+
+# Entity types are the same as the sprite types used in maze files.
+FUEL_PACK = SPRITE_FUEL_PACK
+ENEMY = SPRITE_ENEMY
+CHECKPOINT = SPRITE_CHECKPOINT
+
+# For each 4-bit path value and each random number in range(12), one of the open
+# directions, picked evenly (12 is divisible by 1, 2, 3 and 4).
+_RANDOM_RANGE = 12
+_pick_table = tuple(tuple([bit for bit in (NORTH, WEST, SOUTH, EAST) if value & bit][r % bin(value).count('1')]
+                          if value else 0 for r in range(_RANDOM_RANGE))
+                    for value in range(16))
+
+# x and y offsets for each direction bit (0 for no movement).
+_dx_table = tuple(bit_offsets.get(bit, (0, 0))[0] for bit in range(16))
+_dy_table = tuple(bit_offsets.get(bit, (0, 0))[1] for bit in range(16))
+
+if numpy is not None:
+    _pick_array = numpy.array(_pick_table, dtype=numpy.uint8)
+    _dx_array = numpy.array(_dx_table, dtype=numpy.int32)
+    _dy_array = numpy.array(_dy_table, dtype=numpy.int32)
+
+class EntityStore():
+    """
+    Flat arrays of entity positions, directions and types. Entities are referred
+    to by slot number; removed slots are reused.
+    """
+
+    def __init__(self, capacity=64, seed=None):
+        self.capacity = 0
+        self.count = 0  # Slots in use so far, including removed ones.
+        self._free = []
+        # The object (e.g. sprite) representing each slot, if any.
+        self.owners = []
+        self.random = random.Random(seed)
+        if numpy is not None:
+            self._numpy_random = numpy.random.default_rng(seed)
+
+        if numpy is not None:
+            self.xs = numpy.zeros(0, dtype=numpy.int32)
+            self.ys = numpy.zeros(0, dtype=numpy.int32)
+            self.directions = numpy.zeros(0, dtype=numpy.uint8)
+            self.kinds = numpy.zeros(0, dtype=numpy.uint8)
+        else:
+            self.xs = array('i')
+            self.ys = array('i')
+            self.directions = bytearray()
+            self.kinds = bytearray()
+        self._grow(capacity)
+
+    def __repr__(self):
+        return 'EntityStore(%s entities)' % len(self)
+
+    def __len__(self):
+        return self.count - len(self._free)
+
+    def _grow(self, capacity):
+        """Grows the arrays to hold the given amount of slots."""
+        extra = capacity - self.capacity
+        if extra <= 0:
+            return
+        if numpy is not None:
+            self.xs = numpy.concatenate((self.xs, numpy.zeros(extra, dtype=numpy.int32)))
+            self.ys = numpy.concatenate((self.ys, numpy.zeros(extra, dtype=numpy.int32)))
+            self.directions = numpy.concatenate((self.directions, numpy.zeros(extra, dtype=numpy.uint8)))
+            self.kinds = numpy.concatenate((self.kinds, numpy.zeros(extra, dtype=numpy.uint8)))
+        else:
+            self.xs.extend(array('i', bytes(4 * extra)))
+            self.ys.extend(array('i', bytes(4 * extra)))
+            self.directions.extend(bytes(extra))
+            self.kinds.extend(bytes(extra))
+        self.owners.extend([None] * extra)
+        self.capacity = capacity
+
+    def add(self, kind, x, y, owner=None):
+        """Adds an entity of the given type (non-zero), returning its slot."""
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self.count == self.capacity:
+                # Double the capacity, so that adding entities is amortized O(1).
+                self._grow(max(64, self.capacity * 2))
+            slot = self.count
+            self.count += 1
+
+        self.xs[slot] = x
+        self.ys[slot] = y
+        self.directions[slot] = 0
+        self.kinds[slot] = kind
+        self.owners[slot] = owner
+        return slot
+
+    def remove(self, slot):
+        """Removes the entity in the given slot."""
+        if self.kinds[slot]:
+            self.kinds[slot] = 0
+            self.owners[slot] = None
+            self._free.append(slot)
+
+    def clear(self):
+        """Removes all entities."""
+        if numpy is not None:
+            self.kinds[:] = 0
+        else:
+            self.kinds[:] = bytes(self.capacity)
+        self.owners = [None] * self.capacity
+        self.count = 0
+        self._free.clear()
+
+    def slots(self, kind):
+        """Returns the slots of all entities of the given type."""
+        if numpy is not None:
+            return numpy.flatnonzero(self.kinds[:self.count] == kind)
+        kinds = self.kinds
+        return [slot for slot in range(self.count) if kinds[slot] == kind]
+
+    def step(self, grid, kind=ENEMY, flow_field=None):
+        """
+        Moves every entity of the given type one point, returning the slots of the
+        entities that moved.
+
+        Without a flow field, entities walk in a straight line, turning in a random
+        open direction whenever a wall is in the way. With a flow field (see
+        lib.flowfield), they follow it instead.
+        """
+        if numpy is not None:
+            return self._step_numpy(grid, kind, flow_field)
+        return self._step_python(grid, kind, flow_field)
+
+    def _step_numpy(self, grid, kind, flow_field):
+        slots = self.slots(kind)
+        if not len(slots):
+            return slots
+        xs, ys = self.xs[slots], self.ys[slots]
+        indices = ys * grid.width + xs
+        values = numpy.frombuffer(grid.cells, dtype=numpy.uint8)[indices]
+
+        if flow_field is not None:
+            directions = numpy.frombuffer(flow_field.directions, dtype=numpy.uint8)[indices]
+        else:
+            directions = self.directions[slots]
+            # Entities facing a wall turn in a random open direction.
+            blocked = (values & directions) == 0
+            picks = _pick_array[values, self._numpy_random.integers(0, _RANDOM_RANGE, len(slots))]
+            directions = numpy.where(blocked, picks, directions)
+        self.directions[slots] = directions
+
+        dx, dy = _dx_array[directions], _dy_array[directions]
+        self.xs[slots] = xs + dx
+        self.ys[slots] = ys + dy
+        return slots[(dx != 0) | (dy != 0)]
+
+    def _step_python(self, grid, kind, flow_field):
+        width = grid.width
+        cells = grid.cells
+        xs, ys, directions, kinds = self.xs, self.ys, self.directions, self.kinds
+        flow = flow_field.directions if flow_field is not None else None
+        randrange = self.random.randrange
+
+        moved = []
+        for slot in range(self.count):
+            if kinds[slot] != kind:
+                continue
+            index = ys[slot] * width + xs[slot]
+            if flow is not None:
+                direction = flow[index]
+            else:
+                value = cells[index]
+                direction = directions[slot]
+                if not value & direction:
+                    direction = _pick_table[value][randrange(_RANDOM_RANGE)]
+            directions[slot] = direction
+
+            if direction:
+                xs[slot] += _dx_table[direction]
+                ys[slot] += _dy_table[direction]
+                moved.append(slot)
+        return moved
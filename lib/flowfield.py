@@ -0,0 +1,118 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Flow field pathfinding for TrulyAmazed.
+
+A flow field stores, for every point in the maze, the direction to move in to
+get closer to one target point (e.g. the player). It is built with a single
+breadth-first search from the target, after which any amount of sprites can look
+up their next step in O(1).
+"""
+
+from .mazegrid import SOUTH, EAST, bit_directions, bit_offsets, opposite_bits, _bit_tables
+from .util import *
+
+class FlowField():
+    """
+    Flow field leading towards a target point in the given maze grid.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.target = None
+        # For every point, the path bit to follow towards the target (0 if the
+        # target can't be reached, or for the target itself).
+        self.directions = bytearray(len(grid))
+
+        # Count the passages in the maze: a maze with exactly one passage less than
+        # it has points is a tree (perfect maze), once it turns out to be connected.
+        cells = bytes(grid.cells)
+        self._passages = cells.translate(_bit_tables[EAST]).count(1) + cells.translate(_bit_tables[SOUTH]).count(1)
+        self.is_tree = False
+
+        # Amount of full searches and incremental updates done, for debugging.
+        self.full_updates = 0
+        self.incremental_updates = 0
+
+    def __repr__(self):
+        return 'FlowField(%s, target=%s)' % (self.grid, self.target)
+
+    def _rebuild(self, target):
+        """Rebuilds the whole flow field with a breadth-first search from target."""
+        width = self.grid.width
+        cells = self.grid.cells
+        directions = self.directions = bytearray(len(self.grid))
+        towards = tuple((bit, yoffset*width + xoffset, opposite_bits[bit])
+                        for bit, (xoffset, yoffset) in bit_offsets.items())
+
+        start = self.grid.index(*target)
+        # Mark the target as visited, with a value that isn't a valid path bit.
+        directions[start] = 0xFF
+        queue = [start]
+        for index in queue:
+            value = cells[index]
+            for bit, offset, back in towards:
+                if value & bit:
+                    neighbour = index + offset
+                    if not directions[neighbour]:
+                        # Points found from here should move back towards here.
+                        directions[neighbour] = back
+                        queue.append(neighbour)
+        directions[start] = 0
+
+        self.is_tree = len(queue) == len(self.grid) and self._passages == len(self.grid) - 1
+        self.full_updates += 1
+
+    def update(self, x, y):
+        """
+        Moves the flow field's target to the given point.
+
+        In a perfect maze, moving the target to a neighbouring point only changes
+        the directions of the old and new target points: every other point still
+        has to go the same way to reach either of them. So in that case, this takes
+        O(1) time instead of a new breadth-first search.
+        """
+        target = (x, y)
+        old = self.target
+        if old == target:
+            return
+        self.target = target
+
+        if old is not None and self.is_tree:
+            xoffset, yoffset = x - old[0], y - old[1]
+            for bit, offset in bit_offsets.items():
+                if offset == (xoffset, yoffset) and self.grid.has_path(old[0], old[1], bit):
+                    self.directions[self.grid.index(*old)] = bit
+                    self.directions[self.grid.index(x, y)] = 0
+                    self.incremental_updates += 1
+                    return
+
+        self._rebuild(target)
+
+    def next_bit(self, x, y):
+        """
+        Returns the path bit to move in from the given point towards the target, or
+        0 if there is none.
+        """
+        return self.directions[self.grid.index(x, y)]
+
+    def next_direction(self, x, y):
+        """
+        Returns the direction name to move in from the given point towards the target,
+        or None if there is none.
+        """
+        return bit_directions.get(self.directions[self.grid.index(x, y)])
@@ -0,0 +1,142 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Lowest common ancestor (LCA) index for path distances in perfect mazes.
+
+A perfect maze is a tree, so the path length between two points is
+depth(a) + depth(b) - 2 * depth(lca(a, b)), with the tree rooted anywhere. The
+depth of the LCA is the smallest depth found between the two points in an Euler
+tour of the tree, which a sparse table answers in O(1).
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .mazegrid import NORTH, WEST, SOUTH, EAST
+from .util import *
+
+# Size of the Euler tour blocks that the sparse table is built over.
+BLOCK_SIZE = 32
+
+class LCAIndex():
+    """
+    Answers path length queries between any two points of a perfect maze in O(1),
+    after O(n) preprocessing (time and memory; the sparse table itself only takes
+    O(n/BLOCK_SIZE log n)).
+
+    For mazes with loops, distances are measured along a spanning tree of the
+    maze, so they may be longer than the shortest path.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.width = grid.width
+        self._build()
+
+    def _build(self):
+        width = self.width
+        cells = self.grid.cells
+        count = len(self.grid)
+        offsets = ((NORTH, -width), (WEST, -1), (SOUTH, width), (EAST, 1))
+
+        # Depth of every point from the root (point 0), and the position of its
+        # first appearance in the Euler tour. -1 means not reached.
+        depths = self.depths = array('i', [-1]) * count
+        first = self.first = array('i', [-1]) * count
+        # Depths of the points in Euler tour order.
+        tour = array('i')
+
+        depths[0] = 0
+        first[0] = 0
+        tour.append(0)
+        # Iterative depth-first search. Each stack entry is a point and the
+        # directions that are left to try from it.
+        stack = [(0, cells[0])]
+        while stack:
+            index, remaining = stack[-1]
+            depth = depths[index]
+            for bit, offset in offsets:
+                if remaining & bit:
+                    remaining &= ~bit
+                    neighbour = index + offset
+                    if depths[neighbour] < 0:
+                        stack[-1] = (index, remaining)
+                        depths[neighbour] = depth + 1
+                        first[neighbour] = len(tour)
+                        tour.append(depth + 1)
+                        stack.append((neighbour, cells[neighbour]))
+                        break
+            else:
+                # Done with this point: return to its parent in the tour.
+                stack.pop()
+                if stack:
+                    tour.append(depth - 1)
+
+        # The tour is split into blocks of BLOCK_SIZE entries, and the sparse table
+        # is built over the minimum of each block: level k holds the minimum depth
+        # of each run of 2**k consecutive blocks. Within blocks, the minimum is
+        # found by slicing the tour directly. This keeps both the table and the
+        # time needed to build it small.
+        self.tour = tour
+        blocks = array('i', (min(tour[start:start+BLOCK_SIZE]) for start in range(0, len(tour), BLOCK_SIZE)))
+        table = self._table = [blocks]
+        step = 1
+        while step * 2 <= len(blocks):
+            previous = table[-1]
+            if numpy is not None:
+                level = numpy.minimum(previous[:-step], previous[step:])
+            else:
+                # map() over the builtin min() keeps this loop in C.
+                level = array('i', map(min, previous[:-step], previous[step:]))
+            table.append(level)
+            step *= 2
+
+        debug_print("LCAIndex: built index for %s with %s levels" % (self.grid, len(table)))
+
+    def distance_index(self, index1, index2):
+        """
+        Returns the path length between the two points (given as flat indices), or
+        -1 if there is no path between them.
+        """
+        left, right = self.first[index1], self.first[index2]
+        if left < 0 or right < 0:
+            return -1
+        if left > right:
+            left, right = right, left
+
+        tour = self.tour
+        left_block, right_block = left // BLOCK_SIZE + 1, right // BLOCK_SIZE
+        if left_block >= right_block:
+            # Both points are in the same or neighbouring blocks.
+            lca_depth = min(tour[left:right+1])
+        else:
+            # Minimum of the end of the first block, the blocks in between (from
+            # the sparse table), and the start of the last block.
+            lca_depth = min(min(tour[left:left_block*BLOCK_SIZE]), min(tour[right_block*BLOCK_SIZE:right+1]))
+            level = (right_block - left_block).bit_length() - 1
+            row = self._table[level]
+            lca_depth = min(lca_depth, row[left_block], row[right_block - (1 << level)])
+        return self.depths[index1] + self.depths[index2] - 2 * int(lca_depth)
+
+    def distance(self, x1, y1, x2, y2):
+        """Returns the path length between the two points."""
+        grid = self.grid
+        return self.distance_index(grid.index(x1, y1), grid.index(x2, y2))
@@ -0,0 +1,173 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Seeded maze cache for TrulyAmazed.
+
+Since a maze is fully determined by its algorithm, size, seed, and static points,
+generated mazes can be cached under those settings and reused instantly.
+"""
+
+import os
+import struct
+import hashlib
+from collections import OrderedDict
+
+from .mazegrid import MazeGrid
+from .util import *
+
+# Header for cache files: magic, width, height
+CACHE_HEADER = struct.Struct('<4sII')
+CACHE_MAGIC = b'TAMC'
+CACHE_SUFFIX = '.mazecache'
+
+class MazeCache():
+    """
+    In-memory and (optionally) on-disk LRU cache of generated maze grids.
+
+    Both layers are limited by size in bytes: when a limit is exceeded, the least
+    recently used mazes are evicted first.
+    """
+
+    def __init__(self, max_memory=64*1024*1024, directory=None, max_disk=256*1024*1024):
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.directory = directory
+
+        # Maps keys to (width, height, bytes of cell data), oldest first.
+        self._memory = OrderedDict()
+        self.memory_size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self):
+        return 'MazeCache(%s entries, %s hits, %s misses)' % (len(self._memory), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._memory)
+
+    @staticmethod
+    def make_key(algorithm, width, height, seed, static_start=None, static_finish=None, parallel=False):
+        """Returns the cache key for a maze with the given settings."""
+        # Static points may come from JSON as lists, which can't be hashed.
+        static_start = tuple(static_start) if static_start else None
+        static_finish = tuple(static_finish) if static_finish else None
+        key = (algorithm, width, height, seed, static_start, static_finish)
+        if parallel:
+            # Mazes generated in parallel differ from ones generated in one go.
+            key += ('parallel',)
+        return key
+
+    def _filename(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest() + CACHE_SUFFIX)
+
+    def _remember(self, key, width, height, data):
+        """Adds an entry to the in-memory cache, evicting old entries as needed."""
+        if key in self._memory:
+            self.memory_size -= len(self._memory.pop(key)[2])
+        self._memory[key] = (width, height, data)
+        self.memory_size += len(data)
+
+        while self.memory_size > self.max_memory and len(self._memory) > 1:
+            _, (_, _, old_data) = self._memory.popitem(last=False)
+            self.memory_size -= len(old_data)
+
+    def _read_file(self, key):
+        """Returns (width, height, data) from the on-disk cache, or None if not found."""
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                magic, width, height = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+                data = f.read()
+        except (OSError, struct.error):
+            return None
+
+        if magic != CACHE_MAGIC or len(data) != width * height:
+            debug_print("MazeCache: ignoring corrupt cache file %s" % filename)
+            return None
+
+        # Bump the file's modification time, which is used as its last access time.
+        try:
+            os.utime(filename)
+        except OSError:
+            # Another process removed the file in the meantime; what was read is fine.
+            pass
+        return (width, height, data)
+
+    def _write_file(self, key, width, height, data):
+        filename = self._filename(key)
+        try:
+            with open(filename, 'wb') as f:
+                f.write(CACHE_HEADER.pack(CACHE_MAGIC, width, height))
+                f.write(data)
+        except OSError:
+            debug_print("MazeCache: failed to write cache file %s" % filename)
+            return
+        self._evict_files()
+
+    def _evict_files(self):
+        """Deletes the least recently used cache files until the disk limit is met."""
+        files = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(CACHE_SUFFIX):
+                path = os.path.join(self.directory, filename)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk:
+                break
+            os.remove(path)
+            total -= size
+
+    def get(self, key):
+        """
+        Returns a new MazeGrid for the given key, or None if it isn't cached.
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        elif self.directory:
+            entry = self._read_file(key)
+            if entry is not None:
+                self._remember(key, *entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        width, height, data = entry
+        # Hand out a copy, so that changes made to the grid don't leak into the cache.
+        return MazeGrid(width, height, bytearray(data))
+
+    def put(self, key, grid):
+        """Adds the given MazeGrid to the cache."""
+        data = bytes(grid.cells)
+        self._remember(key, grid.width, grid.height, data)
+        if self.directory:
+            self._write_file(key, grid.width, grid.height, data)
+
+    def clear(self):
+        """Clears the in-memory cache and resets the hit/miss counters."""
+        self._memory.clear()
+        self.memory_size = 0
+        self.hits = self.misses = 0
@@ -0,0 +1,242 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Reading and writing of TrulyAmazed's binary maze format (.tamaze).
+
+A .tamaze file consists of:
+- A fixed-size header (see HEADER below): magic, version, maze size, start and
+  finish points, seed, algorithm name, and the amount of sprite spawns.
+- One record per sprite spawn (see SPRITE below): sprite type and position.
+- The maze itself, with the 4 path bits of two points packed into each byte
+  (the low nibble holds the point with the even index).
+
+Use load_maze() to memory-map a file instead of reading it all in.
+"""
+
+import os
+import mmap
+import struct
+
+from .mazegrid import MazeGrid, to_bit
+
+MAGIC = b'TAMZ'
+VERSION = 1
+SUFFIX = '.tamaze'
+
+# magic, version, width, height, start x, start y, finish x, finish y, seed,
+# algorithm name, sprite count
+HEADER = struct.Struct('<4sHIIIIIIQ16sI')
+# sprite type, x, y
+SPRITE = struct.Struct('<BII')
+
+# Sprite types stored in sprite spawn records.
+SPRITE_FUEL_PACK = 1
+SPRITE_ENEMY = 2
+SPRITE_CHECKPOINT = 3
+
+# Translation tables used to pack and unpack nibbles without looping in Python.
+_high_nibble_in = bytes((value << 4) & 0xFF for value in range(256))
+_low_nibble_out = bytes(value & 0x0F for value in range(256))
+_high_nibble_out = bytes(value >> 4 for value in range(256))
+
+class MazeFileError(ValueError):
+    """Raised when a maze file is invalid."""
+
+def pack_cells(cells):
+    """Packs a buffer of path bits (one point per byte) into two points per byte."""
+    cells = bytes(cells)
+    if len(cells) % 2:
+        cells += b'\x00'
+
+    low = cells[0::2]
+    high = cells[1::2].translate(_high_nibble_in)
+    # OR the two halves together as big integers, which is done entirely in C.
+    packed = int.from_bytes(low, 'little') | int.from_bytes(high, 'little')
+    return packed.to_bytes(len(low), 'little')
+
+def unpack_cells(packed, count):
+    """Unpacks the given amount of points from a buffer packed by pack_cells()."""
+    packed = bytes(packed)
+    cells = bytearray(len(packed) * 2)
+    cells[0::2] = packed.translate(_low_nibble_out)
+    cells[1::2] = packed.translate(_high_nibble_out)
+    del cells[count:]
+    return cells
+
+def write_maze(f, grid, start, finish, seed=0, algorithm='', sprites=()):
+    """
+    Writes a maze to the given binary file object.
+
+    start and finish are (x, y) tuples, and sprites is an iterable of
+    (sprite type, x, y) tuples, where sprite types are small integers.
+    """
+    sprites = list(sprites)
+    if not isinstance(seed, int):
+        # Only integer seeds can be stored.
+        seed = 0
+
+    f.write(HEADER.pack(MAGIC, VERSION, grid.width, grid.height, start[0], start[1],
+                        finish[0], finish[1], seed & 0xFFFFFFFFFFFFFFFF,
+                        algorithm.encode('ascii'), len(sprites)))
+    for sprite in sprites:
+        f.write(SPRITE.pack(*sprite))
+    f.write(pack_cells(grid.cells))
+
+def read_header(data):
+    """
+    Parses the header of a .tamaze file from the given buffer, returning a dict
+    of its fields.
+    """
+    try:
+        magic, version, width, height, startx, starty, finishx, finishy, seed, algorithm, \
+            sprite_count = HEADER.unpack_from(data)
+    except struct.error:
+        raise MazeFileError("File is too short to be a maze file")
+
+    if magic != MAGIC:
+        raise MazeFileError("Not a maze file")
+    elif version != VERSION:
+        raise MazeFileError("Unsupported maze file version %s" % version)
+
+    return {'width': width, 'height': height, 'start': (startx, starty), 'finish': (finishx, finishy),
+            'seed': seed, 'algorithm': algorithm.rstrip(b'\x00').decode('ascii'),
+            'sprite_count': sprite_count}
+
+class MappedMazeGrid(MazeGrid):
+    """
+    Read-only MazeGrid backed by a memory-mapped .tamaze file.
+
+    Single points and rows (see row_cells()) are read straight from the file's
+    packed data, so opening and drawing part of a maze doesn't unpack all of it.
+    Anything that needs the full cells buffer (searches over the whole maze,
+    such as solving it, finding dead ends, or moving enemies) unpacks it once
+    and keeps it, so playing a loaded maze still needs the memory of a
+    generated one.
+    """
+
+    def __init__(self, data, offset, width, height):
+        self.width = width
+        self.height = height
+        self._data = data
+        self._offset = offset
+        self._cells = None
+
+        self.start = None
+        self.finish = None
+        self.selected = None
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            count = self.width * self.height
+            self._cells = unpack_cells(self._data[self._offset:self._offset + (count + 1) // 2], count)
+        return self._cells
+
+    def row_cells(self, top, bottom):
+        if self._cells is not None:
+            return self._cells[top*self.width:bottom*self.width]
+
+        # Unpack only the bytes holding these rows. If the first point is in a high
+        # nibble, one point too many is unpacked in front of it.
+        start, end = top * self.width, bottom * self.width
+        packed = self._data[self._offset + (start >> 1):self._offset + ((end + 1) >> 1)]
+        skip = start & 1
+        cells = unpack_cells(packed, len(packed) * 2)
+        return cells[skip:skip + end - start]
+
+    def cell(self, x, y):
+        if self._cells is not None:
+            return self._cells[self.index(x, y)]
+
+        index = self.index(x, y)
+        value = self._data[self._offset + (index >> 1)]
+        return (value >> 4) if index & 1 else (value & 0x0F)
+
+    def has_path(self, x, y, direction):
+        return bool(self.cell(x, y) & to_bit(direction))
+
+    def carve(self, x, y, direction):
+        raise TypeError("Memory-mapped mazes are read-only")
+
+def _check_points(header):
+    """Makes sure the start, finish and sprite spawns are all inside the maze."""
+    width, height = header['width'], header['height']
+    for name in ('start', 'finish'):
+        x, y = header[name]
+        if x >= width or y >= height:
+            raise MazeFileError("The %s point (%s, %s) is outside the %sx%s maze" % (name, x, y, width, height))
+    for sprite_type, x, y in header['sprites']:
+        if x >= width or y >= height:
+            raise MazeFileError("A sprite at (%s, %s) is outside the %sx%s maze" % (x, y, width, height))
+
+def _read_sprites(data, header):
+    """Reads the sprite spawn records following the header into header['sprites']."""
+    offset = HEADER.size
+    sprites = []
+    for _ in range(header['sprite_count']):
+        try:
+            sprites.append(SPRITE.unpack_from(data, offset))
+        except struct.error:
+            raise MazeFileError("Sprite data is truncated")
+        offset += SPRITE.size
+    header['sprites'] = sprites
+    return offset
+
+def load_maze(filename):
+    """
+    Opens a .tamaze file using mmap, returning a (MappedMazeGrid, header) tuple.
+    The header dict also gets a 'sprites' list of (type, x, y) tuples.
+    """
+    with open(filename, 'rb') as f:
+        # Empty files can't be mapped (and aren't maze files anyway).
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise MazeFileError("File is too short to be a maze file")
+        # The mapping stays valid after the file itself is closed.
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    header = read_header(data)
+    offset = _read_sprites(data, header)
+    _check_points(header)
+
+    width, height = header['width'], header['height']
+    if len(data) - offset != (width * height + 1) // 2:
+        raise MazeFileError("Maze data is truncated")
+
+    grid = MappedMazeGrid(data, offset, width, height)
+    grid.start = header['start']
+    grid.finish = header['finish']
+    return grid, header
+
+def read_maze(f):
+    """
+    Reads a maze from the given binary file object, returning a (MazeGrid, header)
+    tuple. The header dict also gets a 'sprites' list of (type, x, y) tuples.
+    """
+    data = f.read()
+    header = read_header(data)
+    offset = _read_sprites(data, header)
+    _check_points(header)
+
+    width, height = header['width'], header['height']
+    packed = data[offset:]
+    if len(packed) != (width * height + 1) // 2:
+        raise MazeFileError("Maze data is truncated")
+
+    grid = MazeGrid(width, height, unpack_cells(packed, width * height))
+    grid.start = header['start']
+    grid.finish = header['finish']
+    return grid, header
@@ -0,0 +1,316 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Compact maze grid storage for TrulyAmazed.
+
+Every cell of the maze is stored as a single byte, of which the lower 4 bits
+determine which sides of the cell are open (i.e. have NO wall blocking movement).
+"""
+import re
+from array import array
+
+# Bit values for each direction. The order matches mazemaker.directions.
+NORTH = 1
+WEST = 2
+SOUTH = 4
+EAST = 8
+ALL_DIRECTIONS = NORTH | WEST | SOUTH | EAST
+
+direction_bits = {'north': NORTH, 'west': WEST, 'south': SOUTH, 'east': EAST}
+bit_directions = {bit: direction for direction, bit in direction_bits.items()}
+opposite_bits = {NORTH: SOUTH, SOUTH: NORTH, WEST: EAST, EAST: WEST}
+
+# (x, y) offsets for moving one point in each direction.
+bit_offsets = {NORTH: (0, -1), WEST: (-1, 0), SOUTH: (0, 1), EAST: (1, 0)}
+
+# Lookup table mapping each possible 4-bit value to the set of direction names
+# it represents. This lets MazeGridPoint.paths avoid rebuilding sets bit by bit.
+_paths_table = tuple(frozenset(direction for direction, bit in direction_bits.items() if value & bit)
+                     for value in range(ALL_DIRECTIONS+1))
+
+# Translation table marking the 4 single-path values (dead ends) with 1.
+_dead_end_table = bytes(1 if value in (NORTH, WEST, SOUTH, EAST) else 0 for value in range(256))
+_dead_end_pattern = re.compile(b'\x01')
+
+# Translation tables reducing each point to 1 or 0, depending on whether it has a
+# path in the given direction.
+_bit_tables = {bit: bytes(1 if value & bit else 0 for value in range(256)) for bit in bit_offsets}
+# Runs of points without a path in some direction (after translating with the above).
+_wall_run_pattern = re.compile(b'\x00+')
+
+def to_bit(direction):
+    """Converts a direction name (or an existing direction bit) to its bit value."""
+    if isinstance(direction, int):
+        return direction
+    return direction_bits[direction.lower()]
+
+class MazeGridPoint():
+    """
+    Lightweight view representing a single point of the maze.
+
+    Points don't store any state themselves: paths and start/finish/selection
+    flags are all read from (and written to) the MazeGrid they belong to. This
+    means points can be created on demand and thrown away freely.
+    """
+    __slots__ = ('grid', 'x', 'y')
+
+    def __init__(self, grid, x, y):
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+    @property
+    def paths(self):
+        """Returns the set of directions that should NOT have walls blocking movement."""
+        return _paths_table[self.grid.cell(self.x, self.y)]
+
+    def _get_flag(self, name):
+        return getattr(self.grid, name) == (self.x, self.y)
+
+    def _set_flag(self, name, value):
+        if value:
+            setattr(self.grid, name, (self.x, self.y))
+        elif self._get_flag(name):
+            # Only clear the flag if it is currently set to this point.
+            setattr(self.grid, name, None)
+
+    is_start = property(lambda self: self._get_flag('start'),
+                        lambda self, value: self._set_flag('start', value))
+    is_finish = property(lambda self: self._get_flag('finish'),
+                         lambda self, value: self._set_flag('finish', value))
+    is_selected = property(lambda self: self._get_flag('selected'),
+                           lambda self, value: self._set_flag('selected', value))
+
+    def __repr__(self):
+        return 'MazeGridPoint(%s, %s)' % (self.x, self.y)
+
+    def __len__(self):
+        return len(self.__repr__())
+
+    def __eq__(self, other):
+        return self.x == other.x and self.y == other.y
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def center(self, *args, **kwargs):
+        return self.__repr__().center(*args, **kwargs)
+
+class MazeGrid():
+    """
+    Maze grid storing 4 wall bits per cell in a flat bytearray (row-major order).
+    """
+
+    def __init__(self, width, height, cells=None):
+        self.width = width
+        self.height = height
+
+        if cells is None:
+            cells = bytearray(width * height)
+        elif len(cells) != width * height:
+            raise ValueError("Cell buffer size does not match the grid size.")
+        # This can be any writable buffer of bytes (bytearray, memoryview, mmap, ...)
+        self.cells = cells
+
+        # Start, finish, and selected points are stored as (x, y) tuples (or None),
+        # instead of as flags on each individual point.
+        self.start = None
+        self.finish = None
+        self.selected = None
+
+    def __repr__(self):
+        return 'MazeGrid(%s, %s)' % (self.width, self.height)
+
+    def __len__(self):
+        return self.width * self.height
+
+    def in_bounds(self, x, y):
+        """Returns whether the given coordinates are inside the grid."""
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def index(self, x, y):
+        """Returns the index of the given coordinates in the flat cell buffer."""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError("Point (%s, %s) is outside the grid." % (x, y))
+        return y * self.width + x
+
+    def coords(self, index):
+        """Returns the (x, y) coordinates for the given flat cell index."""
+        return (index % self.width, index // self.width)
+
+    def cell(self, x, y):
+        """Returns the raw path bits of the given point."""
+        return self.cells[self.index(x, y)]
+
+    def has_path(self, x, y, direction):
+        """
+        Returns whether the given point has an open path in the given direction.
+        The direction can be either a direction name or a direction bit.
+        """
+        return bool(self.cells[self.index(x, y)] & to_bit(direction))
+
+    def carve(self, x, y, direction):
+        """
+        Opens a path from the given point in the given direction, along with the
+        matching path on the neighbouring point. Returns the neighbour's coordinates.
+        """
+        bit = to_bit(direction)
+        xoffset, yoffset = bit_offsets[bit]
+        newx, newy = x + xoffset, y + yoffset
+
+        index = self.index(x, y)
+        new_index = self.index(newx, newy)
+        self.cells[index] |= bit
+        self.cells[new_index] |= opposite_bits[bit]
+        return (newx, newy)
+
+    def row_cells(self, top, bottom):
+        """
+        Returns the path bits of the rows from top to bottom (exclusive) as a
+        bytes-like object, one byte per point. Unlike slicing cells directly, this
+        works the same for every kind of grid (e.g. memory-mapped ones).
+        """
+        cells = self.cells[top*self.width:bottom*self.width]
+        if not isinstance(cells, (bytes, bytearray)):
+            # Other buffers (e.g. memoryviews) can't be translated directly.
+            cells = bytes(cells)
+        return cells
+
+    def get(self, x, y):
+        """
+        Returns a MazeGridPoint view for the given coordinates, raising IndexError
+        if they are out of bounds.
+        """
+        self.index(x, y)
+        return MazeGridPoint(self, x, y)
+
+    def by_rows(self, left=0, top=0, right=None, bottom=None):
+        """
+        Iterates over the maze one row of MazeGridPoint views at a time. A rectangular
+        area can be given to only iterate over part of the maze (right and bottom
+        are exclusive).
+        """
+        right = self.width if right is None else min(right, self.width)
+        bottom = self.height if bottom is None else min(bottom, self.height)
+        for y in range(max(0, top), bottom):
+            yield [MazeGridPoint(self, x, y) for x in range(max(0, left), right)]
+
+    def all_items(self):
+        """Returns a list of MazeGridPoint views for every point in the maze."""
+        return [MazeGridPoint(self, x, y) for y in range(self.height) for x in range(self.width)]
+
+    def dead_ends(self):
+        """Returns the flat indices of all dead ends (points with exactly one path)."""
+        # Translate dead ends to b'\x01' and everything else to b'\x00', and let the
+        # regex engine find them: this keeps the per-cell loop out of Python.
+        marked = bytes(self.cells).translate(_dead_end_table)
+        return [match.start() for match in _dead_end_pattern.finditer(marked)]
+
+    def wall_segments(self, left=0, top=0, right=None, bottom=None):
+        """
+        Returns the walls of the maze as a list of (x1, y1, x2, y2) line segments in
+        grid corner coordinates: the top left corner of point (x, y) is (x, y), and
+        its bottom right corner is (x+1, y+1). Walls continuing in a straight line
+        are merged into a single segment.
+
+        A rectangular area can be given to only return the walls around the points
+        in it (right and bottom are exclusive, as in by_rows()).
+        """
+        width, height = self.width, self.height
+        left, top = max(0, left), max(0, top)
+        right = width if right is None else min(right, width)
+        bottom = height if bottom is None else min(bottom, height)
+        if left >= right or top >= bottom:
+            return []
+        # Only the rows in the area are needed; y - top is a row within them.
+        cells = self.row_cells(top, bottom)
+        segments = []
+
+        # Horizontal walls along the top of every row, and the bottom of the last one.
+        # Rows are translated to 1 (path) or 0 (wall), so that the regex engine can
+        # find the runs of walls.
+        for y in range(top, bottom + 1):
+            row = y - top
+            if y < bottom:
+                row = cells[row*width+left:row*width+right].translate(_bit_tables[NORTH])
+            else:
+                row = cells[(row-1)*width+left:(row-1)*width+right].translate(_bit_tables[SOUTH])
+            segments.extend((left + match.start(), y, left + match.end(), y)
+                            for match in _wall_run_pattern.finditer(row))
+
+        # Likewise for vertical walls along the left of every column, and the right
+        # of the last one.
+        last = (bottom - top - 1) * width
+        for x in range(left, right + 1):
+            if x < right:
+                column = cells[x:last+x+1:width].translate(_bit_tables[WEST])
+            else:
+                column = cells[x-1:last+x:width].translate(_bit_tables[EAST])
+            segments.extend((x, top + match.start(), x, top + match.end())
+                            for match in _wall_run_pattern.finditer(column))
+
+        return segments
+
+    def distances(self, x, y):
+        """
+        Returns the length of the path from the given point to every other point
+        in the maze (or -1 for unreachable points), as a flat array of integers.
+        This is a breadth-first search over the whole maze.
+        """
+        width = self.width
+        cells = self.cells
+
+        distances = array('i', [-1]) * len(self)
+        start = self.index(x, y)
+        distances[start] = 0
+
+        offsets = ((NORTH, -width), (WEST, -1), (SOUTH, width), (EAST, 1))
+        # Iterating over a list while appending to it visits the new items too,
+        # which makes it a perfectly good queue.
+        queue = [start]
+        for index in queue:
+            value = cells[index]
+            distance = distances[index] + 1
+            for bit, offset in offsets:
+                if value & bit:
+                    neighbour = index + offset
+                    if distances[neighbour] < 0:
+                        distances[neighbour] = distance
+                        queue.append(neighbour)
+        return distances
+
+    def is_perfect(self):
+        """
+        Returns whether the maze is perfect: every path is open from both sides,
+        and there is exactly one path between any two points (i.e. the maze is
+        connected and has no loops).
+        """
+        width, count = self.width, len(self)
+        cells = bytes(self.cells)
+        north, west, south, east = (cells.translate(_bit_tables[bit]) for bit in (NORTH, WEST, SOUTH, EAST))
+
+        # Paths must match up with the neighbour's path in the opposite direction,
+        # and there can't be any paths leading out of the maze.
+        if east[:-1] != west[1:] or south[:-width] != north[width:]:
+            return False
+        if any(east[width-1::width]) or any(west[0::width]) or any(south[-width:]) or any(north[:width]):
+            return False
+
+        # A connected maze with exactly one path less than it has points is a tree.
+        if east.count(1) + south.count(1) != count - 1:
+            return False
+        return min(self.distances(0, 0)) >= 0
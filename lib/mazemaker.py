@@ -17,189 +17,248 @@
 ###
 
 """
-Generates mazes using a depth-first search algorithm.
+Generates mazes using one of the algorithms in lib.algorithms.
 """
 import sys
 import random
 
-from simplegrid import grid
 from lib.util import *
+from lib.mazegrid import MazeGrid, MazeGridPoint
+from lib.algorithms import algorithms, eller_rows
+from lib.mazecache import MazeCache
+from lib.parallel import generate_parallel, shared_memory
+from lib import mazefile, solver
+from lib.lca import LCAIndex
 
 directions = ("north", "west", "south", "east")
 
-class MazeGridPoint():
+def use_parallel(width, height):
     """
-    Class representing a single point of the maze.
+    Returns whether mazes of the given size should be generated in parallel (see
+    parallel_generation_threshold in config.py). Everything that generates or
+    looks up mazes should decide this the same way, since it changes the maze
+    (and its cache key).
     """
+    return bool(parallel_generation_threshold) and width * height >= parallel_generation_threshold
 
-    def __init__(self, x, y, paths):
-        # Determines which directions of the grid point should
-        # NOT have walls blocking movement.
-        self.paths = set(paths)
+class GenerationCancelled(Exception):
+    """Raised (by progress callbacks) to abort generating a maze."""
 
-        self.x = x
-        self.y = y
-
-        self.is_finish = False
-        self.is_start = False
-        self.is_selected = False
-
-    def __repr__(self):
-        #return '%s' % ','.join(self.paths)
-        return 'MazeGridPoint(%s, %s)' % (self.x, self.y)
-
-    def __len__(self):
-        return len(self.__repr__())
+class MazeGenerator():
+    """
+    Maze generator. The algorithm used can be any of the ones registered in
+    lib.algorithms (depth-first search by default).
+    """
 
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
+    def __init__(self, width=10, height=10, seed=None, algorithm='depth_first', cache=None,
+                 parallel=False, processes=None):
+        self.width = width
+        self.height = height
 
-    def __hash__(self):
-        return hash((self.x, self.y))
+        if algorithm not in algorithms:
+            raise ValueError("Unknown maze generation algorithm %r" % algorithm)
+        self.algorithm = algorithm
+
+        # Each generator has its own random number generator, so that the same
+        # seed always produces the same maze. If no seed is given, pick one at
+        # random so that it can still be recorded and replayed later.
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.random = random.Random(seed)
+
+        # Optional MazeCache instance to look up and store generated mazes in.
+        self.cache = cache
+
+        # Whether to split the maze into regions generated by multiple processes
+        # (see lib.parallel), and how many processes to use (default: all CPUs).
+        # This is only available on Python 3.8+.
+        self.parallel = parallel and shared_memory is not None
+        self.processes = processes
+
+        # Keep track of which points are dead ends (end points), as flat
+        # grid indices. This will help in randomly generating a finish later on.
+        # These are found lazily (see the dead_ends property).
+        self._dead_ends = None
+        self._end_points = None
+
+        # Cached breadth-first search results, as (grid, origin index, distances)
+        # tuples: the last search done, and the one from the finish.
+        self._last_distances = None
+        self._finish_distances = None
+        self._lca_index = None
+
+        # Sprite spawns as (sprite type, x, y) tuples, set when loading a maze
+        # file that has them. See lib.mazefile for the sprite types.
+        self.sprite_spawns = []
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Loads a maze saved in the .tamaze format (see lib.mazefile). The file is
+        memory-mapped, and only unpacked once something needs the whole maze.
+        """
+        grid, header = mazefile.load_maze(filename)
+        algorithm = header['algorithm'] if header['algorithm'] in algorithms else 'depth_first'
+
+        mg = cls(grid.width, grid.height, seed=header['seed'], algorithm=algorithm)
+        mg.static_start = mg.static_finish = None
+        mg.grid = grid
+        mg.start = grid.get(*header['start'])
+        mg.finish = grid.get(*header['finish'])
+        mg.sprite_spawns = header['sprites']
+        debug_print("Loaded %sx%s maze from %s" % (grid.width, grid.height, filename))
+        return mg
+
+    def save(self, filename, sprites=()):
+        """
+        Saves the generated maze to the given filename in the .tamaze format,
+        along with the given sprite spawns ((sprite type, x, y) tuples).
+        """
+        seed = self.seed if isinstance(self.seed, int) else 0
+        with open(filename, 'wb') as f:
+            mazefile.write_maze(f, self.grid, (self.start.x, self.start.y), (self.finish.x, self.finish.y),
+                                seed=seed, algorithm=self.algorithm, sprites=sprites)
+
+    @property
+    def dead_ends(self):
+        """Returns the flat grid indices of all dead ends in the maze."""
+        if self._dead_ends is None:
+            # Dead ends (end points) are the points with exactly one open path.
+            self._dead_ends = self.grid.dead_ends()
+        return self._dead_ends
+
+    @property
+    def end_points(self):
+        """Returns MazeGridPoint views for all dead ends in the maze."""
+        if self._end_points is None:
+            width = self.width
+            self._end_points = [MazeGridPoint(self.grid, index % width, index // width)
+                                for index in self.dead_ends]
+        return self._end_points
+
+    @staticmethod
+    def iter_rows(width, seed=None, height=None):
+        """
+        Streams a maze row by row using Eller's algorithm, yielding each finished
+        row as a bytearray of path bits (see lib.mazegrid for the bit values).
+        Only O(width) memory is used, no matter how tall the maze is.
 
-    def center(self, *args, **kwargs):
-        return self.__repr__().center(*args, **kwargs)
+        If height is None, rows are generated forever and it is up to the caller
+        to stop iterating.
+        """
+        return eller_rows(width, height, random.Random(seed))
+
+    def _generate(self, start_point=None, progress=None):
+        """Carves out a new maze using the chosen algorithm."""
+        if self.parallel:
+            debug_print("Generating maze using %s in parallel" % self.algorithm)
+            self.grid = generate_parallel(self.width, self.height, self.seed, self.algorithm,
+                                          processes=self.processes, progress=progress)
+        else:
+            self.grid = MazeGrid(self.width, self.height)
+            debug_print("Generating maze using %s, starting from %s" % (self.algorithm, start_point))
+            algorithms[self.algorithm](self.grid, self.random, start_point, progress)
 
-class MazeGenerator():
-    """Depth-first search maze generator."""
+        self._dead_ends = self._end_points = None
 
-    def __init__(self, width=10, height=10):
-        self.width = width
-        self.height = height
+    def cache_key(self):
+        """
+        Returns the MazeCache key for the maze generated by this generator, once
+        generate() has been called.
+        """
+        return MazeCache.make_key(self.algorithm, self.width, self.height, self.seed,
+                                  self.static_start, self.static_finish, self.parallel)
 
-        # Keep track of which points are dead ends (end points).
-        # This will help in randomly generating a finish later on.
-        self.end_points = set()
+    def _distances_from(self, index):
+        """
+        Returns the path length from the given point (a flat index) to every point,
+        reusing the previous search if it was from the same point.
+        """
+        cached = self._last_distances
+        if cached is None or cached[0] is not self.grid or cached[1] != index:
+            cached = self._last_distances = (self.grid, index, self.grid.distances(*self.grid.coords(index)))
+        return cached[2]
 
-    def _unvisited_directions_for(self, point):
+    @property
+    def finish_distances(self):
         """
-        Returns the directions of all unvisited maze points adjacent to the
-        point given.
+        Returns the path length from every point in the maze to the finish, as a
+        flat array of integers (see MazeGrid.distances). This is computed once per
+        maze, by generate() (or when first needed, for mazes loaded from files).
         """
-        # Convert the list of directions into a set for error-free removal
-        unvisited = set(directions)
-
-        x, y = point
-        #debug_print("Checking for unvisited directions for (%s, %s)" % (x, y))
-
-        if x == 0:
-            # If the x value is at the left-hand border of the grid,
-            # going left will not be possible.
-            unvisited.discard('west')
-
-        elif x == self.grid.width-1:
-            # Similarly, if the x value is at the right-hand border of the
-            # grid, you won't be able to move right.
-            unvisited.discard('east')
-
-        if y == 0:
-            # Y value is at the top of the grid, so disallow moving upwards any
-            # further.
-            unvisited.discard('north')
-
-        elif y == self.grid.height-1:
-            # Y value is at the bottom of the grid; disallow moving downwards.
-            unvisited.discard('south')
-
-        for direc in unvisited.copy():
-            # After any border conditions are checked, we should eliminate all
-            # directions where the point there has already been visited.
-            neighbour_point = self._advance(point, direc)
-            if self.grid.get(*neighbour_point):
-                # Python note: using *listname as a function argument automatically expands
-                # that list's contents and passes them to the function as arguments.
-                # This is identical in this case to: self.grid.get(neighbour_point[0], neighbour_point[1])
-                unvisited.remove(direc)
-
-        # Finally, convert the directions set back into a list(), so
-        # random.choice() can use it.
-        return list(unvisited)
-
-    def _advance(self, point, direction):
+        finish = self.grid.index(self.finish.x, self.finish.y)
+        cached = self._finish_distances
+        if cached is None or cached[0] is not self.grid or cached[1] != finish:
+            cached = self._finish_distances = (self.grid, finish, self._distances_from(finish))
+        return cached[2]
+
+    def steps_to_finish(self, x, y):
+        """Returns the path length from the given point to the finish."""
+        return self.finish_distances[self.grid.index(x, y)]
+
+    def _pick_endpoints(self, start, finish, min_difficulty=0):
         """
-        Returns the coordinate one away in the direction given, from the
-        point given.
+        Picks start and finish points (as flat indices) among the maze's dead ends.
+        Start or finish can be given to fix that point in place.
+
+        If min_difficulty is given, the points are chosen so that the path between
+        them is at least that long, or as long as possible if no such pair exists.
+        This only takes a few breadth-first searches, i.e. O(n) time.
         """
-        direction = direction.lower()
-        x, y = point
-
-        if direction == 'east':
-            return (x+1, y)
-        elif direction == 'west':
-            return (x-1, y)
-        elif direction == 'north':
-            return (x, y-1)
-        elif direction == 'south':
-            return (x, y+1)
-        else:
-            raise ValueError("Unknown direction given.")
-
-    def _generate(self, start_point=None):
-        # Initialize an instance of the Grid class.
-        self.grid = grid.Grid(self.width, self.height)
-
-        # The first "current point" is the start point. This will change
-        # as the generator moves from point to point.
-        current_point = start_point
-        x, y = current_point
-        debug_print("current point is (%s, %s)" % (x, y))
-
-        # Keep track of which points we've visited. When we reach a point
-        # that no longer has any valid directions to go in, we return to
-        # the point last visited before that.
-        stack = [current_point]
-
-        # Create the maze grid point instance for the starting point:
-        # it will have no paths open by default, but more will be
-        # added in the loop below.
-        mazepoint = MazeGridPoint(x, y, [])
-        self.grid.set(x, y, mazepoint)
-
-        while stack:
-            # While there are empty spaces beside a grid point, randomly
-            # choose an unvisited adjacent grid point to advance to.
-            try:
-                valid_directions = self._unvisited_directions_for(current_point)
-                direction = random.choice(valid_directions)
-            except IndexError:
-                # If there are no valid directions to go in (i.e. a dead end)
-                # we should move back to the last point in the stack.
-                self.end_points.add(new_mazepoint)
-
-                new_point = stack.pop()
-            else:
-                # Before moving, make sure there is no wall between the current
-                # point and the next point. In other words, add a path between
-                # the last path and the current one.
-                mazepoint = self.grid.get(x, y)
-                mazepoint.paths.add(direction)
-
-                # Get the new point by advancing 1 in the direction we chose.
-                new_point = self._advance(current_point, direction)
-                newx, newy = new_point
-
-                # Add this new point to the stack: the list of points that we've
-                # visited in the current path.
-                stack.append(new_point)
-
-                # Now, create a MazeGridPoint instance to represent the new point
-                # we picked. The argument to MazeGridPoint() defines which sides
-                # of the point should have a wall around it.
-
-                # Make sure the direction we came to this point FROM is open.
-                # This will be the opposite direction of the one we're advancing
-                # in. For example, if we're moving upwards from point 1 to point 2,
-                # the NORTH border of point 1 and the SOUTH border of point 2
-                # should be open.
-                new_mazepoint = MazeGridPoint(newx, newy, [opposite(direction)])
-                self.grid.set(newx, newy, new_mazepoint)
-
-            current_point = new_point
-            x, y = current_point
-
-    def generate(self, start_point=None, end_point=None):
+        if start is not None and finish is not None:
+            return start, finish
+
+        dead_ends = self.dead_ends
+        if start is None and finish is None:
+            if min_difficulty <= 0:
+                # No minimum difficulty: any two dead ends will do.
+                start, finish = self.random.sample(dead_ends, 2)
+                return start, finish
+
+            # Pick a random dead end, and then a random dead end far enough from it.
+            start = self.random.choice(dead_ends)
+            distances = self._distances_from(start)
+            candidates = [index for index in dead_ends if distances[index] >= min_difficulty]
+
+            if not candidates:
+                # No dead end is far enough from this one. In a perfect maze, the point
+                # furthest from any point is an end of the longest path in the maze,
+                # so if trying again from there doesn't work, nothing will.
+                start = max(dead_ends, key=distances.__getitem__)
+                distances = self._distances_from(start)
+                candidates = [index for index in dead_ends if distances[index] >= min_difficulty] or \
+                    [max(dead_ends, key=distances.__getitem__)]
+
+            finish = self.random.choice(candidates)
+            # Don't always put the start at the same end of the path.
+            if self.random.random() < 0.5:
+                start, finish = finish, start
+            return start, finish
+
+        # Only one point is fixed: pick the other one among the dead ends that are
+        # far enough away from it.
+        fixed = finish if start is None else start
+        distances = self._distances_from(fixed)
+        options = [index for index in dead_ends if index != fixed]
+        candidates = [index for index in options if distances[index] >= min_difficulty] or \
+            [max(options, key=distances.__getitem__)]
+        other = self.random.choice(candidates)
+
+        if start is None:
+            return other, fixed
+        return fixed, other
+
+    def generate(self, start_point=None, end_point=None, min_difficulty=0, progress=None):
         """
         Generates the maze, with optional fixed start and end points.
+
+        min_difficulty sets the minimum length of the path between the start and
+        finish points. Start and finish are chosen in a single pass over the maze,
+        so this never requires generating the maze again.
+
+        If progress is given, it is called periodically with the amount of points
+        carved so far and the total. It can raise GenerationCancelled to abort.
         """
 
         # Start point defaults to the top left of the maze.
@@ -213,54 +272,97 @@ class MazeGenerator():
             # TODO: make this more intelligent.
             self.static_start = start_point = (0, 0)
 
-        self._generate(start_point)
-
         self.static_finish = end_point  # Set static_finish if exists
 
-        # Randomly choose two dead ends from the maze, unless a static start
-        # or finish is being used.
-        while True:
-            try:
-                self.start, self.finish = random.sample(self.end_points, 2)
-                if self.start == self.finish:
-                    raise ValueError("Start and finish at the same point")
-            except (IndexError, ValueError):
-                debug_print("Maze was not random enough, regenerating!")
-                self._generate(start_point)
-            else:
-                break
-
-        debug_print("List of end points: %s" % self.end_points)
-        debug_print("Choosing %s and %s as our start and finish points" % (self.start, self.finish))
+        # Reuse a previously generated maze with the same settings if there is one.
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache_key()
+            self.grid = self.cache.get(cache_key)
+
+        if cache_key is not None and self.grid is not None:
+            debug_print("Using cached maze for %s" % (cache_key,))
+            self._dead_ends = self._end_points = None
+        else:
+            self._generate(start_point, progress)
+            if cache_key is not None:
+                self.cache.put(cache_key, self.grid)
+
+        # Start and finish points are picked using a separate random number generator
+        # (derived from the same seed), so that cached mazes get the same points as
+        # freshly generated ones.
+        self.random.seed('%s-endpoints' % self.seed)
+
+        if len(self.dead_ends) < 2:
+            # Only possible for mazes that are a single point in size.
+            raise ValueError("Maze is too small to have separate start and finish points.")
+        debug_print("Found %s end points" % len(self.dead_ends))
 
         # Static start or finish points will override the random picking.
-        try:
-            if self.static_start:
-                self.start = self.grid.get(*self.static_start)
-                debug_print("Setting start point to (%s, %s) via static start" % (self.static_start[0], self.static_start[1]))
-        except IndexError:
-            # Unless they're outside the boundaries of the maze... For now, it'll just
-            # ignore the mismatched setting. TODO: make this more intelligent
-            pass
+        start = finish = None
+        if self.static_start:
+            start = self.grid.index(*self.static_start)
+            debug_print("Setting start point to (%s, %s) via static start" % (self.static_start[0], self.static_start[1]))
 
         try:
             if self.static_finish:
-                self.finish = self.grid.get(*self.static_finish)
+                finish = self.grid.index(*self.static_finish)
                 debug_print("Setting finish point to (%s, %s) via static finish" % (self.static_finish[0], self.static_finish[1]))
         except IndexError:
+            # Unless they're outside the boundaries of the maze... For now, it'll just
+            # ignore the mismatched setting. TODO: make this more intelligent
             pass
 
-        # Set the is_finish or is_start values of the point to True. That's it!
+        start, finish = self._pick_endpoints(start, finish, min_difficulty)
+        self.start = self.grid.get(*self.grid.coords(start))
+        self.finish = self.grid.get(*self.grid.coords(finish))
+        debug_print("Choosing %s and %s as our start and finish points" % (self.start, self.finish))
+
+        # Set the is_finish or is_start values of the point to True.
         self.finish.is_finish = True
         self.start.is_start = True
 
+        # Find the path length from every point to the finish now, while still in the
+        # background (for big mazes), instead of when the game first needs it.
+        self.finish_distances
+
         return self.grid
 
-    def distance(self, point1, point2):
+    def solve(self, method='bfs'):
+        """
+        Returns the path from the start to the finish as a list of (x, y) tuples,
+        using the given solver from lib.solver. Solutions are cached.
+        """
+        kwargs = {}
+        if method == 'astar':
+            kwargs['heuristic'] = self.distance
+        return solver.solve(self.grid, (self.start.x, self.start.y), (self.finish.x, self.finish.y),
+                            method, **kwargs)
+
+    @property
+    def lca_index(self):
+        """
+        Returns the LCAIndex (see lib.lca) for the current maze, building it the
+        first time it is needed.
+        """
+        if self._lca_index is None or self._lca_index.grid is not self.grid:
+            self._lca_index = LCAIndex(self.grid)
+        return self._lca_index
+
+    def distance(self, point1, point2, metric='manhattan'):
         """
-        Returns the sum of the vertical and horizontal distances between the
-        two points given.
+        Returns the distance between the two points given.
+
+        With the 'manhattan' metric (the default), this is the sum of the vertical
+        and horizontal distances between them, ignoring walls. With the 'path'
+        metric, this is the length of the path between them through the maze,
+        which takes O(1) time once the maze's LCA index is built.
         """
+        if metric == 'path':
+            return self.lca_index.distance(point1.x, point1.y, point2.x, point2.y)
+        elif metric != 'manhattan':
+            raise ValueError("Unknown distance metric %r" % metric)
+
         x_distance = abs(point1.x - point2.x)
         y_distance = abs(point1.y - point2.y)
         return x_distance + y_distance
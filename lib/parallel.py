@@ -0,0 +1,130 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Parallel generation of a single maze across multiple processes.
+
+The maze is split into horizontal strips (regions), each of which is generated
+as a separate perfect maze by a worker process, directly into one block of shared
+memory. The strips are then stitched together by opening exactly one passage
+between each pair of neighbouring strips. Since the strips form a chain (which is
+a spanning tree of the regions), the result is still a perfect maze.
+
+The regions generated only depend on the seed and the amount of regions, so the
+same seed gives the same maze no matter how many processes are used.
+"""
+
+import random
+import multiprocessing
+import concurrent.futures
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+from .mazegrid import MazeGrid, NORTH, SOUTH
+from .algorithms import algorithms
+from .util import *
+
+# Default amount of regions to split mazes into. This is fixed (instead of being
+# based on the amount of CPUs) so that generated mazes are the same everywhere.
+DEFAULT_REGIONS = 16
+
+def _generate_region(name, width, top, bottom, algorithm, seed):
+    """Generates the rows top to bottom (exclusive) of the maze in shared memory."""
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        cells = memory.buf[top*width:bottom*width]
+        grid = MazeGrid(width, bottom - top, cells)
+        rng = random.Random(seed)
+        start_point = (rng.randrange(width), rng.randrange(bottom - top))
+        algorithms[algorithm](grid, rng, start_point)
+
+        # The view into shared memory has to be released before it can be closed.
+        del grid
+        cells.release()
+    finally:
+        memory.close()
+    return (bottom - top) * width
+
+def _split(height, regions):
+    """Returns (top, bottom) row ranges splitting the given height into regions."""
+    regions = max(1, min(regions, height))
+    bounds = [height * region // regions for region in range(regions + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+def generate_parallel(width, height, seed, algorithm='depth_first', processes=None,
+                      regions=DEFAULT_REGIONS, progress=None):
+    """
+    Generates a maze of the given size using multiple processes, returning a
+    MazeGrid. processes defaults to the amount of CPUs.
+
+    If progress is given, it is called with the amount of points carved so far and
+    the total every time a region is finished; it can raise an exception (e.g.
+    mazemaker.GenerationCancelled) to abort.
+    """
+    if shared_memory is None:
+        raise RuntimeError("Parallel generation requires multiprocessing.shared_memory (Python 3.8+)")
+    if algorithm not in algorithms:
+        raise ValueError("Unknown maze generation algorithm %r" % algorithm)
+
+    strips = _split(height, regions)
+    total = width * height
+    rng = random.Random('%s-regions' % seed)
+    region_seeds = [rng.getrandbits(64) for _ in strips]
+
+    memory = shared_memory.SharedMemory(create=True, size=total)
+    try:
+        # Shared memory isn't guaranteed to start out zeroed everywhere.
+        memory.buf[:total] = bytes(total)
+
+        # Use the spawn method to start workers, since this may be called from a
+        # running Qt application, which isn't safe to fork.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        futures = []
+        try:
+            for (top, bottom), region_seed in zip(strips, region_seeds):
+                futures.append(executor.submit(_generate_region, memory.name, width, top, bottom,
+                                               algorithm, region_seed))
+            carved = 0
+            for future in concurrent.futures.as_completed(futures):
+                carved += future.result()
+                if progress:
+                    progress(carved, total)
+        except BaseException:
+            # Don't wait for the remaining regions if we're giving up. (This is what
+            # shutdown(cancel_futures=True) does, but that needs Python 3.9.)
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+
+        cells = bytearray(memory.buf[:total])
+    finally:
+        memory.close()
+        memory.unlink()
+
+    # Stitch each strip to the one below it with a single passage.
+    for _, bottom in strips[:-1]:
+        x = rng.randrange(width)
+        cells[(bottom - 1) * width + x] |= SOUTH
+        cells[bottom * width + x] |= NORTH
+
+    debug_print("generate_parallel: generated %sx%s maze in %s regions" % (width, height, len(strips)))
+    return MazeGrid(width, height, cells)
@@ -0,0 +1,120 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Background maze prefetching for TrulyAmazed.
+
+Mazes are generated in a separate worker process (so that generation doesn't
+compete with the GUI for the interpreter lock), and the results are stored in a
+MazeCache. The game then picks them up instantly when it generates a maze with
+the same settings.
+"""
+
+import multiprocessing
+import concurrent.futures
+
+from .mazegrid import MazeGrid
+from .mazemaker import MazeGenerator, use_parallel
+from .util import *
+
+def _generate_grid(width, height, seed, algorithm, static_start, static_finish):
+    """Generates a maze in the worker process, returning its cache key and cell data."""
+    # Generate it the same way the game would, so that it's found in the cache.
+    mg = MazeGenerator(width, height, seed=seed, algorithm=algorithm, parallel=use_parallel(width, height))
+    mg.generate(start_point=static_start, end_point=static_finish)
+    return mg.cache_key(), bytes(mg.grid.cells)
+
+class LevelPrefetcher():
+    """
+    Generates one upcoming maze at a time in a background process.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._executor = None
+        self._future = None
+
+        # The level number and seed of the maze being prefetched.
+        self.level = None
+        self.seed = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Use the spawn method to start workers, since forking a running
+            # Qt application isn't safe.
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def prefetch(self, level, width, height, seed, algorithm, static_start=None, static_finish=None):
+        """
+        Starts generating the maze for the given level number in the background,
+        cancelling any previous prefetch.
+        """
+        self.cancel()
+        debug_print("LevelPrefetcher: prefetching level %s (%sx%s, seed %s)" % (level, width, height, seed))
+        self.level = level
+        self.seed = seed
+        self._future = self._get_executor().submit(_generate_grid, width, height, seed, algorithm,
+                                                   static_start, static_finish)
+
+    def pending(self, level):
+        """
+        Returns whether the maze of the given level number is still being prefetched.
+        Callers should wait for it (without blocking, e.g. by polling this) instead
+        of generating the same maze a second time.
+        """
+        return self._future is not None and level == self.level and not self._future.done()
+
+    def collect(self, level):
+        """
+        Adds the prefetched maze of the given level number (if there is one) to the
+        cache. Returns the seed to generate that level with, or None if the level
+        wasn't prefetched, prefetching it failed, or it isn't ready yet (see
+        pending()). This never waits for the worker.
+        """
+        if self._future is None or level != self.level or not self._future.done():
+            return None
+
+        future = self._future
+        seed = self.seed
+        self._future = None
+        try:
+            key, data = future.result()
+        except Exception as e:
+            debug_print("LevelPrefetcher: prefetching level %s failed: %s" % (level, e))
+            return None
+
+        width, height = key[1], key[2]
+        self.cache.put(key, MazeGrid(width, height, bytearray(data)))
+        return seed
+
+    def cancel(self):
+        """
+        Cancels the current prefetch. If the worker has already started on it,
+        its result is simply discarded.
+        """
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+        self.level = self.seed = None
+
+    def shutdown(self):
+        """Cancels any prefetching and stops the worker process."""
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
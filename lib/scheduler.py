@@ -0,0 +1,176 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Fixed-timestep game loop for TrulyAmazed.
+
+Instead of giving every sprite its own timer, everything that happens over time
+is registered as a task on one GameLoop, with an interval in ticks. The loop is
+driven by a single timer firing once per frame: each frame runs as many ticks as
+are due (so the game runs at the same speed no matter the frame rate), and then
+repaints the game at most once.
+"""
+
+import time
+from collections import defaultdict
+
+try:
+    from PyQt5.QtCore import QTimer
+except ImportError:  # Only needed for start(); the loop can also be driven manually.
+    QTimer = None
+
+from .util import *
+
+class Task():
+    """A callback run by a GameLoop every interval ticks."""
+    __slots__ = ('callback', 'interval', 'due', 'active')
+
+    def __init__(self, callback, interval, due):
+        self.callback = callback
+        self.interval = interval
+        self.due = due
+        self.active = True
+
+    def __repr__(self):
+        return 'Task(%s, every %s ticks)' % (self.callback, self.interval)
+
+class GameLoop():
+    """
+    Fixed-timestep loop running tasks on a tick schedule.
+
+    Tasks are kept in buckets by the tick they are due on, so each tick only
+    touches the tasks that actually run on it. Removing a task just marks it
+    inactive; it is dropped when its bucket comes up.
+    """
+
+    def __init__(self, tick_length=0.01, frame_interval=16, max_ticks_per_frame=25, repaint=None):
+        # Length of a tick in seconds, and the time between frames in milliseconds.
+        self.tick_length = tick_length
+        self.frame_interval = frame_interval
+        # Limit on the ticks run in one frame, so that the loop doesn't spiral out
+        # of control if ticks take longer than they're supposed to.
+        self.max_ticks_per_frame = max_ticks_per_frame
+        # Called (at most once per frame) to repaint the game, if requested.
+        self.repaint = repaint
+
+        self.tick = 0
+        self._buckets = defaultdict(list)
+        self._task_count = 0
+        self._accumulator = 0.0
+        self._last_frame = None
+        self._repaint_requested = False
+        self._timer = None
+
+        # Statistics, see stats().
+        self.frames = 0
+        self.repaints = 0
+        self.tasks_run = 0
+        self.total_tick_time = 0.0
+        self.max_tick_time = 0.0
+
+    def __repr__(self):
+        return 'GameLoop(tick %s, %s tasks)' % (self.tick, self._task_count)
+
+    def ticks_for(self, milliseconds):
+        """Converts a time in milliseconds to a (positive) amount of ticks."""
+        return max(1, round(milliseconds / 1000 / self.tick_length))
+
+    def add(self, callback, interval):
+        """
+        Runs callback every interval ticks, starting interval ticks from now.
+        Returns a Task that can be passed to remove().
+        """
+        task = Task(callback, interval, self.tick + interval)
+        self._buckets[task.due].append(task)
+        self._task_count += 1
+        return task
+
+    def remove(self, task):
+        """Stops running the given task."""
+        if task.active:
+            task.active = False
+            self._task_count -= 1
+
+    def request_repaint(self):
+        """Requests a repaint at the end of the current frame."""
+        self._repaint_requested = True
+
+    def run_tick(self):
+        """Runs a single tick."""
+        started = time.perf_counter()
+        self.tick += 1
+        bucket = self._buckets.pop(self.tick, ())
+        for task in bucket:
+            if not task.active:
+                continue
+            task.callback()
+            self.tasks_run += 1
+            # The callback may have removed its own task.
+            if task.active:
+                task.due = self.tick + task.interval
+                self._buckets[task.due].append(task)
+
+        elapsed = time.perf_counter() - started
+        self.total_tick_time += elapsed
+        self.max_tick_time = max(self.max_tick_time, elapsed)
+
+    def advance(self, now=None):
+        """
+        Runs all ticks that are due at the given time (by default, now), then
+        repaints if anything requested it. Returns the amount of ticks run.
+        """
+        if now is None:
+            now = time.perf_counter()
+        if self._last_frame is None:
+            self._last_frame = now
+        self._accumulator += now - self._last_frame
+        self._last_frame = now
+
+        ticks = 0
+        while self._accumulator >= self.tick_length and ticks < self.max_ticks_per_frame:
+            self.run_tick()
+            self._accumulator -= self.tick_length
+            ticks += 1
+        if ticks == self.max_ticks_per_frame:
+            # We're falling behind: drop the backlog instead of trying to catch up.
+            self._accumulator = 0.0
+
+        self.frames += 1
+        if self._repaint_requested and self.repaint:
+            self._repaint_requested = False
+            self.repaints += 1
+            self.repaint()
+        return ticks
+
+    def start(self):
+        """Starts driving the loop with a Qt timer firing once per frame."""
+        if self._timer is None:
+            self._timer = QTimer()
+            self._timer.timeout.connect(self.advance)
+        self._last_frame = None
+        self._timer.start(self.frame_interval)
+
+    def stop(self):
+        """Stops the Qt timer driving the loop."""
+        if self._timer is not None:
+            self._timer.stop()
+
+    def stats(self):
+        """Returns a dict of statistics about the loop's ticks and frames."""
+        return {'ticks': self.tick, 'frames': self.frames, 'repaints': self.repaints,
+                'tasks': self._task_count, 'tasks_run': self.tasks_run,
+                'average_tick_ms': self.total_tick_time / self.tick * 1000 if self.tick else 0.0,
+                'max_tick_ms': self.max_tick_time * 1000}
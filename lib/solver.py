@@ -0,0 +1,254 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Maze solvers for TrulyAmazed.
+
+All solvers take a maze grid (see lib.mazegrid) and start and finish points as
+(x, y) tuples, and return the solution as a list of (x, y) tuples going from the
+start to the finish (or None if the finish can't be reached).
+"""
+
+import heapq
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .mazegrid import MazeGridPoint, NORTH, WEST, SOUTH, EAST, opposite_bits, _dead_end_table, _dead_end_pattern
+from .util import *
+
+# Registry of solvers, mapping names to functions.
+solvers = {}
+
+# Cached solutions: maps each maze grid to {(solver, start, finish): path}. Grids
+# are weakly referenced, so solutions are dropped along with their maze.
+_solutions = weakref.WeakKeyDictionary()
+
+def solver(name):
+    """Decorator registering a maze solver under the given name."""
+    def wrapper(func):
+        solvers[name] = func
+        return func
+    return wrapper
+
+def _offsets(width):
+    """Returns (path bit, flat index offset) pairs for each direction."""
+    return ((NORTH, -width), (WEST, -1), (SOUTH, width), (EAST, 1))
+
+def _follow_parents(grid, parents, start, finish):
+    """
+    Walks back from finish to start over the given parent directions (the path
+    bit leading back towards the start, for every visited point), returning the
+    path from start to finish.
+    """
+    width = grid.width
+    offsets = dict(_offsets(width))
+    path = [finish]
+    index = finish
+    while index != start:
+        index += offsets[parents[index]]
+        path.append(index)
+    path.reverse()
+    return [grid.coords(index) for index in path]
+
+@solver('bfs')
+def bfs(grid, start, finish):
+    """
+    Breadth-first search from the start, stopping once the finish is reached.
+
+    Time: O(n). Memory: O(n), with one byte per point for the visited map.
+    """
+    cells = grid.cells
+    start, finish = grid.index(*start), grid.index(*finish)
+
+    # For every visited point, the path bit leading back towards the start.
+    parents = bytearray(len(grid))
+    parents_to = tuple((bit, offset, opposite_bits[bit]) for bit, offset in _offsets(grid.width))
+
+    queue = [start]
+    # Mark the start as visited, with a value that isn't a valid path bit.
+    parents[start] = 0xFF
+    for index in queue:
+        if index == finish:
+            return _follow_parents(grid, parents, start, finish)
+        value = cells[index]
+        for bit, offset, back in parents_to:
+            if value & bit:
+                neighbour = index + offset
+                if not parents[neighbour]:
+                    parents[neighbour] = back
+                    queue.append(neighbour)
+    return None
+
+@solver('astar')
+def astar(grid, start, finish, heuristic=None):
+    """
+    A* search, exploring points closest to the finish first. heuristic is called
+    with two MazeGridPoints and must not overestimate the path length between
+    them; it defaults to the Manhattan distance (e.g. MazeGenerator.distance).
+
+    Time: O(n log n) in the worst case, but usually much less than BFS when the
+    solution doesn't wander far from the straight line. Memory: O(n).
+    """
+    if heuristic is None:
+        heuristic = lambda point1, point2: abs(point1.x - point2.x) + abs(point1.y - point2.y)
+
+    width = grid.width
+    cells = grid.cells
+    goal = MazeGridPoint(grid, *finish)
+    start, finish = grid.index(*start), grid.index(*finish)
+
+    parents = bytearray(len(grid))
+    parents[start] = 0xFF
+    parents_to = tuple((bit, offset, opposite_bits[bit]) for bit, offset in _offsets(width))
+
+    # Heap of (estimated total path length, path length so far, index). Since the
+    # maze is a grid with unit steps, the first time a point is reached is always
+    # along a shortest path to it, given a consistent heuristic.
+    heap = [(0, 0, start)]
+    while heap:
+        _, distance, index = heapq.heappop(heap)
+        if index == finish:
+            return _follow_parents(grid, parents, start, finish)
+
+        value = cells[index]
+        distance += 1
+        for bit, offset, back in parents_to:
+            if value & bit:
+                neighbour = index + offset
+                if not parents[neighbour]:
+                    parents[neighbour] = back
+                    point = MazeGridPoint(grid, neighbour % width, neighbour // width)
+                    heapq.heappush(heap, (distance + heuristic(point, goal), distance, neighbour))
+    return None
+
+@solver('dead_end_filling')
+def dead_end_filling(grid, start, finish):
+    """
+    Dead-end filling: repeatedly fills in dead ends (other than the start and
+    finish) until only the path between the start and finish is left. In a
+    perfect maze, that's the solution.
+
+    With numpy, all current dead ends are filled at once in each round, for as
+    long as that fills a good share of the maze. The long branches that are left
+    after that are filled one point at a time from a queue, which is also what is
+    done without numpy.
+
+    Mazes that aren't perfect (e.g. edited or damaged maze files) can have loops,
+    which are never filled in, so those are solved using BFS instead.
+
+    Time: O(n). Memory: O(n).
+    """
+    if not grid.is_perfect():
+        debug_print("dead_end_filling: %s isn't a perfect maze, using BFS instead" % grid)
+        return bfs(grid, start, finish)
+
+    start, finish = grid.index(*start), grid.index(*finish)
+    if numpy is not None:
+        cells = _fill_numpy(grid, start, finish)
+    else:
+        cells = bytearray(grid.cells)
+    remaining = _fill_queue(cells, grid.width, start, finish)
+
+    # Follow the remaining corridor from the start.
+    offsets = _offsets(grid.width)
+    path = [start]
+    previous, index = None, start
+    while index != finish:
+        value = remaining[index]
+        for bit, offset in offsets:
+            if value & bit and index + offset != previous:
+                previous, index = index, index + offset
+                break
+        else:
+            return None  # Dead end: the finish isn't reachable.
+        path.append(index)
+    return [grid.coords(index) for index in path]
+
+def _fill_queue(cells, width, start, finish):
+    """Fills dead ends in the given cells (a bytearray) one at a time."""
+    offsets = _offsets(width)
+    # Dead ends are found the same way as MazeGrid.dead_ends() does.
+    marked = bytes(cells).translate(_dead_end_table)
+    queue = [match.start() for match in _dead_end_pattern.finditer(marked)]
+    for index in queue:
+        if index == start or index == finish:
+            continue
+        value = cells[index]
+        for bit, offset in offsets:
+            if value & bit:
+                # Close off the dead end, and check whether that made its
+                # neighbour a dead end too.
+                neighbour = index + offset
+                cells[index] = 0
+                cells[neighbour] &= ~opposite_bits[bit]
+                remaining = cells[neighbour]
+                if remaining and not remaining & (remaining - 1):
+                    queue.append(neighbour)
+                break
+    return cells
+
+# numpy rounds stop once they fill less than this fraction of the maze.
+NUMPY_FILL_MIN_FRACTION = 1/256
+
+def _fill_numpy(grid, start, finish):
+    """Fills all dead ends at once, round by round, returning the remaining cells."""
+    width, height = grid.width, grid.height
+    cells = numpy.frombuffer(grid.cells, dtype=numpy.uint8).reshape(height, width).copy()
+    keep = numpy.zeros((height, width), dtype=bool)
+    keep.flat[start] = keep.flat[finish] = True
+    minimum = len(grid) * NUMPY_FILL_MIN_FRACTION
+
+    while True:
+        # Dead ends have exactly one path bit set.
+        dead = (cells != 0) & ((cells & (cells - 1)) == 0) & ~keep
+        if dead.sum() < minimum:
+            break
+
+        # Close off the paths leading into each dead end from its neighbour...
+        into = numpy.where(dead, cells, 0)
+        cells[:-1, :] &= ~numpy.where(into[1:, :] == NORTH, SOUTH, 0).astype(numpy.uint8)
+        cells[1:, :] &= ~numpy.where(into[:-1, :] == SOUTH, NORTH, 0).astype(numpy.uint8)
+        cells[:, :-1] &= ~numpy.where(into[:, 1:] == WEST, EAST, 0).astype(numpy.uint8)
+        cells[:, 1:] &= ~numpy.where(into[:, :-1] == EAST, WEST, 0).astype(numpy.uint8)
+        # ... and the dead ends themselves.
+        cells[dead] = 0
+    return bytearray(cells.tobytes())
+
+def solve(grid, start=None, finish=None, method='bfs', **kwargs):
+    """
+    Solves the maze using the given solver, defaulting to the grid's start and
+    finish points. Solutions are cached for each maze.
+    """
+    start = tuple(start or grid.start)
+    finish = tuple(finish or grid.finish)
+
+    try:
+        cache = _solutions[grid]
+    except KeyError:
+        cache = _solutions[grid] = {}
+    except TypeError:
+        # Not weakly referenceable; don't cache.
+        cache = {}
+
+    key = (method, start, finish)
+    if key not in cache:
+        debug_print("Solving maze %s from %s to %s using %s" % (grid, start, finish, method))
+        cache[key] = solvers[method](grid, start, finish, **kwargs)
+    return cache[key]
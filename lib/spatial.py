@@ -0,0 +1,100 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Spatial index of sprites for TrulyAmazed.
+"""
+
+class SpriteIndex():
+    """
+    Collection of sprites (any objects with x and y attributes), indexed by the
+    point they're on.
+
+    Looking up the sprites on a point, adding, moving and removing sprites are all
+    O(1). Sprites that move must be passed to move() afterwards to keep the index
+    up to date. Iterating goes over the sprites in the order they were added.
+    """
+
+    def __init__(self):
+        # Maps each sprite to the point it is indexed under. Dicts keep insertion
+        # order, which keeps drawing and collision order stable.
+        self._positions = {}
+        # Maps (x, y) points to dicts of the sprites there (used as ordered sets).
+        self._points = {}
+
+    def __repr__(self):
+        return 'SpriteIndex(%s sprites on %s points)' % (len(self._positions), len(self._points))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __iter__(self):
+        # Iterate over a copy, so that sprites can be added or removed while iterating.
+        return iter(list(self._positions))
+
+    def __contains__(self, sprite):
+        return sprite in self._positions
+
+    def add(self, sprite):
+        """Adds a sprite at its current position."""
+        if sprite in self._positions:
+            self.move(sprite)
+            return
+        point = (sprite.x, sprite.y)
+        self._positions[sprite] = point
+        self._points.setdefault(point, {})[sprite] = None
+
+    # List-style alias, since sprites used to be kept in a list.
+    append = add
+
+    def _unlink(self, sprite, point):
+        sprites = self._points[point]
+        del sprites[sprite]
+        if not sprites:
+            del self._points[point]
+
+    def remove(self, sprite):
+        """Removes a sprite, raising ValueError if it isn't in the index."""
+        try:
+            point = self._positions.pop(sprite)
+        except KeyError:
+            raise ValueError("%s is not in the sprite index" % sprite)
+        self._unlink(sprite, point)
+
+    def discard(self, sprite):
+        """Removes a sprite if it is in the index."""
+        if sprite in self._positions:
+            self.remove(sprite)
+
+    def move(self, sprite):
+        """Updates the index after a sprite has moved."""
+        old = self._positions.get(sprite)
+        new = (sprite.x, sprite.y)
+        if old is None or old == new:
+            return
+        self._unlink(sprite, old)
+        self._positions[sprite] = new
+        self._points.setdefault(new, {})[sprite] = None
+
+    def at(self, x, y):
+        """Returns a list of the sprites on the given point."""
+        sprites = self._points.get((x, y))
+        return list(sprites) if sprites else []
+
+    def clear(self):
+        """Removes all sprites."""
+        self._positions.clear()
+        self._points.clear()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+###
+# Copyright (c) 2016, 2018 James Lu <james@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+"""
+Headless batch maze generator. This doesn't need PyQt5, so it can run on servers.
+
+Example: generate 100 mazes each of 50x50 and 200x100, using two algorithms:
+    ./mazebatch.py -n 100 -s 50x50 -s 200x100 -a depth_first -a kruskal -o mazes/
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+
+from lib.mazemaker import MazeGenerator
+from lib.algorithms import algorithms
+from lib import mazefile, util
+
+def parse_size(text):
+    """Parses a WIDTHxHEIGHT maze size."""
+    try:
+        width, height = map(int, text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid maze size %r (expected WIDTHxHEIGHT)" % text)
+    if width < 1 or height < 1 or width * height < 2:
+        raise argparse.ArgumentTypeError("Maze size %r is too small" % text)
+    return (width, height)
+
+def set_verbose(verbose):
+    """Sets whether to show debug output; used to pass -q on to the worker processes."""
+    util.verbose = verbose
+
+def generate_one(job):
+    """Generates a single maze and writes it to disk. Returns the amount of points in it."""
+    width, height, algorithm, seed, min_difficulty, outdir = job
+
+    mg = MazeGenerator(width, height, seed=seed, algorithm=algorithm)
+    mg.generate(min_difficulty=min_difficulty)
+
+    filename = os.path.join(outdir, '%s-%sx%s-%s%s' % (algorithm, width, height, seed, mazefile.SUFFIX))
+    with open(filename, 'wb') as f:
+        mazefile.write_maze(f, mg.grid, (mg.start.x, mg.start.y), (mg.finish.x, mg.finish.y),
+                            seed=seed, algorithm=algorithm)
+    return width * height
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generates mazes in bulk, using multiple processes.")
+    parser.add_argument('-n', '--count', type=int, default=1,
+                        help="number of mazes to generate for each size and algorithm (default: 1)")
+    parser.add_argument('-s', '--size', type=parse_size, action='append', dest='sizes',
+                        help="maze size as WIDTHxHEIGHT; can be given multiple times (default: 10x10)")
+    parser.add_argument('-a', '--algorithm', choices=sorted(algorithms), action='append', dest='algorithms',
+                        help="generation algorithm; can be given multiple times (default: depth_first)")
+    parser.add_argument('--seed', type=int,
+                        help="seed of the first maze; the following mazes use consecutive seeds "
+                             "(default: random)")
+    parser.add_argument('--min-difficulty', type=int, default=0,
+                        help="minimum path length between the start and finish points")
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('-o', '--output', default='.',
+                        help="folder to write the generated .tamaze files to (default: current folder)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="disable debug output, even if it is enabled in config.py")
+    args = parser.parse_args(argv)
+
+    if args.quiet:
+        util.verbose = False
+
+    sizes = args.sizes or [(10, 10)]
+    algorithm_names = args.algorithms or ['depth_first']
+    seed = args.seed if args.seed is not None else random.getrandbits(32)
+    os.makedirs(args.output, exist_ok=True)
+
+    jobs = []
+    for width, height in sizes:
+        for algorithm in algorithm_names:
+            for _ in range(args.count):
+                jobs.append((width, height, algorithm, seed, args.min_difficulty, args.output))
+                seed += 1
+
+    print("Generating %s mazes using %s processes..." % (len(jobs), args.processes or os.cpu_count()))
+    started = time.perf_counter()
+    total_cells = 0
+    # Worker processes don't necessarily inherit util.verbose (e.g. when they're
+    # spawned instead of forked), so set it in each of them too.
+    with multiprocessing.Pool(args.processes, initializer=set_verbose, initargs=(util.verbose,)) as pool:
+        for cells in pool.imap_unordered(generate_one, jobs):
+            total_cells += cells
+    elapsed = time.perf_counter() - started
+
+    print("Generated %s mazes (%s cells) in %.2f seconds: %.2f mazes/sec, %.0f cells/sec" %
+          (len(jobs), total_cells, elapsed, len(jobs) / elapsed, total_cells / elapsed))
+
+if __name__ == '__main__':
+    sys.exit(main())
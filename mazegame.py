@@ -33,9 +33,21 @@ from PyQt5.QtCore import *
 from lib.mazemaker import debug_print
 from mazegui import MazeGUI
 from lib.characters import *
+from lib.prefetch import LevelPrefetcher
+from lib.flowfield import FlowField
+from lib.scheduler import GameLoop
+from lib.spatial import SpriteIndex
+from lib.entities import EntityStore, ENEMY
+from lib.chunked import ChunkedMaze, ChunkedMazeGenerator
+from lib.camera import MIN_TILE_SIZE
+from lib import mazefile
 from lib.util import *
 from config import *
 
+# Sprite types saved in .tamaze files.
+sprite_types = {FuelPack: mazefile.SPRITE_FUEL_PACK, Enemy: mazefile.SPRITE_ENEMY,
+                Checkpoint: mazefile.SPRITE_CHECKPOINT}
+
 class MazeGame(MazeGUI):
     """
     Subclass of the GUI maze app with custom controls.
@@ -43,15 +55,34 @@ class MazeGame(MazeGUI):
 
     def __init__(self, app, uifile):
         # Define variables.
-        self.fuel_timer = None
+        self.fuel_task = None
         self.player = None
-        self.sprites = []
+        # All sprites in the game, indexed by position (see lib.spatial).
+        self.sprites = SpriteIndex()
+        # Positions of fuel packs, enemies and checkpoints, kept in flat arrays so
+        # that all enemies can be moved at once (see lib.entities).
+        self.entities = EntityStore()
+        self.enemy_task = None
+        # Task waiting for the next level to be prefetched, if the player got there
+        # before it was ready (see make_maze()).
+        self.prefetch_task = None
+        self.checkpoints_hit = 0
         self.started = False
         self.fuel = None
         self.starting_fuel = None
         self.levels = []
+        self.flow_field = None
+        self.enemy_behavior = 'wander'
+
+        # Everything that moves or changes over time runs on this loop, which also
+        # repaints the game (at most once per frame) whenever something changes.
+        self.loop = GameLoop(repaint=lambda: self.display.update())
 
         super().__init__(app, uifile)
+        # Showing the solution would give the game away, so that's only offered in
+        # the maze generator.
+        self.ui.show_solution_checkbox.setChecked(False)
+        self.ui.show_solution_checkbox.hide()
         self.reset_state()
 
     def _sync_level_state(self):
@@ -65,6 +96,17 @@ class MazeGame(MazeGUI):
         self.ui.enable_darkness.setChecked(self.use_darkness)
         self.ui.enable_fuel.setChecked(self.use_fuel)
 
+        # Light either spreads along the maze's paths, or only reaches what the player
+        # can see in a straight line.
+        self.darkness_mode = self.leveldata.get('darkness_mode',
+                                                'sight' if self.ui.enable_line_of_sight.isChecked() else 'path')
+        self.ui.enable_line_of_sight.setChecked(self.darkness_mode == 'sight')
+
+        # Enemies either wander around randomly, or hunt the player.
+        self.enemy_behavior = self.leveldata.get('enemy_behavior',
+                                                 'hunt' if self.ui.enable_hunting.isChecked() else 'wander')
+        self.ui.enable_hunting.setChecked(self.enemy_behavior == 'hunt')
+
         caption = self.leveldata.get("caption", welcome_caption)
         self.ui.caption.setText(caption)
 
@@ -73,31 +115,45 @@ class MazeGame(MazeGUI):
         self.static_start = self.leveldata.get('static_start', self.static_start)
         self.static_finish = self.leveldata.get('static_finish', self.static_finish)
 
-        # Clear the sprites list.
+    def _clear_sprites(self):
+        """Removes all sprites, stopping the sprites from the last maze."""
+        for sprite in self.sprites:
+            sprite.stop()
         self.sprites.clear()
+        self.entities.clear()
+        if self.enemy_task is not None:
+            self.loop.remove(self.enemy_task)
+            self.enemy_task = None
         self.checkpoints_hit = 0
 
-    def _get_unused_points(self):
-        """Returns all points that aren't the start or finish."""
-        allowed_points = self.maze.all_items()
-        allowed_points.remove(self.mg.start)
-        allowed_points.remove(self.mg.finish)
-        return allowed_points
+    def _sample_unused_points(self, count):
+        """
+        Returns up to count random (x, y) coordinates that aren't the start or finish.
+        Only the points picked are looked at, so this is fast even on huge mazes.
+        """
+        size = self.mazewidth * self.mazeheight
+        used = {self.maze.index(self.mg.start.x, self.mg.start.y),
+                self.maze.index(self.mg.finish.x, self.mg.finish.y)}
+        count = max(0, min(count, size - len(used)))
 
-    def _get_unused_endpoints(self):
-        """Returns all end points that aren't the start or finish."""
-        unused_endpoints = list(self.mg.end_points)
-        try:
-            unused_endpoints.remove(self.mg.start)
-        except ValueError:
-            pass
+        # random.sample() on a range doesn't build the whole range. Pick a few extra
+        # points in case the start or finish gets picked.
+        picks = random.sample(range(size), min(size, count + len(used)))
+        return [self.maze.coords(index) for index in picks if index not in used][:count]
 
-        try:
-            unused_endpoints.remove(self.mg.finish)
-        except ValueError:
-            pass
+    def _sample_unused_endpoints(self, count):
+        """
+        Returns up to count random (x, y) coordinates of end points (dead ends) that
+        aren't the start or finish. Like _sample_unused_points(), only the points
+        picked are looked at.
+        """
+        dead_ends = self.mg.dead_ends
+        used = {self.maze.index(self.mg.start.x, self.mg.start.y),
+                self.maze.index(self.mg.finish.x, self.mg.finish.y)}
+        count = max(0, min(count, len(dead_ends) - len(used.intersection(dead_ends))))
 
-        return unused_endpoints
+        picks = random.sample(dead_ends, min(len(dead_ends), count + len(used)))
+        return [self.maze.coords(index) for index in picks if index not in used][:count]
 
     def make_maze(self, reset_state=False):
         """
@@ -111,8 +167,103 @@ class MazeGame(MazeGUI):
             debug_print("make_maze: resetting state")
             self.reset_state()
 
+        if self.leveldata.get('chunked'):
+            # Chunked levels are generated bit by bit as the player explores them, so
+            # there is nothing to generate (or wait for) up front.
+            self._make_chunked_maze()
+            return
+
+        if self.prefetcher.pending(self.current_level):
+            # The next level is still being prepared in the background. Wait for it
+            # instead of generating the same maze again, checking on it every so often.
+            debug_print("make_maze: waiting for level %s to be prefetched" % self.current_level)
+            # Stop any other generation, but not the prefetch being waited for.
+            super().cancel_generation()
+            if self.prefetch_task is None:
+                self.prefetch_task = self.loop.add(self._check_prefetch, self.loop.ticks_for(50))
+            # There's no telling how far along the worker is, so show a busy indicator.
+            self.ui.generate_progress.setMaximum(0)
+            self.ui.generate_progress.show()
+            self.ui.cancel_generate_button.show()
+            return
+
+        # If the next level was prepared in the background, pick it up from there.
+        self.next_seed = self.prefetcher.collect(self.current_level)
+
+        super().make_maze()
+
+    def _make_chunked_maze(self):
+        """Starts a chunked level, whose maze is only generated around the player."""
+        self.cancel_generation()
+
+        mazewidth = self.leveldata.get('width', self.ui.width_spinbox.value())
+        self.ui.width_spinbox.setValue(mazewidth)
+        mazeheight = self.leveldata.get('height', self.ui.height_spinbox.value())
+        self.ui.height_spinbox.setValue(mazeheight)
+
+        seed = self.leveldata.get('seed')
+        if seed is None:
+            seed = self.next_seed
+        self.next_seed = None
+        mg = ChunkedMazeGenerator(mazewidth, mazeheight, seed=seed)
+
+        # Chunks are always carved the same way, and there's no telling how long any
+        # path is, so the algorithm and difficulty settings don't apply.
+        self.algorithm = mg.algorithm
+        self.ui.algorithm_combobox.setCurrentIndex(self.ui.algorithm_combobox.findData(self.algorithm))
+        self.min_difficulty = self.leveldata.get('min_difficulty', self.ui.min_difficulty_spinbox.value())
+
+        mg.generate(self.static_start, self.static_finish)
+        self._maze_generated(mg)
+
+    @property
+    def chunked(self):
+        """Returns whether the maze being played is a chunked one (see lib.chunked)."""
+        return isinstance(self.maze, ChunkedMaze)
+
+    def _check_prefetch(self):
+        """Generates the level being waited for once it has been prefetched."""
+        if self.prefetcher.pending(self.current_level):
+            return
+
+        self.loop.remove(self.prefetch_task)
+        self.prefetch_task = None
+        self.ui.generate_progress.hide()
+        self.ui.cancel_generate_button.hide()
+        # This finds the maze in the cache, unless prefetching it failed; then it is
+        # simply generated here instead.
+        self.next_seed = self.prefetcher.collect(self.current_level)
         super().make_maze()
 
+    @property
+    def generating(self):
+        """Returns whether a maze is being generated or prefetched in the background."""
+        return super().generating or self.prefetch_task is not None
+
+    def cancel_generation(self):
+        """Cancels the maze being generated or waited for in the background, if any."""
+        if self.prefetch_task is not None:
+            debug_print("Cancelling wait for prefetched level")
+            self.loop.remove(self.prefetch_task)
+            self.prefetch_task = None
+            self.prefetcher.cancel()
+            self.ui.generate_progress.hide()
+            self.ui.cancel_generate_button.hide()
+        super().cancel_generation()
+
+    def _maze_generated(self, mg):
+        """Sets up the player and sprites once a new maze is generated."""
+        # The last maze's sprites are only removed now, so that it stays playable
+        # while a new maze is generated in the background (or if that's cancelled).
+        self._clear_sprites()
+        super()._maze_generated(mg)
+        # The flow field is rebuilt for the new maze when it's first needed.
+        self.flow_field = None
+        # Zooming far out on a chunked maze would generate a huge amount of chunks
+        # at once, and drawing it as a single picture would need all of them.
+        self.camera.min_tile_size = max(chunked_min_tile_size, lod_tile_size) if self.chunked \
+            else MIN_TILE_SIZE
+
         if self.player:
             # Reset the player's position, if one exists.
             self.player.reset_coords()
@@ -120,58 +271,188 @@ class MazeGame(MazeGUI):
             self.display.setFocus()
 
             # Re-add the player into the sprites list.
-            self.sprites.append(self.player)
+            self.sprites.add(self.player)
+
+        self.update_steps_remaining()
+
+        if mg.sprite_spawns:
+            # The maze was loaded from a file with its own sprites.
+            self._spawn_saved_sprites()
+        else:
+            self._make_fuel_packs()
+            self._make_enemies()
+            self._make_checkpoints()
+        self._start_enemies()
+
+        self._prefetch_next_level()
+
+    def _prefetch_next_level(self):
+        """
+        Starts generating the next level's maze in the background, so that moving
+        on to it doesn't freeze the game.
+        """
+        if not self.levels or self.leveldata.get('winning_stage'):
+            # No level pack is loaded, or this is the last stage.
+            self.prefetcher.cancel()
+            return
+
+        level = self.current_level + 1
+        try:
+            leveldata = self.levels[level]
+        except IndexError:
+            # If we run out of levels, the settings of the last one are kept.
+            leveldata = self.leveldata
+
+        if leveldata.get('maze_file') or leveldata.get('chunked'):
+            # Mazes loaded from files and chunked mazes don't need generating.
+            self.prefetcher.cancel()
+            return
+
+        # Fix the seed of the next maze in advance, so that the prefetched maze is the
+        # one that gets used.
+        seed = leveldata.get('seed')
+        if seed is None:
+            seed = random.getrandbits(32)
 
-        self._make_fuel_packs()
-        self._make_enemies()
-        self._make_checkpoints()
+        self.prefetcher.prefetch(level, leveldata.get('width', self.ui.width_spinbox.value()),
+                                 leveldata.get('height', self.ui.height_spinbox.value()), seed,
+                                 leveldata.get('algorithm', self.ui.algorithm_combobox.currentData()),
+                                 leveldata.get('static_start', self.static_start),
+                                 leveldata.get('static_finish', self.static_finish))
 
     def _make_fuel_packs(self):
         # Fuel packs count cannot be greater than the amount of tiles in the maze
         # (excluding start and finish points)!
         self.fuelpacks_count = self.leveldata.get('fuel_packs', self.ui.fuelpacks_spinbox.value())
-        available_points = self._get_unused_points()
-        self.fuelpacks_count = min(len(available_points), self.fuelpacks_count)
+        points = self._sample_unused_points(self.fuelpacks_count)
+        self.fuelpacks_count = len(points)
         self.ui.fuelpacks_spinbox.setValue(self.fuelpacks_count)
 
-        for point in random.sample(available_points, self.fuelpacks_count):
-            debug_print('Spawning fuel pack at (%s, %s)' % (point.x, point.y))
-            fp = FuelPack(self, point.x, point.y)
-            self.sprites.append(fp)
+        for x, y in points:
+            debug_print('Spawning fuel pack at (%s, %s)' % (x, y))
+            fp = FuelPack(self, x, y)
+            self.sprites.add(fp)
 
     def _make_enemies(self):
-        available_points = self._get_unused_points()
         self.enemy_count = self.leveldata.get('enemies', self.ui.enemies_spinbox.value())
-        self.enemy_count = min(len(available_points), self.enemy_count)
+        if self.chunked:
+            # Enemies are moved using the whole maze's cells at once, which chunked
+            # mazes don't have.
+            self.enemy_count = 0
+        points = self._sample_unused_points(self.enemy_count)
+        self.enemy_count = len(points)
         self.ui.enemies_spinbox.setValue(self.enemy_count)
 
-        for point in random.sample(available_points, self.enemy_count):
-            fp = Enemy(self, point.x, point.y)
-            self.sprites.append(fp)
+        for x, y in points:
+            fp = Enemy(self, x, y)
+            self.sprites.add(fp)
 
     def _make_checkpoints(self):
         # For checkpoints, choose random dead ends on the maze.
         # Don't allow checkpoints to spawn on the start or finish, however.
-        valid_endpoints = self._get_unused_endpoints()
-
         self.checkpoint_count = self.leveldata.get('checkpoints', self.ui.checkpoints_spinbox.value())
-        debug_print("_make_checkpoints: Found %s endpoints, wanted %s" % (len(valid_endpoints), self.checkpoint_count))
-        self.checkpoint_count = min(len(valid_endpoints), self.checkpoint_count)
+        if self.chunked:
+            # Finding dead ends means looking at the whole maze.
+            self.checkpoint_count = 0
+        points = self._sample_unused_endpoints(self.checkpoint_count)
+        debug_print("_make_checkpoints: Found %s endpoints, wanted %s" % (len(points), self.checkpoint_count))
+        self.checkpoint_count = len(points)
         self.ui.checkpoints_spinbox.setValue(self.checkpoint_count)
 
-        for point in random.sample(valid_endpoints, self.checkpoint_count):
-            fp = Checkpoint(self, point.x, point.y)
-            self.sprites.append(fp)
+        for x, y in points:
+            fp = Checkpoint(self, x, y)
+            self.sprites.add(fp)
 
-    def draw_maze(self, painter, width, height):
-        retcode = super().draw_maze(painter, width, height)
+    def _start_enemies(self):
+        """Starts moving the enemies, every move delay milliseconds."""
+        move_delay = self.leveldata.get('enemy_move_delay', self.ui.move_delay_spinbox.value())
+        self.ui.move_delay_spinbox.setValue(move_delay)
+
+        if move_delay > 0 and self.enemy_count:
+            # If move delay is 0, disable movement for enemies entirely. All enemies
+            # move together in one task.
+            self.enemy_task = self.loop.add(self.move_enemies, self.loop.ticks_for(move_delay))
+
+    def move_enemies(self):
+        """Moves all enemies one step, in one go over the entity store."""
+        if self.has_quit.is_set() or self.is_game_over:
+            return
+
+        flow_field = None
+        if self.enemy_behavior == 'hunt' and self.player:
+            # Hunting enemies follow the flow field towards the player, which is
+            # shared by all enemies.
+            flow_field = self.get_flow_field()
+
+        moved = self.entities.step(self.maze, ENEMY, flow_field)
+        if not len(moved):
+            return
+        owners = self.entities.owners
+        for slot in moved:
+            self.sprites.move(owners[slot])
+        self.request_repaint()
+
+        if flow_field is not None:
+            for sprite in self.sprites.at(self.player.x, self.player.y):
+                if isinstance(sprite, Enemy):
+                    # Caught the player!
+                    sprite.hit(self.player)
+                    break
+
+    def _spawn_saved_sprites(self):
+        """Spawns the sprites saved in the maze file that was loaded."""
+        classes = {sprite_type: cls for cls, sprite_type in sprite_types.items()}
+        for sprite_type, x, y in self.mg.sprite_spawns:
+            cls = classes.get(sprite_type)
+            if cls is None:
+                debug_print("_spawn_saved_sprites: ignoring unknown sprite type %s" % sprite_type)
+                continue
+            self.sprites.add(cls(self, x, y))
+
+        self.fuelpacks_count = sum(isinstance(sprite, FuelPack) for sprite in self.sprites)
+        self.enemy_count = sum(isinstance(sprite, Enemy) for sprite in self.sprites)
+        self.checkpoint_count = sum(isinstance(sprite, Checkpoint) for sprite in self.sprites)
+        self.ui.fuelpacks_spinbox.setValue(self.fuelpacks_count)
+        self.ui.enemies_spinbox.setValue(self.enemy_count)
+        self.ui.checkpoints_spinbox.setValue(self.checkpoint_count)
+
+    def get_sprite_spawns(self):
+        """Returns the current sprites' positions, for saving in a .tamaze file."""
+        return [(sprite_types[type(sprite)], sprite.x, sprite.y) for sprite in self.sprites
+                if type(sprite) in sprite_types]
+
+    def draw_maze(self, painter, width, height, use_cache=True, camera=None):
+        retcode = super().draw_maze(painter, width, height, use_cache, camera)
 
         if retcode:
-            for character in self.sprites:
+            for character in self._sprites_in_view(camera):
                 #debug_print("Drawing character %s" % character)
                 character.draw(painter)
         return retcode
 
+    def _sprites_in_view(self, camera):
+        """Returns the sprites that the given camera (if any) can see."""
+        if camera is None:
+            return list(self.sprites)
+        left, top, right, bottom = camera.visible_area()
+        if (right - left) * (bottom - top) < len(self.sprites):
+            # Fewer points than sprites in view: look the points up in the sprite index.
+            return [sprite for y in range(top, bottom) for x in range(left, right)
+                    for sprite in self.sprites.at(x, y)]
+        return [sprite for sprite in self.sprites if left <= sprite.x < right and top <= sprite.y < bottom]
+
+    def draw_minimap(self, painter, width):
+        if self.chunked:
+            # An overview of a chunked maze would need every chunk in it.
+            return
+        super().draw_minimap(painter, width)
+
+    def _get_darkness_image(self, area):
+        if self.chunked:
+            # Light spreads over the whole maze's cells, which chunked mazes don't have.
+            return None
+        return super()._get_darkness_image(area)
+
     def reset_state(self, level=0):
         """
         Resets the game state (fuel, game over setting, levels list, etc.).
@@ -189,11 +470,53 @@ class MazeGame(MazeGUI):
 
         self.ui.current_level_text.setText(text)
 
+    @property
+    def steps_remaining(self):
+        """
+        Returns the length of the path from the player to the finish. This is a
+        lookup in the maze's distance field, so it's cheap enough to do every tick.
+        """
+        if not self.player:
+            return None
+        return self.mg.steps_to_finish(self.player.x, self.player.y)
+
+    def get_flow_field(self):
+        """
+        Returns the flow field leading to the player, which hunting enemies follow.
+        """
+        if self.flow_field is None or self.flow_field.grid is not self.maze:
+            self.flow_field = FlowField(self.maze)
+        # This only does any work if the player moved since the last call.
+        self.flow_field.update(self.player.x, self.player.y)
+        return self.flow_field
+
+    def player_moved(self):
+        """Called whenever the player moves."""
+        self.update_steps_remaining()
+        if self.flow_field is not None:
+            self.flow_field.update(self.player.x, self.player.y)
+        if self.chunked:
+            # Keep the chunks around the player generated, so that they're ready (and
+            # don't get evicted) while the player is nearby.
+            self.maze.load_around(self.player.x, self.player.y, self.maze.chunk_size)
+
+    def update_steps_remaining(self):
+        """Updates the steps to finish display."""
+        steps = self.steps_remaining
+        if steps is not None:
+            self.ui.steps_remaining_text.setText("Steps to finish: %s" % steps)
+        elif self.player:
+            # Chunked mazes only know the paths that have been generated so far.
+            self.ui.steps_remaining_text.setText("Steps to finish: unknown")
+
     def setup_elements(self):
         """
         Initializes the game by generating a maze and binding widgets to their
         corresponding functions.
         """
+        # Upcoming levels are generated in the background by this.
+        self.prefetcher = LevelPrefetcher(self.maze_cache)
+
         # Explicitly call make_maze() with reset_state set to True. For some reason,
         # the implicit reset_state=True doesn't work when binding widgets.
         def generatebutton():
@@ -217,10 +540,10 @@ class MazeGame(MazeGUI):
         # it is drawn whenever requested.
         self.player = PlayerCharacter(self)
         self.player.bind()
-        self.sprites.append(self.player)
+        self.sprites.add(self.player)
+        self.update_steps_remaining()
 
-        # Start a threaded loop to decrease the fuel count gradually,
-        # if darkness is enabled.
+        # Decrease the fuel count gradually (every 100 ms), if enabled.
         def decrease_fuel_loop():
             if self.has_quit.is_set():
                 return
@@ -228,14 +551,17 @@ class MazeGame(MazeGUI):
             if self.use_fuel and not self.is_game_over:
                 self.update_fuel(-1)
 
-        if self.fuel_timer is None:
-            # Only spawn this thread ONCE.
-            self.fuel_timer = QTimer()
-            self.fuel_timer.timeout.connect(decrease_fuel_loop)
-            self.fuel_timer.start(100)
+        if self.fuel_task is None:
+            # Only add this task ONCE.
+            self.fuel_task = self.loop.add(decrease_fuel_loop, self.loop.ticks_for(100))
+        self.loop.start()
 
         self.ui.show()
 
+    def request_repaint(self):
+        """Asks for the game to be repainted at the end of the current frame."""
+        self.loop.request_repaint()
+
     def update_fuel(self, amount, reset=False):
         """
         Updates the fuel count by the given amount, fuel being essentially the player
@@ -295,10 +621,18 @@ class MazeGame(MazeGUI):
         self.is_game_over = True
         self.ui.fuel_remaining.update()
 
+    def closeEvent(self, event):
+        """Quits the program cleanly, stopping any background level generation."""
+        self.loop.stop()
+        debug_print("Game loop stats: %s" % self.loop.stats())
+        self.prefetcher.shutdown()
+        super().closeEvent(event)
+
     def clear_settings(self):
         # Clear loaded level.
         self.leveldata = {}
         self.levels = []
+        self.prefetcher.cancel()
         self.reset_state()
 
     def load_settings(self):
@@ -306,9 +640,10 @@ class MazeGame(MazeGUI):
 
         filepicker = QFileDialog()
         filepicker.setWindowTitle('Load settings')
-        # Only show .json files in the dialog
+        # Only show .json and .tamaze files in the dialog
         filepicker.setDefaultSuffix('json')
-        filepicker.setNameFilter("Maze Generator Config files (*.json)")
+        filepicker.setNameFilter("Maze Generator Config files (*.json);;TrulyAmazed maze files (*%s)" %
+                                 mazefile.SUFFIX)
 
         # Set the default folder to presets/
         presets_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'presets')
@@ -325,14 +660,26 @@ class MazeGame(MazeGUI):
 
         filename = files[0]
 
-        # Reset the level count to 0 (first level).
+        # Reset the level count to 0 (first level), and stop prefetching levels from
+        # the old level pack.
         self.reset_state(level=0)
+        self.prefetcher.cancel()
 
         try:
-            with open(filename) as f:
-                # Open the file and load as JSON.
-                self.levels = json.load(f)
-                debug_print('Loaded levels: %s' % self.levels)
+            if filename.endswith(mazefile.SUFFIX):
+                # A single maze file: play that maze, with its own sprites.
+                self.levels = []
+                self.leveldata = {'maze_file': filename}
+            else:
+                with open(filename) as f:
+                    # Open the file and load as JSON.
+                    self.levels = json.load(f)
+                    debug_print('Loaded levels: %s' % self.levels)
+
+                # Maze files used by levels are relative to the level pack.
+                for leveldata in self.levels:
+                    if leveldata.get('maze_file'):
+                        leveldata['maze_file'] = os.path.join(os.path.dirname(filename), leveldata['maze_file'])
                 self.leveldata = self.levels[0]
         except:
             # Print the exact error to the console.
@@ -357,6 +704,8 @@ class MazeGame(MazeGUI):
         'fuel_packs': self.fuelpacks_count,
         'width': self.mazewidth,
         'height': self.mazeheight,
+        'algorithm': self.algorithm,
+        'seed': self.mg.seed,
         'enemies': self.enemy_count,
         'use_fuel': self.use_fuel,
         'min_difficulty': self.min_difficulty,
@@ -367,7 +716,11 @@ class MazeGame(MazeGUI):
         'finish_bonus': self.ui.finish_bonus_spinbox.value(),
          # XXX perhaps make this configurable?
         'caption': '',
-        'checkpoints': self.checkpoint_count}]
+        'checkpoints': self.checkpoint_count,
+        'enemy_behavior': self.enemy_behavior,
+        'darkness_mode': self.darkness_mode,
+        'chunked': self.chunked,
+        'maze_file': self.leveldata.get('maze_file')}]
 
     def export_settings(self):
         """Exports the current maze generator settings to file."""
@@ -428,6 +781,7 @@ class MazeGame(MazeGUI):
 
         # Clear select_tile state to prevent conflicts.
         self.select_tile('clear')
+        self.prefetcher.cancel()
 
         filename = files[0]
         try:
@@ -443,6 +797,14 @@ class MazeGame(MazeGUI):
                 except IndexError:  # We reached the last level, use that.
                     self.leveldata = self.levels[-1]
 
+                if savedata.get('maze_file'):
+                    # The maze being played (and its sprites) is saved next to the save file.
+                    self.leveldata = dict(self.leveldata, maze_file=os.path.join(
+                        os.path.dirname(filename), savedata['maze_file']))
+                elif savedata.get('seed') is not None:
+                    # Recreate the exact maze that was being played.
+                    self.leveldata = dict(self.leveldata, seed=savedata['seed'])
+
                 # Reset the level count and the fuel.
                 self.reset_state(savedata['current_level'])
                 self.update_fuel(savedata['fuel'], reset=True)
@@ -482,10 +844,22 @@ class MazeGame(MazeGUI):
 
         filename = files[0]
 
+        # The current maze and the sprites left on it are saved in a .tamaze file
+        # next to the save file.
+        maze_filename = os.path.splitext(filename)[0] + mazefile.SUFFIX
+
         # Put all the level options as a dict, and export as JSON.
-        savedata = {'levels': self.levels or self.fetch_level_data(), 'current_level': self.current_level, 'fuel': self.fuel}
+        savedata = {'levels': self.levels or self.fetch_level_data(), 'current_level': self.current_level, 'fuel': self.fuel,
+                    'seed': self.mg.seed, 'maze_file': os.path.basename(maze_filename)}
+
+        if self.chunked:
+            # Chunked mazes are too big to save, but their seed recreates them exactly.
+            # Their sprites are placed anew when the save is loaded.
+            del savedata['maze_file']
 
         try:
+            if not self.chunked:
+                self.mg.save(maze_filename, self.get_sprite_spawns())
             with open(filename, 'w') as f:
                 json.dump(savedata, f, sort_keys=True)
         except OSError:
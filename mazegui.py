@@ -21,6 +21,7 @@ Graphical Maze generator app, written using PyQt5.
 """
 
 import sys
+import os.path
 import threading
 
 from PyQt5.QtWidgets import *
@@ -28,9 +29,41 @@ from PyQt5.QtGui import *
 from PyQt5.uic import loadUi
 from PyQt5.QtCore import *
 
-from lib.mazemaker import MazeGenerator
+from lib.mazemaker import MazeGenerator, GenerationCancelled, use_parallel
+from lib.algorithms import algorithms
+from lib.mazecache import MazeCache
+from lib.camera import Camera
+from lib import bitmap
+from lib import darkness
 from lib.util import *
 
+class MazeGenerationThread(QThread):
+    """
+    Thread that generates a maze in the background, reporting its progress.
+    """
+    # Emitted with the amount of points carved so far, and the total amount of points.
+    progress = pyqtSignal(int, int)
+    # Emitted with the MazeGenerator instance once the maze is generated.
+    generated = pyqtSignal(object)
+
+    def __init__(self, mg, generate_args):
+        super().__init__()
+        self.mg = mg
+        self.generate_args = generate_args
+
+    def _report_progress(self, carved, total):
+        if self.isInterruptionRequested():
+            raise GenerationCancelled("Maze generation was cancelled")
+        self.progress.emit(carved, total)
+
+    def run(self):
+        try:
+            self.mg.generate(progress=self._report_progress, **self.generate_args)
+        except GenerationCancelled:
+            debug_print("MazeGenerationThread: generation cancelled")
+        else:
+            self.generated.emit(self.mg)
+
 class MazeGUI(QMainWindow):
     """
     Graphical Maze generator app, written using PyQt5.
@@ -38,6 +71,11 @@ class MazeGUI(QMainWindow):
     FINISH_COLOR = '#99BCFF'
     START_COLOR = '#99FF99'
     SELECTED_COLOR = '#AA0000'
+    SOLUTION_COLOR = '#FF8800'
+    VIEWPORT_COLOR = '#AA0000'
+    # Size in pixels of the longer side of the minimap, shown when the maze doesn't
+    # fit in the display.
+    MINIMAP_SIZE = 160
 
     def __init__(self, app, uifile):
         # Call the init function of the parent class (in this case, Qt's Window
@@ -56,15 +94,57 @@ class MazeGUI(QMainWindow):
         self.static_finish = None
         self.static_start = None
 
-        # If this is True, the program will stop drawing and produce an error.
-        self.draw_failed = False
-
-        # Defines whether darkness should be enabled in the maze
+        # Background maze generation thread, if one is running. Threads that were
+        # cancelled are kept in generation_threads until they actually stop.
+        self.generation_thread = None
+        self.generation_threads = set()
+
+        # Zoom level and scroll position of the maze display (see lib.camera).
+        self.camera = Camera()
+        # Last mouse position while dragging the display around, if doing so.
+        self.drag_position = None
+
+        # Cached pixmap of the walls and tile colours of (a block of) the maze, and the
+        # settings it was drawn with (see _get_maze_layer()).
+        self.maze_layer = None
+        self.maze_layer_key = None
+        # Solution path lines in view, and the settings they were made for (see
+        # draw_solution()).
+        self.solution_lines = None
+        self.solution_key = None
+        # Walls of the maze, merged into as few lines as possible.
+        self.wall_lines = None
+        # Overview of the whole maze, and the settings it was drawn with.
+        self.minimap_bitmap = None
+        self.minimap_image = None
+        self.minimap_key = None
+        # Darkness overlay image, and the settings it was computed with (see
+        # _get_darkness_image()).
+        self.darkness_image = None
+        self.darkness_pixels = None
+        self.darkness_key = None
+
+        # Defines whether darkness should be enabled in the maze, and how light spreads
+        # ('path' or 'sight'; see lib.darkness).
         self.use_darkness = False
+        self.darkness_mode = 'path'
+        # Points visible from recently visited points, for the 'sight' darkness mode.
+        self.visibility_cache = darkness.VisibilityCache()
 
         # Default level data is empty.
         self.leveldata = {}
 
+        # Seed to use for the next maze, if the level data doesn't define one.
+        self.next_seed = None
+
+        # Generated mazes are cached by their settings and seed, so that replaying the
+        # same level doesn't need to generate it again.
+        cache_folder = None
+        if maze_cache_disk_size:
+            cache_folder = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cache')
+        self.maze_cache = MazeCache(max_memory=maze_cache_memory_size*1024*1024, directory=cache_folder,
+                                    max_disk=maze_cache_disk_size*1024*1024)
+
         self._load_ui(uifile)
 
         self.setup_elements()
@@ -84,6 +164,8 @@ class MazeGUI(QMainWindow):
         debug_print("Connecting set static start/finish buttons")
         self.ui.set_static_start.clicked.connect(lambda: self.select_tile(type='start'))
         self.ui.set_static_finish.clicked.connect(lambda: self.select_tile(type='finish'))
+        self.ui.cancel_generate_button.clicked.connect(self.cancel_generation)
+        self.ui.show_solution_checkbox.toggled.connect(lambda checked: self.display.update())
 
         # These function overrides are for the static start/finish selecting part.
         # First step: enable mouse tracking, meaning an event is sent for
@@ -92,6 +174,14 @@ class MazeGUI(QMainWindow):
 
         self.display.mouseMoveEvent = self._display_mouseMoveEvent
         self.display.mousePressEvent = self._display_mousePressEvent
+        # Dragging the display scrolls it, and the mouse wheel zooms in and out.
+        self.display.mouseReleaseEvent = self._display_mouseReleaseEvent
+        self.display.wheelEvent = self._display_wheelEvent
+
+        # Fill the algorithm dropdown with all the available generation algorithms.
+        # The algorithm's name is stored as the item data, and its title is shown.
+        for name, func in algorithms.items():
+            self.ui.algorithm_combobox.addItem(func.title, name)
 
     # Don't use paintEvent is function name - that automatically gets registered to the main widget!
     def _display_paintEvent(self, event):
@@ -107,50 +197,43 @@ class MazeGUI(QMainWindow):
         debug_print("paintEvent: making new painter")
         painter = QPainter(self.display)
 
-        draw_result = self.draw_maze(painter, self.display.width(), self.display.height())
-        if draw_result is False:
-            # draw_maze() returns False if something went wrong. We should display an error
-            # if this happens, usually because the maze size requested was too big to draw
-            # in our preview window.
+        # Mazes too big to fit in the window are shown through the camera, which
+        # scrolls around them instead of failing to draw.
+        self.draw_maze(painter, self.display.width(), self.display.height(), camera=self.camera)
 
-            # Note: only show this error box ONCE! (check if self.draw_failed is set)
-            # Otherwise, we will have a nasty recursive loop, since this function is
-            # called every single time an UI element updates.
-            debug_print("Hit paintEvent: draw_failed = %s" % self.draw_failed)
-            if not self.draw_failed:
-                QMessageBox.warning(self.ui, "Error",
-                                    "Could not draw maze with the given size, as there is"
-                                    "not enough space in the window! Try increasing the"
-                                    "window size, or using image export instead.")
-
-            self.draw_failed = True
+        if self.camera.scrolling:
+            # Show where we are on the maze, on top of everything else.
+            painter.resetTransform()
+            self.draw_minimap(painter, self.display.width())
 
     # Override the mouseMoveEvent function in our display object
     # to track the mouse positions.
     def _display_mouseMoveEvent(self, event):
-        if not self.select_type:
+        if self.drag_position is not None:
+            # Scroll the display along with the mouse. This stops following the player
+            # until the camera is zoomed out again.
+            position = event.pos()
+            self.camera.follow = False
+            self.camera.scroll_by(self.drag_position.x() - position.x(), self.drag_position.y() - position.y())
+            self.drag_position = position
+            self.display.update()
+            return
+
+        if not self.select_type or not self.generated:
             # No selection process is going on.
             return
 
         mouseposition = event.pos()
         debug_print(mouseposition)
 
-        # Get the X and Y coordinates of the mouse, relative to the widget.
-        xpos = mouseposition.x()
-        ypos = mouseposition.y()
-
-        # Find the X and Y positions of the mouse relative to the grid by
-        # diving these by the tile width and height.
-        xpos -= self.tile_width // 2
-        ypos -= self.tile_height // 2
-        xgridpos = int(xpos / self.tile_width)
-        ygridpos = int(ypos / self.tile_height)
+        # Find the X and Y positions of the mouse relative to the grid, taking
+        # the camera's zoom and scroll position into account.
+        xgridpos, ygridpos = self.camera.to_grid(mouseposition.x(), mouseposition.y())
         debug_print(xgridpos, ygridpos)
         debug_print("self.select_type is %s" % self.select_type)
 
-        for point in self.maze.all_items():
-            # Mark all points in the maze as not selected.
-            point.is_selected = False
+        # Mark all points in the maze as not selected.
+        self.maze.selected = None
 
         try:
             # Then, set the point that the mouse is hovering over
@@ -169,6 +252,9 @@ class MazeGUI(QMainWindow):
     def _display_mousePressEvent(self, event):
         if not (self.selected_point and self.select_type and self.generated):
             # No valid point was selected, or the selection overlay isn't enabled.
+            # Start dragging the display around instead, if it doesn't all fit.
+            if self.generated and self.camera.scrolling:
+                self.drag_position = event.pos()
             return
 
         if self.select_type == 'start':
@@ -205,6 +291,23 @@ class MazeGUI(QMainWindow):
 
         self.display.update()
 
+    def _display_mouseReleaseEvent(self, event):
+        self.drag_position = None
+
+    def _display_wheelEvent(self, event):
+        """Zooms the display in or out around the mouse."""
+        if not self.generated:
+            return
+        # angleDelta() is in eighths of a degree; most mouse wheels move 15 degrees a step.
+        steps = event.angleDelta().y() / 120
+        if not steps:
+            return
+        self.camera.zoom_by(1.25 ** steps, event.pos().x(), event.pos().y())
+        if self.camera.zoom is None:
+            # Zoomed all the way out: follow the player again.
+            self.camera.follow = True
+        self.display.update()
+
     def closeEvent(self, event):
         """Quits the program cleanly by killing all threads."""
         self.has_quit.set()
@@ -223,171 +326,471 @@ class MazeGUI(QMainWindow):
 
     def make_maze(self):
         """Generates a maze, overwriting any previously generated ones."""
+        # Stop any maze generation that is still running: its result is no longer wanted.
+        self.cancel_generation()
+
+        # Levels can also use a pregenerated maze saved in a .tamaze file.
+        if self.leveldata.get('maze_file') and self._load_maze_file(self.leveldata['maze_file']):
+            return
+
         # Get the maze width and height from either the level data,
         # or the two spinbox (number input) elements.
-        self.mazewidth = self.leveldata.get('width', self.ui.width_spinbox.value())
-        self.ui.width_spinbox.setValue(self.mazewidth)
-        self.mazeheight = self.leveldata.get('height', self.ui.height_spinbox.value())
-        self.ui.height_spinbox.setValue(self.mazeheight)
+        mazewidth = self.leveldata.get('width', self.ui.width_spinbox.value())
+        self.ui.width_spinbox.setValue(mazewidth)
+        mazeheight = self.leveldata.get('height', self.ui.height_spinbox.value())
+        self.ui.height_spinbox.setValue(mazeheight)
+        # Ditto for the maze generation algorithm.
+        self.algorithm = self.leveldata.get('algorithm', self.ui.algorithm_combobox.currentData())
+        self.ui.algorithm_combobox.setCurrentIndex(self.ui.algorithm_combobox.findData(self.algorithm))
 
         # Initialize the maze generator from the mazemaker.py module, and tell
         # it to get to work!
-        self.mg = MazeGenerator(self.mazewidth, self.mazeheight)
+        # Levels can also fix the seed used, which makes them generate the exact same maze
+        # every time.
+        seed = self.leveldata.get('seed')
+        if seed is None:
+            seed = self.next_seed
+        self.next_seed = None
+        mg = MazeGenerator(mazewidth, mazeheight, seed=seed, algorithm=self.algorithm,
+                           cache=self.maze_cache, parallel=use_parallel(mazewidth, mazeheight))
+
+        # "Difficulty" is determined by the length of the path between the start and finish
+        # points. Level presets can choose a minimum difficulty, so the game is more balanced
+        # against spawning the start and finish points too close.
+        # This is ignored if the value is zero. The maximum possible value is one less than the
+        # amount of tiles in the maze.
+        self.ui.min_difficulty_spinbox.setMaximum(mazewidth * mazeheight - 1)
+        self.min_difficulty = self.leveldata.get('min_difficulty', self.ui.min_difficulty_spinbox.value())
+        if self.min_difficulty and self.static_finish and self.static_start:
+            QMessageBox.warning(self.ui, "Incompatible options selected", "Minimum difficulty cannot be tweaked when both static start and finish points are set. This setting will be ignored.")
 
         # Generate the maze! Static start and static finish are empty (nil) values
         # if not set, and will be ignored if so.
         debug_print("Calling make_maze() with start_point=%s, end_point=%s" % (self.static_start, self.static_finish))
-        debug_print("Calling make_maze() with start_point=%s, end_point=%s" % (self.static_start, self.static_finish))
+        generate_args = {'start_point': self.static_start, 'end_point': self.static_finish,
+                         'min_difficulty': self.min_difficulty}
 
-        self.maze = self.mg.generate(start_point=self.static_start, end_point=self.static_finish)
-        # "Difficulty" is determined by the distance between the start and finish points.
-        # Level presets can choose a minimum difficulty, so the game is more balanced against
-        # spawning the start and finish points too close.
-        # This is ignored if the value is zero. The maximum allowed value is the smaller of the maze's width and height.
-        self.ui.min_difficulty_spinbox.setMaximum(min(self.mazewidth, self.mazeheight))
-        self.min_difficulty = self.leveldata.get('min_difficulty', self.ui.min_difficulty_spinbox.value())
-        if self.min_difficulty:
-            if self.static_finish or self.static_start:
-                QMessageBox.warning(self.ui, "Incompatible options selected", "Minimum difficulty cannot be tweaked in conjunction with static start/finish points. This setting will be ignored.")
-            elif self.mg.distance(self.mg.start, self.mg.finish) < self.min_difficulty:
-                # Not difficult enough; regenerate the maze.
-                self.make_maze()
+        if mazewidth * mazeheight < background_generation_threshold:
+            # Small mazes are quick enough to generate right here.
+            mg.generate(**generate_args)
+            self._maze_generated(mg)
+            return
+
+        # Bigger mazes are generated in a separate thread, so that the window stays
+        # responsive. Progress is shown in a progress bar, which also has a cancel button.
+        thread = MazeGenerationThread(mg, generate_args)
+        thread.progress.connect(self._show_generation_progress)
+        thread.generated.connect(lambda mg, thread=thread: self._generation_thread_done(thread, mg))
+        thread.finished.connect(lambda thread=thread: self._generation_thread_finished(thread))
+
+        self.generation_thread = thread
+        self.generation_threads.add(thread)
+        self.ui.generate_progress.setValue(0)
+        self.ui.generate_progress.show()
+        self.ui.cancel_generate_button.show()
+        thread.start()
+
+    def _load_maze_file(self, filename):
+        """
+        Loads and shows a maze from a .tamaze file. Returns True on success; otherwise,
+        an error is shown and False is returned.
+        """
+        try:
+            mg = MazeGenerator.from_file(filename)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self.ui, "Error", "Failed to load maze file %s: %s" % (filename, e))
+            return False
+
+        # Show the loaded maze's settings in the UI.
+        self.ui.width_spinbox.setValue(mg.width)
+        self.ui.height_spinbox.setValue(mg.height)
+        self.algorithm = mg.algorithm
+        self.ui.algorithm_combobox.setCurrentIndex(self.ui.algorithm_combobox.findData(self.algorithm))
+        self.min_difficulty = self.ui.min_difficulty_spinbox.value()
+        self.next_seed = None
+
+        self._maze_generated(mg)
+        return True
+
+    def _maze_generated(self, mg):
+        """
+        Called once a new maze has been generated, to show it. Subclasses can extend
+        this to do things with the new maze.
+        """
+        self.mg = mg
+        self.maze = mg.grid
+        self.mazewidth = mg.width
+        self.mazeheight = mg.height
+        debug_print("Maze seed: %s, cache: %s" % (self.mg.seed, self.maze_cache))
 
+        self.generation_thread = None
         self.generated = True
+        # The cached maze picture, walls and visible points belong to the last maze.
+        self.maze_layer = None
+        self.wall_lines = None
+        self.visibility_cache.clear()
 
         # Poke the display to update itself
         self.display.update()
 
-    def draw_maze(self, painter, width, height):
+    def _generation_thread_done(self, thread, mg):
+        """Handles a maze generated in the background."""
+        # Only use the result if the thread wasn't replaced or cancelled in the meantime.
+        if thread is self.generation_thread:
+            self._maze_generated(mg)
+
+    def _show_generation_progress(self, carved, total):
+        """Updates the generation progress bar."""
+        self.ui.generate_progress.setMaximum(total)
+        self.ui.generate_progress.setValue(carved)
+
+    def _generation_thread_finished(self, thread):
+        """Cleans up after a maze generation thread stops."""
+        # Keep references to threads until they're finished, since destroying a running
+        # QThread crashes the program.
+        self.generation_threads.discard(thread)
+        thread.deleteLater()
+        if self.generation_thread is None or self.generation_thread is thread:
+            self.ui.generate_progress.hide()
+            self.ui.cancel_generate_button.hide()
+
+    @property
+    def generating(self):
+        """Returns whether a maze is currently being generated in the background."""
+        return self.generation_thread is not None
+
+    def cancel_generation(self):
+        """Cancels the maze currently being generated in the background, if there is one."""
+        if self.generation_thread is not None:
+            debug_print("Cancelling maze generation")
+            self.generation_thread.requestInterruption()
+            self.generation_thread = None
+            self.ui.generate_progress.hide()
+            self.ui.cancel_generate_button.hide()
+
+    def draw_maze(self, painter, width, height, use_cache=True, camera=None):
         """
         Draws a graphical representation of the currently stored maze, using
         the painter object, picture height, and picture width given.
         This returns True if successful, or False if an error occurred.
+
+        The walls and tile colours never change while a maze is shown, so they are
+        drawn once into a cached pixmap (unless use_cache is False), and only the
+        overlays (darkness, selection, solution) are drawn on top of it each time.
+
+        If a camera (see lib.camera) is given, only the part of the maze it looks at
+        is drawn, and the painter is left translated to the camera's position so that
+        subclasses can keep drawing in maze coordinates. Otherwise, the whole maze is
+        fit into the picture.
         """
         if not painter.isActive():
             return
-        painter.setRenderHint(QPainter.Antialiasing)
-        # Automatically find the best tile size for each piece of our maze by
-        # finding the size of the display, and dividing that by the size of our
-        # maze plus 1. There needs to be one grid tile more than the maze size,
-        # in order to fit the boundaries of the maze in.
-        self.tile_width = round_down_to_even(width / (self.mazewidth + 1))
-        self.tile_height = round_down_to_even(height / (self.mazeheight + 1))
-
-        if self.tile_width <= 0 or self.tile_height <= 0:
-            # Bail if the screen is too small to draw the tiles (size <= 0)
+        if width <= 0 or height <= 0:
+            # Bail if there is nowhere to draw.
             return False
+        painter.setRenderHint(QPainter.Antialiasing)
 
-        # Make the previews square.
-        self.tile_height = self.tile_width = min(self.tile_width, self.tile_height)
-
-        xpos = self.tile_width
-        ypos = self.tile_height
-
-        # Iterate over every point in the maze.
-        for row in self.maze.by_rows():
-            for point in row:
-                # The lines around each grid point in the maze is drawn relative to the
-                # centre of that point. The distances between the lines and the centre of
-                # the point we're on (xoffset and yoffset) are equal to half the tile width
-                # or height.
-                paths = point.paths
-                xoffset = self.tile_width / 2
-                yoffset = self.tile_height / 2
-
-                def fill_tile():
-                    # Fills in the tile with the specified colour.
-                    painter.drawRect(xpos-xoffset, ypos-yoffset, self.tile_width, self.tile_height)
-
-                painter.setPen(Qt.NoPen)
-                if point.is_finish:
-                    # Finish point is light blue.
-                    #debug_print("Colouring point %s blue" % point)
-                    painter.setBrush(QColor(self.FINISH_COLOR))
-                elif point.is_start:
-                    # Start point colour is light green.
-                    painter.setBrush(QColor(self.START_COLOR))
-                    #debug_print("Colouring point %s green" % point)
-                else:
-                    # Normal tile with no visible fill.
-                    painter.setBrush(Qt.white)
-
-                fill_tile()
-
-                # Darkness mode is enabled. Every tile 1 or more away
-                # from the player is covered in black at a certain opacity:
-                # This will only work if there is a player in the game.
-                if self.use_darkness and self.player:
-                    # Fetch the flashlight radius, which defaults to half of
-                    # the either the maze height or width, whichever is smaller.
-                    flashlight_radius = self.leveldata.get('flashlight_radius') or \
-                        min(self.mazewidth, self.mazeheight)//2+1
-                    player_point = self.maze.get(self.player.x, self.player.y)
-                    point_distance = self.mg.distance(player_point, point)
-
-                    fill_color = QColor(0)  # Darkened tiles are black
-                    # Derive the amount that the darkness should change with
-                    # each point from the player by dividing 255 (the max.
-                    # opacity value) by the flashlight radius.
-                    # Then, multiply this amount by the point distance and
-                    # to find the final opacity value.
-                    flashlight_step = 255 // flashlight_radius
-                    darkness_opacity = min(250, point_distance*flashlight_step)
-
-                    #print('distance: %s, darkness_opacity: %s, f step: %s' % (point_distance, darkness_opacity, flashlight_step))
-                    fill_color.setAlpha(darkness_opacity)
-
-                    painter.setBrush(fill_color)
-                    fill_tile()
-
-                if point.is_selected:
-                    # If the point is being selected (when choosing static start/finish tiles), fill
-                    # it with dark red. Note: only do this after drawing darkness.
-                    fill_color = QColor(self.SELECTED_COLOR)
-                    # Make this slightly transparent so finishes and other special points are visible.
-                    fill_color.setAlpha(200)
-                    painter.setBrush(fill_color)
-                    fill_tile()
-
-                # Pen class is used to draw outlines
-                pen = QPen()
-
-                # Set the pen size to an EVEN value, to prevent off-by-one drawing
-                pensize = round_down_to_even(min(self.tile_width, self.tile_height) // 24)
-                # Minimum pen size is 2
-                pen.setWidth(max(2, pensize))
-
-                # Set whether pen scales with the painter object
-                pen.setCosmetic(True)
-
-                pen.setColor(Qt.black)
-                painter.setPen(pen)
-
-                # Draw the walls around each tile in order to form the actual maze. This is
-                # done using lines relative to the center of each tile (the xpos and ypos),
-                # where the x and y offsets are half the tile width and height, respectively.
-                # FIXME: there are some off by ones in drawing southeast corners that I'm not
-                # quite sure how to fix...
-                if 'north' not in paths:
-                    painter.drawLine(xpos-xoffset, ypos-yoffset, xpos+xoffset-pensize//2, ypos-yoffset)
-                if 'south' not in paths:
-                    painter.drawLine(xpos-xoffset, ypos+yoffset, xpos+xoffset, ypos+yoffset)
-                if 'east' not in paths:
-                    painter.drawLine(xpos+xoffset, ypos-yoffset, xpos+xoffset, ypos+yoffset)
-                if 'west' not in paths:
-                    painter.drawLine(xpos-xoffset, ypos-yoffset, xpos-xoffset, ypos+yoffset)
-
-                # After each point is drawn, add the tile width to the x position
-                # to move on to the next point.
-                xpos += self.tile_width
-
-            # At the end of each row, reset the x position to the beginning, and add the
-            # tile height to the y position.
-            xpos = self.tile_width
-            ypos += self.tile_height
+        if camera is not None:
+            # The camera fits the maze in the display if it can, and scrolls around
+            # it otherwise (or when zoomed in).
+            self.tile_width = self.tile_height = camera.update(width, height, self.mazewidth, self.mazeheight)
+            player = getattr(self, 'player', None)
+            if camera.follow and player:
+                camera.center_on(player.x, player.y)
+            area = camera.visible_area()
+            offset = (camera.x, camera.y)
+        else:
+            # Automatically find the best tile size for each piece of our maze by
+            # finding the size of the display, and dividing that by the size of our
+            # maze plus 1. There needs to be one grid tile more than the maze size,
+            # in order to fit the boundaries of the maze in.
+            self.tile_width = round_down_to_even(width / (self.mazewidth + 1))
+            self.tile_height = round_down_to_even(height / (self.mazeheight + 1))
+
+            if self.tile_width <= 0 or self.tile_height <= 0:
+                # Bail if the picture is too small to draw the tiles (size <= 0)
+                return False
+
+            # Make the previews square.
+            self.tile_height = self.tile_width = min(self.tile_width, self.tile_height)
+            area = (0, 0, self.mazewidth, self.mazeheight)
+            offset = (0, 0)
+
+        # From here on, draw in maze coordinates.
+        painter.translate(-offset[0], -offset[1])
+        if use_cache:
+            layer, position = self._get_maze_layer(width, height, area)
+            painter.drawPixmap(QPointF(*position), layer)
+        else:
+            self.draw_static_maze(painter, area)
+
+        # Each tile is drawn relative to its centre, which is one tile further than
+        # its top left corner because of the border around the maze.
+        xoffset = self.tile_width / 2
+        yoffset = self.tile_height / 2
+        painter.setPen(Qt.NoPen)
+
+        # Darkness mode is enabled. Every tile 1 or more away
+        # from the player is covered in black at a certain opacity:
+        # This will only work if there is a player in the game.
+        if self.use_darkness and self.player:
+            # The darkness covers the part of the maze in view as one image, with one
+            # pixel per point, stretched over the tiles.
+            darkness_image = self._get_darkness_image(area)
+            if darkness_image is not None:
+                left, top, right, bottom = area
+                painter.drawImage(QRectF(left * self.tile_width + xoffset, top * self.tile_height + yoffset,
+                                         (right - left) * self.tile_width, (bottom - top) * self.tile_height),
+                                  darkness_image)
+
+        if self.maze.selected:
+            # If a point is being selected (when choosing static start/finish tiles), fill
+            # it with dark red. Note: only do this after drawing darkness.
+            x, y = self.maze.selected
+            fill_color = QColor(self.SELECTED_COLOR)
+            # Make this slightly transparent so finishes and other special points are visible.
+            fill_color.setAlpha(200)
+            painter.setBrush(fill_color)
+            painter.drawRect(QRectF((x+1) * self.tile_width - xoffset, (y+1) * self.tile_height - yoffset,
+                                    self.tile_width, self.tile_height))
+
+        if self.ui.show_solution_checkbox.isChecked():
+            self.draw_solution(painter, area)
 
         return True
 
+    def _get_maze_layer(self, width, height, area):
+        """
+        Returns a pixmap of the static parts of the maze (tile colours and walls)
+        around the area of the maze in view, for the given picture size, and the
+        position (in maze pixels) to draw it at.
+
+        The pixmap covers a block of points twice as wide and high as the picture,
+        lined up on multiples of the picture size, so scrolling around (e.g. while
+        following the player) only draws it again when the view moves into another
+        block. It is also drawn again when the maze, the tile size, or the start and
+        finish points change.
+        """
+        # Amount of points that (partly) fit in the picture in each direction.
+        columns = width // self.tile_width + 2
+        rows = height // self.tile_height + 2
+        left, top = area[0] // columns * columns, area[1] // rows * rows
+        block = (left, top, min(self.mazewidth, left + 2 * columns), min(self.mazeheight, top + 2 * rows))
+        # The pixmap starts at the top left corner of the tile before the block's first
+        # point, so that it includes the border the tiles are drawn from.
+        position = (left * self.tile_width, top * self.tile_height)
+
+        key = (self.maze, self.tile_width, self.tile_height, block, self.maze.start, self.maze.finish)
+        if self.maze_layer_key != key or self.maze_layer is None:
+            debug_print("Drawing static maze layer for block %s" % (block,))
+            pixmap = QPixmap((block[2] - left + 1) * self.tile_width, (block[3] - top + 1) * self.tile_height)
+            pixmap.fill(Qt.transparent)
+
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.translate(-position[0], -position[1])
+            self.draw_static_maze(painter, block)
+            painter.end()
+
+            self.maze_layer = pixmap
+            self.maze_layer_key = key
+        return self.maze_layer, position
+
+    def draw_static_maze(self, painter, area=None):
+        """
+        Draws the parts of the maze that don't change while it's shown: tile colours
+        and walls, using the current tile size. If an area (left, top, right, bottom)
+        is given, only the points in it are drawn.
+        """
+        full = (0, 0, self.mazewidth, self.mazeheight)
+        left, top, right, bottom = area = area or full
+
+        # Tiles are drawn relative to their centre, which is one tile further than
+        # their top left corner because of the border around the maze. So the maze
+        # itself starts half a tile from the edge.
+        xoffset = self.tile_width / 2
+        yoffset = self.tile_height / 2
+
+        if self.tile_width < lod_tile_size:
+            # Tiles are so small that drawing each wall is pointless: draw the maze as
+            # one picture with a pixel per point and wall instead, stretched so that
+            # the point pixels land on the tiles and the wall pixels between them.
+            maze_bitmap = bitmap.maze_bitmap(self.maze, area)
+            painter.drawImage(QRectF(left * self.tile_width + xoffset - self.tile_width / 4,
+                                     top * self.tile_height + yoffset - self.tile_height / 4,
+                                     maze_bitmap.width * self.tile_width / 2,
+                                     maze_bitmap.height * self.tile_height / 2),
+                              self._bitmap_image(maze_bitmap))
+            return
+
+        # Normal tiles have no visible fill, so fill the whole maze in white at once,
+        # then colour in the start (light green) and finish (light blue) points.
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(Qt.white)
+        painter.drawRect(QRectF(left * self.tile_width + xoffset, top * self.tile_height + yoffset,
+                                (right - left) * self.tile_width, (bottom - top) * self.tile_height))
+        for point, color in ((self.maze.start, self.START_COLOR), (self.maze.finish, self.FINISH_COLOR)):
+            if point:
+                painter.setBrush(QColor(color))
+                painter.drawRect(QRectF(point[0] * self.tile_width + xoffset, point[1] * self.tile_height + yoffset,
+                                        self.tile_width, self.tile_height))
+
+        # Pen class is used to draw outlines
+        pen = QPen(Qt.black)
+        # Set the pen size to an EVEN value, to prevent off-by-one drawing.
+        # Minimum pen size is 2
+        pen.setWidth(max(2, round_down_to_even(min(self.tile_width, self.tile_height) // 24)))
+        # Cosmetic pens keep their width no matter how the painter is scaled.
+        pen.setCosmetic(True)
+
+        if area == full:
+            lines = self._get_wall_lines()
+        else:
+            # Only part of the maze is in view: just get the walls in that part.
+            lines = [QLineF(*segment) for segment in self.maze.wall_segments(*area)]
+
+        # The walls are kept as line segments in grid corner coordinates (see
+        # MazeGrid.wall_segments()), so scale the painter to turn those into pixels.
+        # This way, all the walls are drawn in a single call.
+        painter.save()
+        painter.translate(xoffset, yoffset)
+        painter.scale(self.tile_width, self.tile_height)
+        painter.setPen(pen)
+        painter.drawLines(lines)
+        painter.restore()
+
+    def _bitmap_image(self, maze_bitmap):
+        """
+        Wraps a maze bitmap (see lib.bitmap) in a QImage, without copying it. The
+        bitmap must be kept around for as long as the image is used.
+        """
+        image = QImage(maze_bitmap.pixels, maze_bitmap.width, maze_bitmap.height,
+                       maze_bitmap.stride, QImage.Format_Indexed8)
+        # Pixel values are indices into this colour table.
+        image.setColorTable([QColor(Qt.black).rgb(), QColor(Qt.white).rgb(),
+                             QColor(self.START_COLOR).rgb(), QColor(self.FINISH_COLOR).rgb()])
+        return image
+
+    def draw_minimap(self, painter, width):
+        """
+        Draws an overview of the whole maze in the top right corner of the display,
+        with the part of it that is in view marked.
+        """
+        key = (self.maze, self.maze.start, self.maze.finish)
+        if self.minimap_key != key:
+            # Big mazes have far more points than the minimap has pixels, so only
+            # every few points are drawn.
+            step = max(1, -(-2 * max(self.mazewidth, self.mazeheight) // self.MINIMAP_SIZE))
+            self.minimap_bitmap = bitmap.maze_bitmap(self.maze, step=step)
+            self.minimap_image = self._bitmap_image(self.minimap_bitmap)
+            self.minimap_key = key
+
+        scale = self.MINIMAP_SIZE / max(self.minimap_bitmap.width, self.minimap_bitmap.height)
+        margin = 8
+        rect = QRectF(width - margin - self.minimap_bitmap.width * scale, margin,
+                      self.minimap_bitmap.width * scale, self.minimap_bitmap.height * scale)
+        painter.setOpacity(0.85)
+        painter.drawImage(rect, self.minimap_image)
+        painter.setOpacity(1)
+
+        # Mark the part of the maze in view.
+        left, top, right, bottom = self.camera.visible_area()
+        xscale = rect.width() / self.mazewidth
+        yscale = rect.height() / self.mazeheight
+        painter.setPen(QPen(QColor(self.VIEWPORT_COLOR), 2))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(QRectF(rect.x() + left * xscale, rect.y() + top * yscale,
+                                (right - left) * xscale, (bottom - top) * yscale))
+
+    def _get_darkness_image(self, area):
+        """
+        Returns the darkness overlay for the given area (left, top, right, bottom) of
+        the maze as a QImage with one black pixel per point, its opacity growing with
+        the distance from the player, or None if the flashlight lights up everything.
+        This is only computed again when the player moves (or the view, the maze or
+        darkness settings change).
+
+        In 'sight' darkness mode, only the points the player can see are lit. These
+        are remembered for recently visited points, so moving back and forth costs
+        nothing.
+        """
+        # Fetch the flashlight radius, which defaults to half of
+        # the either the maze height or width, whichever is smaller.
+        flashlight_radius = self.leveldata.get('flashlight_radius') or \
+            darkness.default_radius(self.mazewidth, self.mazeheight)
+        if not darkness.light_step(flashlight_radius):
+            return None
+
+        key = (self.maze, self.player.x, self.player.y, flashlight_radius, self.darkness_mode, area)
+        if self.darkness_key != key:
+            if self.darkness_mode == 'sight':
+                lit = self.visibility_cache.get(self.maze, self.player.x, self.player.y, flashlight_radius)
+            else:
+                # Light only travels along the maze's paths, not through walls.
+                lit = darkness.lit_points(self.maze, self.player.x, self.player.y, flashlight_radius)
+            alpha = darkness.area_alpha(self.maze, lit, flashlight_radius, area)
+
+            # QImage doesn't copy the pixels it's given, so keep a reference to them.
+            left, top, right, bottom = area
+            self.darkness_pixels = bytes(darkness.alpha_to_rgba(alpha))
+            self.darkness_image = QImage(self.darkness_pixels, right - left, bottom - top,
+                                         4 * (right - left), QImage.Format_RGBA8888)
+            self.darkness_key = key
+        return self.darkness_image
+
+    def _get_wall_lines(self):
+        """Returns the walls of the current maze as a list of QLineF, in grid units."""
+        if self.wall_lines is None:
+            self.wall_lines = [QLineF(*segment) for segment in self.maze.wall_segments()]
+            debug_print("Merged walls of %s into %s lines" % (self.maze, len(self.wall_lines)))
+        return self.wall_lines
+
+    def draw_solution(self, painter, area=None):
+        """
+        Draws the path from the start to the finish as a line through the tiles. If
+        an area (left, top, right, bottom) is given, only the parts of the path in it
+        are drawn.
+        """
+        path = self.mg.solve()
+        if not path:
+            return
+
+        area = area or (0, 0, self.mazewidth, self.mazeheight)
+        # Solutions are cached, so this is the same list as long as the maze and its
+        # start and finish stay the same, which makes comparing it cheap.
+        key = (path, self.tile_width, self.tile_height, area)
+        if self.solution_key != key:
+            # Split the path into the stretches that are in the area, each with one point
+            # before and after it so that the lines leaving the area are drawn too. The
+            # centre of each tile is one tile size further than its top left corner,
+            # because of the border around the maze.
+            left, top, right, bottom = area
+            lines = []
+            start = None
+            for index, (x, y) in enumerate(path):
+                if left <= x < right and top <= y < bottom:
+                    if start is None:
+                        start = max(0, index - 1)
+                elif start is not None:
+                    lines.append(path[start:index+1])
+                    start = None
+            if start is not None:
+                lines.append(path[start:])
+            self.solution_lines = [QPolygonF([QPointF((x+1) * self.tile_width, (y+1) * self.tile_height)
+                                              for x, y in line]) for line in lines]
+            self.solution_key = key
+
+        color = QColor(self.SOLUTION_COLOR)
+        color.setAlpha(160)
+        pen = QPen(color)
+        pen.setWidth(max(2, self.tile_width // 4))
+        pen.setCapStyle(Qt.RoundCap)
+        pen.setJoinStyle(Qt.RoundJoin)
+        painter.setPen(pen)
+        painter.setBrush(Qt.NoBrush)
+        for line in self.solution_lines:
+            painter.drawPolyline(line)
+
     def select_tile(self, type):
         """
         Turns on tile-selection mode for the given type. Type can be one of 'start', 'finish', or
@@ -493,7 +896,8 @@ class MazeGUI(QMainWindow):
         # this time we're drawing on an image instance (QImage).
         painter = QPainter()
         painter.begin(image)
-        self.draw_maze(painter, width, height)
+        # Draw straight onto the image, instead of through the display's cached maze picture.
+        self.draw_maze(painter, width, height, use_cache=False)
         painter.end()
 
         if not image.save(filename):
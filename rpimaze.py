@@ -94,10 +94,9 @@ class RPiMaze(MazeGame):
                     # Empty tile
                     color = (0, 0, 0)
 
-                for sprite in self.sprites:
-                    if sprite.x == xpos and sprite.y == ypos:
-                        color = self.hexcolor_to_rgb(sprite.color)
-                        print("Setting color to %s for sprite %s at %s, %s" % (color, sprite, xpos, ypos))
+                for sprite in self.sprites.at(xpos, ypos):
+                    color = self.hexcolor_to_rgb(sprite.color)
+                    print("Setting color to %s for sprite %s at %s, %s" % (color, sprite, xpos, ypos))
 
                 if point.is_selected:
                     color = self.hexcolor_to_rgb(self.SELECTED_COLOR)
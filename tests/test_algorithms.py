@@ -0,0 +1,114 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+
+"""
+Tests for the vectorized (NumPy) maze generation algorithms, which are compared
+against the plain Python versions.
+"""
+
+import random
+import unittest
+from unittest import mock
+
+from lib import algorithms
+from lib.mazegrid import MazeGrid, NORTH, WEST, SOUTH, EAST
+
+SIZES = ((1, 6), (6, 1), (2, 2), (13, 7), (40, 31))
+
+class NumpyAlgorithmTest(unittest.TestCase):
+
+    def generate(self, name, width, height, use_numpy, block_size=algorithms.NUMPY_BLOCK_SIZE):
+        """Generates a maze with or without NumPy, returning the grid and progress reports."""
+        grid = MazeGrid(width, height)
+        reports = []
+        with mock.patch.object(algorithms, 'NUMPY_BLOCK_SIZE', block_size):
+            if use_numpy:
+                algorithms.algorithms[name](grid, random.Random(1), None, lambda *args: reports.append(args))
+            else:
+                with mock.patch.object(algorithms, 'numpy', None):
+                    algorithms.algorithms[name](grid, random.Random(1), None, lambda *args: reports.append(args))
+        return grid, reports
+
+    def check_binary_tree(self, grid):
+        """Every point except the top right one opens north or east, and nothing else."""
+        for y in range(grid.height):
+            for x in range(grid.width):
+                value = grid.cell(x, y)
+                own = value & (NORTH | EAST)
+                if (x, y) == (grid.width - 1, 0):
+                    self.assertEqual(own, 0)
+                else:
+                    self.assertIn(own, (NORTH, EAST))
+                # The top row is all one corridor, and so is the right column.
+                if y == 0 and x < grid.width - 1:
+                    self.assertEqual(own, EAST)
+                if x == grid.width - 1 and y > 0:
+                    self.assertEqual(own, NORTH)
+
+    def check_sidewinder(self, grid):
+        """The top row is a corridor, and every run in the other rows has one path north."""
+        for x in range(grid.width - 1):
+            self.assertTrue(grid.cell(x, 0) & EAST)
+        for y in range(1, grid.height):
+            north = 0
+            for x in range(grid.width):
+                value = grid.cell(x, y)
+                if value & NORTH:
+                    north += 1
+                if not value & EAST:
+                    # End of a run.
+                    self.assertEqual(north, 1)
+                    north = 0
+
+    def check(self, name, check, use_numpy):
+        for width, height in SIZES:
+            grid, reports = self.generate(name, width, height, use_numpy)
+            self.assertTrue(grid.is_perfect())
+            check(grid)
+
+    def test_binary_tree(self):
+        self.check('binary_tree', self.check_binary_tree, False)
+
+    @unittest.skipIf(algorithms.numpy is None, "NumPy isn't installed")
+    def test_binary_tree_numpy(self):
+        self.check('binary_tree', self.check_binary_tree, True)
+
+    def test_sidewinder(self):
+        self.check('sidewinder', self.check_sidewinder, False)
+
+    @unittest.skipIf(algorithms.numpy is None, "NumPy isn't installed")
+    def test_sidewinder_numpy(self):
+        self.check('sidewinder', self.check_sidewinder, True)
+
+    @unittest.skipIf(algorithms.numpy is None, "NumPy isn't installed")
+    def test_numpy_blocks(self):
+        # Carving in small blocks still gives perfect mazes of the same shape, and
+        # reports progress for every block.
+        for name, check in (('binary_tree', self.check_binary_tree), ('sidewinder', self.check_sidewinder)):
+            for width, height in SIZES:
+                grid, reports = self.generate(name, width, height, True, block_size=width * 3)
+                self.assertTrue(grid.is_perfect())
+                check(grid)
+                if height > 3:
+                    self.assertGreater(len(reports), 1)
+                for carved, total in reports:
+                    self.assertEqual(total, width * height)
+                    self.assertLess(carved, total)
+                self.assertEqual(reports, sorted(reports))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+
+"""
+Tests for maze bitmaps, comparing the vectorized (NumPy) version against the
+plain Python one.
+"""
+
+import random
+import unittest
+from unittest import mock
+
+from lib import bitmap
+from lib.mazemaker import MazeGenerator
+
+class MazeBitmapTest(unittest.TestCase):
+
+    def check(self, use_numpy):
+        rng = random.Random(3)
+        for seed, (width, height) in enumerate(((1, 2), (5, 5), (31, 17))):
+            mg = MazeGenerator(width, height, seed=seed)
+            grid = mg.generate()
+            for _ in range(20):
+                left, right = sorted(rng.sample(range(width + 1), 2))
+                top, bottom = sorted(rng.sample(range(height + 1), 2))
+                step = rng.randint(1, 3)
+                if use_numpy:
+                    result = bitmap.maze_bitmap(grid, (left, top, right, bottom), step)
+                    with mock.patch.object(bitmap, 'numpy', None):
+                        expected = bitmap.maze_bitmap(grid, (left, top, right, bottom), step)
+                    self.assertEqual(bytes(result.pixels), bytes(expected.pixels))
+                else:
+                    with mock.patch.object(bitmap, 'numpy', None):
+                        result = bitmap.maze_bitmap(grid, (left, top, right, bottom), step)
+                self.check_pixels(grid, result)
+
+    def check_pixels(self, grid, result):
+        """Checks every pixel against the maze's path bits."""
+        left, top, right, bottom = result.area
+        step = result.step
+        self.assertEqual(result.width, 2 * len(range(left, right, step)) + 1)
+        self.assertEqual(result.height, 2 * len(range(top, bottom, step)) + 1)
+        for row, y in enumerate(range(top, bottom, step)):
+            for column, x in enumerate(range(left, right, step)):
+                point = result[2 * column + 1, 2 * row + 1]
+                if (x, y) == tuple(grid.start):
+                    self.assertEqual(point, bitmap.START)
+                elif (x, y) == tuple(grid.finish):
+                    self.assertEqual(point, bitmap.FINISH)
+                else:
+                    self.assertEqual(point, bitmap.PATH)
+                self.assertEqual(result[2 * column + 2, 2 * row + 1], int(grid.has_path(x, y, 'east')))
+                self.assertEqual(result[2 * column + 1, 2 * row + 2], int(grid.has_path(x, y, 'south')))
+        # The border is all wall.
+        for x in range(result.width):
+            self.assertEqual(result[x, 0], bitmap.WALL)
+        for y in range(result.height):
+            self.assertEqual(result[0, y], bitmap.WALL)
+
+    def test_maze_bitmap(self):
+        self.check(False)
+
+    @unittest.skipIf(bitmap.numpy is None, "NumPy isn't installed")
+    def test_maze_bitmap_numpy(self):
+        self.check(True)
+
+if __name__ == '__main__':
+    unittest.main()
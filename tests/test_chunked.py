@@ -0,0 +1,66 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+
+"""
+Tests for chunked mazes, comparing areas of them against the same chunked maze
+copied into a single MazeGrid.
+"""
+
+import random
+import unittest
+
+from lib.chunked import ChunkedMaze, ChunkedMazeGenerator
+
+class ChunkedMazeTest(unittest.TestCase):
+
+    def test_area_grid(self):
+        for seed, (width, height) in enumerate(((1, 2), (20, 20), (45, 38))):
+            # Few resident chunks, so that copying an area has to evict some.
+            maze = ChunkedMaze(width, height, seed, chunk_size=8, max_chunks=4)
+            whole = maze.area_grid(0, 0, width, height)
+            self.assertTrue(whole.is_perfect())
+            self.assertLessEqual(maze.resident_chunks, 4)
+
+            rng = random.Random(seed)
+            for _ in range(20):
+                left, right = sorted(rng.sample(range(width + 1), 2))
+                top, bottom = sorted(rng.sample(range(height + 1), 2))
+                area = maze.area_grid(left, top, right, bottom)
+                for y in range(top, bottom):
+                    for x in range(left, right):
+                        self.assertEqual(area.cell(x - left, y - top), whole.cell(x, y))
+
+                # Walls of an area are the same as those of that area of the whole maze.
+                self.assertEqual(maze.wall_segments(left, top, right, bottom),
+                                 whole.wall_segments(left, top, right, bottom))
+
+    def test_generator(self):
+        mg = ChunkedMazeGenerator(1000000, 1000000, seed=12)
+        grid = mg.generate((500000, 500000), (500020, 500025))
+        self.assertEqual((mg.start.x, mg.start.y), (500000, 500000))
+        self.assertEqual(grid.finish, (500020, 500025))
+        self.assertIsNone(mg.steps_to_finish(mg.start.x, mg.start.y))
+        # Nothing is generated until something looks at the maze.
+        self.assertEqual(grid.chunks_generated, 0)
+
+        # Points outside the maze are replaced with its corners.
+        mg = ChunkedMazeGenerator(30, 20, seed=1)
+        mg.generate((30, 0), (-1, 5))
+        self.assertEqual((mg.start.x, mg.start.y, mg.finish.x, mg.finish.y), (0, 0, 29, 19))
+
+if __name__ == '__main__':
+    unittest.main()
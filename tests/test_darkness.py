@@ -0,0 +1,69 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+
+"""
+Tests for darkness masks, comparing the vectorized (NumPy) version against the
+plain Python one.
+"""
+
+import random
+import unittest
+from unittest import mock
+
+from lib import darkness
+from lib.mazemaker import MazeGenerator
+
+class AreaAlphaTest(unittest.TestCase):
+
+    def check(self, use_numpy):
+        rng = random.Random(5)
+        width, height = 40, 30
+        grid = MazeGenerator(width, height, seed=5).generate()
+        for radius in (1, 4, darkness.default_radius(width, height), 100):
+            step = darkness.light_step(radius)
+            for _ in range(10):
+                x, y = rng.randrange(width), rng.randrange(height)
+                left, right = sorted(rng.sample(range(width + 1), 2))
+                top, bottom = sorted(rng.sample(range(height + 1), 2))
+                area = (left, top, right, bottom)
+
+                distances = grid.distances(x, y)
+                for lit in (darkness.lit_points(grid, x, y, radius), darkness.visible_points(grid, x, y, radius)):
+                    with mock.patch.object(darkness, 'numpy', darkness.numpy if use_numpy else None):
+                        alpha = darkness.area_alpha(grid, lit, radius, area)
+                    lit = dict(lit)
+                    expected = bytes(min(darkness.MAX_DARKNESS, lit[index] * step) if index in lit
+                                     else darkness.MAX_DARKNESS
+                                     for index in (grid.index(x, y) for y in range(top, bottom)
+                                                   for x in range(left, right)))
+                    self.assertEqual(bytes(alpha), expected)
+
+                # Light along the paths reaches every point that isn't completely dark.
+                lit = dict(darkness.lit_points(grid, x, y, radius))
+                for index, distance in enumerate(distances):
+                    if distance * step < darkness.MAX_DARKNESS:
+                        self.assertEqual(lit.get(index), distance)
+
+    def test_area_alpha(self):
+        self.check(False)
+
+    @unittest.skipIf(darkness.numpy is None, "NumPy isn't installed")
+    def test_area_alpha_numpy(self):
+        self.check(True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+
+"""
+Tests for the entity store, comparing the vectorized (NumPy) enemy movement
+against the plain Python version.
+"""
+
+import random
+import unittest
+from unittest import mock
+
+from lib import entities
+from lib.entities import EntityStore, ENEMY, FUEL_PACK
+from lib.flowfield import FlowField
+from lib.mazemaker import MazeGenerator
+from lib.mazegrid import bit_offsets
+
+class EntityStepTest(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = MazeGenerator(30, 20, seed=4).generate()
+        rng = random.Random(4)
+        self.spawns = [(rng.choice((ENEMY, ENEMY, FUEL_PACK)), rng.randrange(30), rng.randrange(20))
+                       for _ in range(100)]
+
+    def make_store(self):
+        store = EntityStore(capacity=8, seed=1)
+        for kind, x, y in self.spawns:
+            store.add(kind, x, y)
+        # Leave a hole, which must be skipped.
+        store.remove(3)
+        return store
+
+    def run_steps(self, use_numpy, steps=25, flow_field=None):
+        """Steps all enemies, returning their positions after every step."""
+        with mock.patch.object(entities, 'numpy', entities.numpy if use_numpy else None):
+            store = self.make_store()
+            history = []
+            for _ in range(steps):
+                if flow_field is not None:
+                    flow_field.update(7, 9)
+                moved = store.step(self.grid, ENEMY, flow_field)
+                history.append((sorted(int(slot) for slot in moved),
+                                [(int(store.xs[slot]), int(store.ys[slot]), int(store.kinds[slot]))
+                                 for slot in range(store.count)]))
+            return history
+
+    def check_random_walk(self, history):
+        """Checks that every move follows an open path, and only enemies move."""
+        previous = [(x, y, kind) for kind, x, y in self.spawns]
+        previous[3] = (previous[3][0], previous[3][1], 0)
+        for moved, positions in history:
+            for slot, ((x1, y1, kind1), (x2, y2, kind2)) in enumerate(zip(previous, positions)):
+                self.assertEqual(kind1, kind2)
+                if slot in moved:
+                    self.assertEqual(kind1, ENEMY)
+                    step = (x2 - x1, y2 - y1)
+                    bit = next(bit for bit, offset in bit_offsets.items() if offset == step)
+                    self.assertTrue(self.grid.cell(x1, y1) & bit)
+                else:
+                    self.assertEqual((x1, y1), (x2, y2))
+            previous = positions
+
+    def test_random_walk(self):
+        self.check_random_walk(self.run_steps(False))
+
+    @unittest.skipIf(entities.numpy is None, "NumPy isn't installed")
+    def test_random_walk_numpy(self):
+        # The two versions use different random number generators, so only check
+        # that the moves are valid.
+        self.check_random_walk(self.run_steps(True))
+
+    @unittest.skipIf(entities.numpy is None, "NumPy isn't installed")
+    def test_flow_field_numpy(self):
+        # Following a flow field doesn't involve randomness, so both versions must
+        # move the same.
+        expected = self.run_steps(False, flow_field=FlowField(self.grid))
+        self.assertEqual(self.run_steps(True, flow_field=FlowField(self.grid)), expected)
+        self.check_random_walk(expected)
+
+if __name__ == '__main__':
+    unittest.main()
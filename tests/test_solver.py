@@ -0,0 +1,69 @@
+###
+# Copyright (c) 2016 James Lu <glolol@overdrivenetworks.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+###
+
+
+"""
+Tests for the maze solvers, including the vectorized (NumPy) dead-end filling,
+which is compared against the plain Python version.
+"""
+
+import random
+import unittest
+from unittest import mock
+
+from lib import solver
+from lib.mazemaker import MazeGenerator
+from lib.mazegrid import WEST, EAST
+
+def make_maze(width, height, seed, algorithm='depth_first'):
+    return MazeGenerator(width, height, seed=seed, algorithm=algorithm).generate()
+
+class DeadEndFillingTest(unittest.TestCase):
+
+    def check_against_bfs(self, use_numpy):
+        rng = random.Random(2)
+        for seed, (width, height) in enumerate(((2, 1), (1, 9), (10, 10), (37, 23), (80, 60))):
+            grid = make_maze(width, height, seed, rng.choice(('depth_first', 'kruskal', 'sidewinder')))
+            for _ in range(5):
+                start = (rng.randrange(width), rng.randrange(height))
+                finish = (rng.randrange(width), rng.randrange(height))
+                if use_numpy:
+                    path = solver.dead_end_filling(grid, start, finish)
+                else:
+                    with mock.patch.object(solver, 'numpy', None):
+                        path = solver.dead_end_filling(grid, start, finish)
+                self.assertEqual(path, solver.bfs(grid, start, finish))
+
+    def test_dead_end_filling(self):
+        self.check_against_bfs(False)
+
+    @unittest.skipIf(solver.numpy is None, "NumPy isn't installed")
+    def test_dead_end_filling_numpy(self):
+        self.check_against_bfs(True)
+
+    def test_loops(self):
+        # Mazes with loops aren't perfect, so dead-end filling falls back to BFS.
+        grid = make_maze(20, 20, 1)
+        rng = random.Random(1)
+        for _ in range(30):
+            index = grid.index(rng.randrange(19), rng.randrange(20))
+            grid.cells[index] |= EAST
+            grid.cells[index + 1] |= WEST
+        self.assertFalse(grid.is_perfect())
+        self.assertEqual(solver.dead_end_filling(grid, (0, 0), (19, 19)), solver.bfs(grid, (0, 0), (19, 19)))
+
+if __name__ == '__main__':
+    unittest.main()